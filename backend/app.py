@@ -6,17 +6,26 @@ import threading
 import time
 import logging # 导入 logging 模块
 import re
-from flask import Flask, request, jsonify, send_from_directory, redirect, url_for, session
+import base64
+import zlib
+from flask import Flask, request, jsonify, send_from_directory, redirect, url_for, session, Response
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from bili_downloader.bili_downloader.config.config_manager import load_config, save_config, ensure_folders_exist, get_download_path
 from bili_downloader.bili_downloader.core.network import create_headers, check_login_status
-from bili_downloader.bili_downloader.core.video import get_video_info, download_and_process_video
-from bili_downloader.bili_downloader.core.audio import extract_audio
-from bili_downloader.bili_downloader.core.subtitle import download_subtitle
+from bili_downloader.bili_downloader.core.video import get_video_info, download_and_process_video, download_audio_only
+from bili_downloader.bili_downloader.core.audio import produce_audio, get_audio_format
 # --- 从 task_manager 导入 task_queue --- 
 from bili_downloader.bili_downloader.core import task_manager
 from bili_downloader.bili_downloader.core.ai_summary import generate_summary
-from bili_downloader.bili_downloader.core.bif import generate_bif # <-- 导入 BIF 生成函数
+from bili_downloader.bili_downloader.core.bif import generate_bif, generate_bifs, generate_bif_from_videoshot, compare_bif_modes, resolve_bif_workers, get_bif_reader, \
+    BIF_SOURCE_AUTO, BIF_SOURCE_FFMPEG, BIF_SOURCE_VIDEOSHOT # <-- 导入 BIF 生成函数
+from bili_downloader.bili_downloader.core.postprocess import process_audio_and_bif
+from bili_downloader.bili_downloader.core.rate_limiter import get_rate_limiter_stats
+from bili_downloader.bili_downloader.core.bandwidth import get_bandwidth_stats
+from bili_downloader.bili_downloader.core.browser_pool import get_browser_pool_stats
+from bili_downloader.bili_downloader.core.danmaku import download_danmaku
+from bili_downloader.bili_downloader.core.subtitle_process import get_subtitle_process_pool, get_subtitle_process_stats
 import openai  # 添加OpenAI库
 from datetime import datetime
 import requests
@@ -132,6 +141,7 @@ def process_tasks():
                                 if download_options.get("video"): requested_resources.append("video")
                                 if download_options.get("audio"): requested_resources.append("audio")
                                 if download_options.get("subtitle"): requested_resources.append("subtitle")
+                                if download_options.get("danmaku"): requested_resources.append("danmaku")
                                 # --- 如果请求了AI总结，也加入检查列表 --- 
                                 if download_options.get("ai_summary"): requested_resources.append("ai_summary")
                                 
@@ -324,6 +334,7 @@ def api_download():
         'video': options.get('video', True),
         'audio': options.get('audio', True),
         'subtitle': options.get('subtitle', True),
+        'danmaku': options.get('danmaku', False),  # 弹幕转换为ASS字幕
         'ai_summary': options.get('ai_summary', False)  # 添加AI总结选项
     }
     
@@ -331,6 +342,10 @@ def api_download():
     if not any(download_options.values()):
         return jsonify({"success": False, "message": "请至少选择一项下载内容"}), 400
     
+    # 音频格式: m4a 为原始音频流直接封装，mp3 需要重新编码
+    if options.get('audio_format') and options['audio_format'] not in ('m4a', 'mp3'):
+        return jsonify({"success": False, "message": "音频格式只支持 m4a 或 mp3"}), 400
+    
     # 确保如果选择了AI总结，则必须选择字幕
     if download_options['ai_summary'] and not download_options['subtitle']:
         return jsonify({"success": False, "message": "如果启用AI总结，必须同时选择下载字幕"}), 400
@@ -339,6 +354,10 @@ def api_download():
     config = load_config()
     cookie = config.get('cookie', '')
     
+    # 记录实际使用的音频格式 (未指定时使用配置中的默认值)，前端据此确定音频文件名
+    if download_options['audio']:
+        download_options['audio_format'] = get_audio_format(config, options)
+    
     # Create task
     task_id = task_manager.create_task(bv_id, download_options, cookie)
     
@@ -378,6 +397,18 @@ def api_running_tasks():
         "tasks": running_tasks
     })
 
+@app.route('/api/metrics', methods=['GET'])
+@login_required
+def api_metrics():
+    """返回下载器内部的运行指标，便于调整限流等参数"""
+    return jsonify({
+        "success": True,
+        "rate_limits": get_rate_limiter_stats(),
+        "bandwidth": get_bandwidth_stats(),
+        "browser_pool": get_browser_pool_stats(),
+        "subtitle_process": get_subtitle_process_stats()
+    })
+
 @app.route('/api/downloads', methods=['GET'])
 @login_required
 def api_downloads():
@@ -388,6 +419,9 @@ def api_downloads():
         "videos": []  # 改为以视频为中心的结构
     }
     
+    # 多分辨率BIF按配置的名称保存为 {bv_id}-{NAME}.bif
+    bif_variant_names = {str(name).upper(): str(name).lower() for name in (config.get("bif", {}).get("variants") or {})}
+
     # 处理基于标题的新目录结构
     base_dir = config['download_dir'].get('base', 'config/download')
     if os.path.exists(base_dir):
@@ -433,7 +467,7 @@ def api_downloads():
                         
                         # 尝试从文件名提取 BV ID (只需要一次)
                         if not extracted_bv_id:
-                            match = re.search(r'(BV[a-zA-Z0-9]+)\.(mp4|mp3|srt)$', file)
+                            match = re.search(r'(BV[a-zA-Z0-9]+)\.(mp4|mp3|m4a|srt)$', file)
                             if match:
                                 extracted_bv_id = match.group(1)
                                 video_info["bv_id"] = extracted_bv_id # 更新 video_info
@@ -442,14 +476,21 @@ def api_downloads():
                         if file.endswith(".mp4"):
                             video_info["files"]["video"] = file_info
                             has_files = True
-                        elif file.endswith(".mp3"):
-                            video_info["files"]["audio"] = file_info
+                        elif file.endswith(".mp3") or file.endswith(".m4a"):
+                            # MP3是按需转换的结果，与M4A同时存在时优先展示MP3
+                            if file.endswith(".mp3") or not video_info["files"]["audio"]:
+                                video_info["files"]["audio"] = file_info
                             has_files = True
+                        elif file.endswith(".danmaku.ass"):
+                            video_info["files"]["danmaku"] = file_info
                         elif file.endswith(".srt"):
                             video_info["files"]["subtitle"] = file_info
                             has_files = True
                         elif file.endswith(".bif"):
-                            video_info["files"]["bif"] = file_info
+                            # 多分辨率BIF按最后一个 "-" 之后的后缀匹配配置的名称，如 {bv_id}-SD.bif -> bif_sd
+                            stem, _, suffix = file[:-4].rpartition("-")
+                            variant = bif_variant_names.get(suffix.upper()) if stem else None
+                            video_info["files"][f"bif_{variant}" if variant else "bif"] = file_info
                             # BIF 不是主要媒体文件，不设置 has_files = True
                         elif file == "poster.jpg":
                             video_info["files"]["poster"] = file_info
@@ -552,6 +593,78 @@ def download_file(media_type, filename):
     directory = config['download_dir'][media_type]
     return send_from_directory(directory, filename, as_attachment=True)
 
+# BIF缩略图按文件内容的签名生成ETag，文件重新生成后ETag随之变化
+BIF_FRAME_MAX_AGE = 365 * 24 * 3600
+BIF_BATCH_MAX_TIMESTAMPS = 2000
+
+def _open_bif_for_frames(filename):
+    """定位下载目录中的BIF文件并返回 (reader, 错误响应)"""
+    config = load_config()
+    base_dir = config['download_dir'].get('base', 'config/download')
+    bif_path = safe_join(base_dir, filename)
+    if not bif_path or not bif_path.endswith('.bif') or not os.path.isfile(bif_path):
+        return None, (jsonify({"success": False, "message": "BIF文件不存在"}), 404)
+    try:
+        return get_bif_reader(bif_path), None
+    except (OSError, ValueError) as e:
+        print(f"读取BIF文件失败 ({bif_path}): {e}")
+        return None, (jsonify({"success": False, "message": "无法读取BIF文件"}), 500)
+
+def _bif_cached_response(response, reader, etag_suffix):
+    """为缩略图响应添加长期缓存头和ETag，并处理条件请求"""
+    mtime_ns, size = reader.signature
+    response.set_etag(f"{mtime_ns:x}-{size:x}-{etag_suffix}")
+    response.cache_control.private = True
+    response.cache_control.max_age = BIF_FRAME_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route('/api/bif/frame/<path:filename>', methods=['GET'])
+@login_required
+def api_bif_frame(filename):
+    """返回BIF中在时间戳 t (毫秒) 显示的那一张缩略图"""
+    timestamp = request.args.get('t', type=int)
+    if timestamp is None:
+        return jsonify({"success": False, "message": "缺少时间戳参数 t (毫秒)"}), 400
+    reader, error_response = _open_bif_for_frames(filename)
+    if error_response:
+        return error_response
+    index = reader.find(timestamp)
+    image = reader.image(index)
+    # WSGI 响应体必须是 bytes，这里只复制一张缩略图
+    response = Response(bytes(image), mimetype='image/jpeg')
+    response.headers['X-Bif-Timestamp'] = str(reader.timestamp_ms(index))
+    return _bif_cached_response(response, reader, index)
+
+@app.route('/api/bif/frames/<path:filename>', methods=['GET'])
+@login_required
+def api_bif_frames(filename):
+    """批量查询缩略图：t=逗号分隔的毫秒时间戳，相同的图片只返回一次"""
+    raw_timestamps = request.args.get('t', '')
+    try:
+        timestamps = [int(value) for value in raw_timestamps.split(',') if value.strip()]
+    except ValueError:
+        return jsonify({"success": False, "message": "时间戳参数 t 必须是逗号分隔的整数"}), 400
+    if not timestamps:
+        return jsonify({"success": False, "message": "缺少时间戳参数 t (毫秒)"}), 400
+    if len(timestamps) > BIF_BATCH_MAX_TIMESTAMPS:
+        return jsonify({"success": False, "message": f"一次最多查询 {BIF_BATCH_MAX_TIMESTAMPS} 个时间戳"}), 400
+    reader, error_response = _open_bif_for_frames(filename)
+    if error_response:
+        return error_response
+
+    indexes = {}
+    frames = {}
+    for timestamp in timestamps:
+        index = reader.find(timestamp)
+        indexes[str(timestamp)] = index
+        if index not in frames:
+            frames[index] = {
+                "timestamp": reader.timestamp_ms(index),
+                "data": base64.b64encode(reader.image(index)).decode('ascii')
+            }
+    response = jsonify({"success": True, "timestamps": indexes, "frames": {str(k): v for k, v in frames.items()}})
+    return _bif_cached_response(response, reader, f"{zlib.crc32(raw_timestamps.encode()):x}")
+
 @app.route('/api/config', methods=['GET'])
 @login_required
 def get_config():
@@ -812,10 +925,13 @@ def download_media_with_status_update(task_id, video_info, config, download_opti
     print(f"[任务 {task_id}] 开始处理 {bv_id}，选项: {download_options}")
     resource_updates = {}
 
+    # 只要音频时只下载音频流，不下载视频
+    audio_only = download_options.get("audio") and not download_options.get("video")
+
     # 1. 下载视频和封面、NFO
     video_path = ""
     video_success = False
-    if download_options.get("video") or download_options.get("audio"): 
+    if download_options.get("video"): 
         resource_updates['video'] = "下载中"
         task_manager.update_task(task_id, {"resource_status": resource_updates})
         try:
@@ -825,22 +941,86 @@ def download_media_with_status_update(task_id, video_info, config, download_opti
                 video_success = True # 标记为成功以便后续处理（如BIF）
             else:
                 print(f"[任务 {task_id}] 开始下载视频...")
-                video_success, video_path = download_and_process_video(video_info, config, download_options, headers)
+                video_success, video_path = download_and_process_video(video_info, config, download_options, headers, task_id=task_id)
             resource_updates['video'] = "完成" if video_success else "失败"
         except Exception as e:
             print(f"下载视频出错 ({bv_id}): {e}")
             resource_updates['video'] = "失败"
         task_manager.update_task(task_id, {"resource_status": resource_updates})
 
+    # 按配置使用B站预渲染的视频快照雪碧图生成BIF，无需解码视频，但分辨率较低
+    bif_done = False # 快照或合并后处理已生成BIF时，跳过第5步
+    bif_config = config.get("bif", {})
+    bif_source = bif_config.get("source", BIF_SOURCE_FFMPEG)
+    # 需要多分辨率BIF时视频总要解码一次，直接由FFmpeg一并生成
+    bif_variants = bif_config.get("variants") or {}
+    use_videoshot = (bif_source == BIF_SOURCE_VIDEOSHOT and (audio_only or (video_success and not bif_variants))) \
+        or (bif_source == BIF_SOURCE_AUTO and audio_only)
+    if use_videoshot:
+        resource_updates['bif'] = "生成中"
+        task_manager.update_task(task_id, {"resource_status": resource_updates})
+        bif_path = get_download_path(config, video_info, "bif")
+        try:
+            shot_success, shot_error, shot_info = generate_bif_from_videoshot(
+                bv_id, video_info.get("cid"), bif_path, headers=headers, return_info=True)
+        except Exception as e:
+            shot_success, shot_error, shot_info = False, str(e), {"mode": "videoshot"}
+        if shot_success:
+            bif_done = True
+            resource_updates['bif'] = "完成"
+            task_manager.update_task(task_id, {"processing": {"bif": shot_info}})
+            print(f"[任务 {task_id}] 已从视频快照生成 BIF 文件: {bif_path}")
+        elif not video_success:
+            # 只下载音频时没有视频可供FFmpeg回退
+            bif_done = True
+            resource_updates['bif'] = f"失败 ({str(shot_error)[:50]})"
+        else:
+            print(f"[任务 {task_id}] 视频快照不可用 ({shot_error})，回退到FFmpeg生成BIF")
+        task_manager.update_task(task_id, {"resource_status": resource_updates})
+
     # 2. 提取音频
     audio_success = False
-    if download_options.get("audio"): 
+    audio_format = get_audio_format(config, download_options)
+    if audio_only:
+        resource_updates['audio'] = "下载中"
+        task_manager.update_task(task_id, {"resource_status": resource_updates})
+        try:
+            audio_success, audio_path = download_audio_only(video_info, config, download_options, headers, task_id=task_id)
+            print(f"[任务 {task_id}] 音频下载调用完成，audio_success={audio_success}")
+            resource_updates['audio'] = "完成" if audio_success else "失败"
+        except Exception as e:
+            print(f"下载音频出错 ({bv_id}): {e}")
+            resource_updates['audio'] = "失败"
+        task_manager.update_task(task_id, {"resource_status": resource_updates})
+    elif download_options.get("audio"): 
         if video_success:
             resource_updates['audio'] = "提取中"
             task_manager.update_task(task_id, {"resource_status": resource_updates})
             try:
-                audio_path = get_download_path(config, video_info, "audio")
-                audio_success = extract_audio(video_path, audio_path)
+                # DASH下载时已保存了原始音频流，直接使用它，无需再解析视频文件
+                audio_m4a_path = get_download_path(config, video_info, "audio_m4a")
+                if os.path.exists(audio_m4a_path):
+                    audio_success, audio_path = produce_audio(audio_m4a_path, video_info, config, audio_format, task_id=task_id)
+                elif (bif_done or bif_variants or bif_config.get("dedupe")
+                      or resolve_bif_workers(bif_config.get("workers", 1)) > 1):
+                    # BIF已生成，或需要多分辨率、去重、按时间切片并行生成时，单独提取音频
+                    audio_success, audio_path = produce_audio(video_path, video_info, config, audio_format, task_id=task_id)
+                else:
+                    # 音频只能从视频中提取时，与BIF缩略图共用一次FFmpeg解码
+                    resource_updates['bif'] = "生成中"
+                    task_manager.update_task(task_id, {"resource_status": resource_updates})
+                    audio_path = get_download_path(config, video_info, "audio" if audio_format == "mp3" else "audio_m4a")
+                    bif_path = get_download_path(config, video_info, "bif")
+                    results = process_audio_and_bif(video_path, audio_path, "mp3" if audio_format == "mp3" else "copy", bif_path,
+                                                    interval=bif_config.get("interval", 1), width=bif_config.get("width", 480),
+                                                    duration=video_info.get("duration"), bif_mode=bif_config.get("mode", "full"))
+                    audio_success = results["audio"]["success"]
+                    bif_done = True
+                    if results["bif"]["success"]:
+                        resource_updates['bif'] = "完成"
+                    else:
+                        resource_updates['bif'] = f"失败 ({str(results['bif']['error'])[:50]})"
+                    task_manager.update_task(task_id, {"processing": results})
                 print(f"[任务 {task_id}] 音频提取调用完成，audio_success={audio_success}")
                 resource_updates['audio'] = "完成" if audio_success else "失败"
             except Exception as e:
@@ -859,60 +1039,34 @@ def download_media_with_status_update(task_id, video_info, config, download_opti
         resource_updates['subtitle'] = "下载中"
         task_manager.update_task(task_id, {"resource_status": resource_updates})
         try:
-            subtitle_timeout = 180
             subtitle_result_holder = {"success": False, "error": "未开始"}
             max_retries = 3
             retry_delay = 5
+            subtitle_pool = get_subtitle_process_pool()
             
-            def subtitle_worker():
-                 for attempt in range(1, max_retries + 1):
-                     print(f"[任务 {task_id} - 字幕线程] 尝试第 {attempt}/{max_retries} 次...")
-                     attempt_success = False
-                     attempt_error = "尝试失败"
-                     try:
-                         print(f"[任务 {task_id} - 字幕线程] 调用 download_subtitle")
-                         attempt_success, attempt_error = download_subtitle(video_info, config, headers)
-                         print(f"[任务 {task_id} - 字幕线程] download_subtitle 返回: success={attempt_success}, error='{attempt_error}'")
-                         
-                         if attempt_success:
-                             subtitle_result_holder["success"] = True
-                             subtitle_result_holder["error"] = None
-                             print(f"[任务 {task_id} - 字幕线程] 第 {attempt} 次尝试成功")
-                             break
-                         else:
-                             subtitle_result_holder["success"] = False
-                             subtitle_result_holder["error"] = attempt_error or "下载失败"
-                             print(f"[任务 {task_id} - 字幕线程] 第 {attempt} 次尝试失败: {attempt_error}")
-                             
-                     except Exception as sub_e:
-                         print(f"[任务 {task_id} - 字幕线程] 第 {attempt} 次尝试时发生异常: {sub_e}")
-                         subtitle_result_holder["success"] = False
-                         subtitle_result_holder["error"] = f"线程异常: {str(sub_e)[:50]}"
-                     
-                     if not subtitle_result_holder["success"] and attempt < max_retries:
-                         print(f"[任务 {task_id} - 字幕线程] 等待 {retry_delay} 秒后重试...")
-                         time.sleep(retry_delay)
-                 print(f"[任务 {task_id} - 字幕线程] 重试结束，最终结果: success={subtitle_result_holder['success']}, error='{subtitle_result_holder['error']}'")
-
-            subtitle_thread = threading.Thread(target=subtitle_worker)
-            subtitle_thread.start()
-            total_timeout = subtitle_timeout * max_retries + retry_delay * (max_retries - 1) + 30
-            subtitle_thread.join(total_timeout)
+            # 每次尝试在受监管的子进程中执行，超过期限时连同浏览器一起被杀掉，不会遗留在后台
+            for attempt in range(1, max_retries + 1):
+                print(f"[任务 {task_id} - 字幕] 尝试第 {attempt}/{max_retries} 次...")
+                attempt_success, attempt_error = subtitle_pool.run(video_info, config, headers)
+                print(f"[任务 {task_id} - 字幕] 子进程返回: success={attempt_success}, error='{attempt_error}'")
+                subtitle_result_holder["success"] = attempt_success
+                subtitle_result_holder["error"] = None if attempt_success else (attempt_error or "下载失败")
+                if attempt_success:
+                    print(f"[任务 {task_id} - 字幕] 第 {attempt} 次尝试成功")
+                    break
+                if attempt < max_retries:
+                    print(f"[任务 {task_id} - 字幕] 等待 {retry_delay} 秒后重试...")
+                    time.sleep(retry_delay)
 
-            if subtitle_thread.is_alive():
-                print(f"[任务 {task_id}] 字幕下载整体超时 ({bv_id})，放弃下载")
-                resource_updates['subtitle'] = "失败 (总超时)"
-                subtitle_success = False # 明确失败
+            subtitle_success = subtitle_result_holder["success"]
+            final_error = subtitle_result_holder["error"]
+            if subtitle_success:
+                resource_updates['subtitle'] = "完成"
+                print(f"[任务 {task_id}] 字幕下载成功")  # 添加明确的成功日志
             else:
-                subtitle_success = subtitle_result_holder["success"]
-                final_error = subtitle_result_holder["error"]
-                if subtitle_success:
-                    resource_updates['subtitle'] = "完成"
-                    print(f"[任务 {task_id}] 字幕下载成功")  # 添加明确的成功日志
-                else:
-                    error_reason = final_error or "未知原因"
-                    print(f"[任务 {task_id}] 字幕下载最终失败: {error_reason}")
-                    resource_updates['subtitle'] = f"失败 ({error_reason[:30].strip()})"
+                error_reason = final_error or "未知原因"
+                print(f"[任务 {task_id}] 字幕下载最终失败: {error_reason}")
+                resource_updates['subtitle'] = f"失败 ({error_reason[:30].strip()})"
                 
         except Exception as e:
             print(f"[任务 {task_id}] 下载字幕主逻辑出错: {e}")
@@ -923,6 +1077,18 @@ def download_media_with_status_update(task_id, video_info, config, download_opti
     else:
         print(f"[任务 {task_id}] 未请求下载字幕，跳过")
 
+    # 3.5 下载弹幕
+    if download_options.get("danmaku"):
+        resource_updates['danmaku'] = "下载中"
+        task_manager.update_task(task_id, {"resource_status": resource_updates})
+        try:
+            danmaku_success, danmaku_error = download_danmaku(video_info, config, headers)
+            resource_updates['danmaku'] = "完成" if danmaku_success else f"失败 ({(danmaku_error or '未知原因')[:30].strip()})"
+        except Exception as e:
+            print(f"[任务 {task_id}] 下载弹幕出错: {e}")
+            resource_updates['danmaku'] = "失败"
+        task_manager.update_task(task_id, {"resource_status": resource_updates})
+
     # --- 4. 触发 AI 总结 (如果需要) --- 
     print(f"[任务 {task_id}] 字幕成功状态: {subtitle_success}, AI总结选项: {download_options.get('ai_summary')}")  # 添加调试信息
     
@@ -997,14 +1163,41 @@ def download_media_with_status_update(task_id, video_info, config, download_opti
         print(f"[任务 {task_id}] 未请求 AI 总结，跳过")
 
     # --- 5. 生成 BIF 文件 (如果视频下载成功) ---
-    if video_success:
+    if bif_done:
+        print(f"[任务 {task_id}] BIF 文件已在提取音频时一并生成，状态: {resource_updates.get('bif')}")
+    elif video_success:
         print(f"[任务 {task_id}] 视频处理成功，开始生成 BIF 文件...")
         resource_updates['bif'] = "生成中"
         task_manager.update_task(task_id, {"resource_status": resource_updates})
         try:
             bif_path = get_download_path(config, video_info, "bif")
             # 调用生成函数 (假设 video_path 在 video_success 为 True 时有效)
-            bif_success, bif_error = generate_bif(video_path, bif_path)
+            bif_config = config.get("bif", {})
+            dedupe_threshold = bif_config.get("dedupe_threshold", 3) if bif_config.get("dedupe") else None
+            if bif_variants:
+                # 主BIF与各分辨率BIF共用一次解码
+                targets = [(bif_config.get("width", 480), bif_path)]
+                targets += [(width, get_download_path(config, video_info, f"bif_{name}")) for name, width in bif_variants.items()]
+                bif_success, bif_error, bif_info = generate_bifs(
+                    video_path, targets,
+                    interval=bif_config.get("interval", 1),
+                    duration=video_info.get("duration"),
+                    mode=bif_config.get("mode", "full"),
+                    dedupe_threshold=dedupe_threshold,
+                    return_info=True
+                )
+            else:
+                bif_success, bif_error, bif_info = generate_bif(
+                    video_path, bif_path,
+                    interval=bif_config.get("interval", 1),
+                    width=bif_config.get("width", 480),
+                    duration=video_info.get("duration"),
+                    mode=bif_config.get("mode", "full"),
+                    workers=bif_config.get("workers", 1),
+                    dedupe_threshold=dedupe_threshold,
+                    return_info=True
+                )
+            task_manager.update_task(task_id, {"processing": {"bif": bif_info}})
             
             if bif_success:
                 resource_updates['bif'] = "完成"
@@ -1027,6 +1220,13 @@ def download_media_with_status_update(task_id, video_info, config, download_opti
         resource_updates['bif'] = "N/A (无视频)"
         task_manager.update_task(task_id, {"resource_status": resource_updates})
 
+    # 按需对比两种BIF模式的耗时，便于按媒体库选择模式
+    if video_success and config.get("bif", {}).get("compare_modes"):
+        bif_config = config.get("bif", {})
+        comparison = compare_bif_modes(video_path, bif_config.get("interval", 1), bif_config.get("width", 480),
+                                       duration=video_info.get("duration"))
+        task_manager.update_task(task_id, {"processing": {"bif_comparison": comparison}})
+
     # --- 资源处理结束 --- 
     final_resource_status = task_manager.get_task(task_id).get('resource_status', {})
     print(f"任务 {task_id} 资源处理完成，状态: {final_resource_status}")
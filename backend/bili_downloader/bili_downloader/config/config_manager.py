@@ -14,6 +14,74 @@ def load_config():
             "video": "backend/bilibili_video",
             "audio": "backend/bilibili_audio",
             "subtitle": "backend/bilibili_subtitle"
+        },
+        "downloader": {
+            "segments": 4,  # 单个文件的并发分段数，1表示单连接下载
+            "min_segment_size": 4 * 1024 * 1024  # 每个分段的最小字节数
+        },
+        "http": {
+            "pool_connections": 16,  # 缓存的主机连接池数量
+            "pool_maxsize": 32,  # 每个主机的最大keep-alive连接数
+            "connect_timeout": 10,  # 连接超时(秒)
+            "read_timeout": 30  # 读取超时(秒)
+        },
+        "rate_limit": {
+            "max_rate": 4.0,  # 每个接口族每秒最多请求数
+            "min_rate": 0.2,  # 被风控后速率下降的下限
+            "max_retries": 4,  # 被风控后的最大重试次数
+            "families": {}  # 按接口族(view/playurl/player/nav)单独覆盖参数
+        },
+        "bandwidth": {
+            "total_limit": 0,  # 所有任务合计的下载速率上限(KB/s)，0表示不限速
+            "per_task_limit": 0,  # 单个任务的下载速率上限(KB/s)，0表示不限速
+            "schedule": []  # 分时段限速，例如 [{"start": "01:00", "end": "07:00", "total_limit": 0}]
+        },
+        "cdn": {
+            "probe": True,  # 下载前对主地址和backup_url测速，选择最快的镜像
+            "cache_ttl": 600,  # 节点测速结果的缓存时间(秒)
+            "min_throughput": 128  # 下载速率低于该值(KB/s)时中途切换镜像，0表示只在断线时切换
+        },
+        "dash": {
+            "enabled": True,  # 使用DASH分离的视频流和音频流，关闭时使用fnval=1的单文件(最高1080P)
+            "quality_preference": [120, 116, 112, 80, 64, 32, 16],  # 按顺序选择第一个可用的清晰度(qn)
+            "codec_preference": ["avc", "hevc", "av1"],  # 同一清晰度下按顺序选择编码
+            "prefer_hires_audio": True,  # 仅下载音频时优先选择Hi-Res无损(FLAC)和杜比全景声音轨
+            "audio_format": "m4a"  # 音频的默认输出格式: m4a为原始音频流直接封装，mp3需要重新编码
+        },
+        "audio": {
+            "transcode_workers": 0  # 同时进行的MP3转码数，0表示按容器可用的CPU数
+        },
+        "browser_pool": {
+            "size": 2,  # 常驻的字幕抓取浏览器数量，同时也是同时打开页面数的上限
+            "idle_timeout": 300,  # 浏览器空闲超过该时长(秒)后关闭
+            "headless": True,
+            "batch_concurrency": 4,  # 批量抓取字幕时同时打开的页面数，受CPU限制
+            "block_resources": True,  # 拦截图片、音视频分段、字体、统计和评论等与字幕无关的请求，并关闭自动播放
+            "job_timeout": 170  # 单个浏览器任务的期限(秒)，超时的工作线程被退役
+        },
+        "subtitle_process": {
+            "size": 2,  # 同时运行的字幕子进程数
+            "job_timeout": 180,  # 单次字幕抓取的期限(秒)，超时后杀掉子进程及其启动的浏览器
+            "max_jobs_per_worker": 20  # 每个子进程处理多少个任务后回收
+        },
+        "danmaku": {
+            "segment_workers": 4,  # 并行下载的弹幕分段数(每段6分钟)
+            "font_name": "Microsoft YaHei",  # ASS弹幕字体
+            "font_size": 50,  # 1080P 下标准字号弹幕的字号
+            "opacity": 0.8,  # 弹幕不透明度
+            "scroll_duration": 8,  # 滚动弹幕经过屏幕的时长(秒)
+            "fixed_duration": 4  # 顶部、底部弹幕的停留时长(秒)
+        },
+        "bif": {
+            "source": "ffmpeg",  # ffmpeg 解码视频生成；auto 只在仅下载音频(没有视频可解码)时使用B站预渲染的雪碧图(videoshot)；videoshot 在仅音频或未配置多分辨率(variants)时优先使用雪碧图，有视频时失败再回退FFmpeg
+            "mode": "full",  # full 解码全部帧；keyframe 只解码关键帧并使用真实PTS作为时间戳，速度快得多
+            "interval": 1,  # 缩略图间隔(秒)
+            "width": 480,  # 缩略图宽度
+            "variants": {},  # 同一次解码额外生成的BIF，如 {"sd": 240, "hd": 320}，保存为 {bv_id}-SD.bif / {bv_id}-HD.bif
+            "dedupe": False,  # 连续的近似重复缩略图只保存一张，索引重复指向它（适合讲座、幻灯片类视频）；开启后不再按时间切片并行
+            "dedupe_threshold": 3,  # 判定为重复的dHash海明距离(位，共64位)
+            "workers": 1,  # FFmpeg生成BIF时按时间切片并行的进程数；0 表示使用容器(cgroup)可用的CPU数，1 为单进程
+            "compare_modes": False  # 生成BIF时额外用两种模式各跑一次，把耗时对比记录到任务状态
         }
     }
     
@@ -34,12 +102,13 @@ def load_config():
         # 确保所有默认键存在
         if "cookie" not in config:
             config["cookie"] = default_config["cookie"]
-        if "download_dir" not in config:
-            config["download_dir"] = default_config["download_dir"]
-        else:
-            for key in default_config["download_dir"]:
-                if key not in config["download_dir"]:
-                    config["download_dir"][key] = default_config["download_dir"][key]
+        for section in ["download_dir", "downloader", "http", "rate_limit", "bandwidth", "cdn", "dash", "audio", "browser_pool", "subtitle_process", "danmaku", "bif"]:
+            if section not in config:
+                config[section] = default_config[section]
+            else:
+                for key in default_config[section]:
+                    if key not in config[section]:
+                        config[section][key] = default_config[section][key]
                     
         return config
     except Exception as e:
@@ -102,7 +171,8 @@ def get_download_path(config, video_info, media_type):
     Args:
         config: 配置信息
         video_info: 视频信息字典
-        media_type: 媒体类型，'video', 'audio', 'subtitle'，以及新增的'poster'和'nfo'
+        media_type: 媒体类型，'video', 'audio', 'audio_m4a', 'subtitle'，以及新增的'poster'和'nfo'；
+                    'bif_sd'、'bif_hd' 等为不同分辨率的BIF，'danmaku' 为转换成ASS的弹幕
         
     Returns:
         下载路径字符串
@@ -144,6 +214,11 @@ def get_download_path(config, video_info, media_type):
         file_path = os.path.join(video_dir, f"{bv_id}.mp3")
         print(f"音频将保存到: {file_path}")
         return file_path
+    elif media_type == "audio_m4a":
+        # DASH音频流直接封装的无损音频
+        file_path = os.path.join(video_dir, f"{bv_id}.m4a")
+        print(f"M4A音频将保存到: {file_path}")
+        return file_path
     elif media_type == "subtitle":
         file_path = os.path.join(video_dir, f"{bv_id}.srt")
         print(f"字幕将保存到: {file_path}")
@@ -166,6 +241,17 @@ def get_download_path(config, video_info, media_type):
         file_path = os.path.join(video_dir, f"{bv_id}.bif")
         print(f"BIF文件将保存到: {file_path}")
         return file_path
+    elif media_type.startswith("bif_"):
+        # 针对特定分辨率的BIF，与Roku/Emby的 -SD/-HD 命名一致
+        variant = media_type[4:].upper()  # 去掉"bif_"
+        file_path = os.path.join(video_dir, f"{bv_id}-{variant}.bif")
+        print(f"{variant} BIF文件将保存到: {file_path}")
+        return file_path
+    elif media_type == "danmaku":
+        # Emby 把 {文件名}.{标题}.ass 识别为该视频的外挂字幕
+        file_path = os.path.join(video_dir, f"{bv_id}.danmaku.ass")
+        print(f"弹幕将保存到: {file_path}")
+        return file_path
     elif media_type == "subtitle_json":
         return os.path.join(video_dir, f"{bv_id}_raw.json")
     elif media_type.startswith("subtitle_"):
@@ -5,7 +5,7 @@ import re
 import sys
 from datetime import datetime
 import openai
-import requests  # 添加 requests 库用于 Claude API 调用
+from ..core.http_client import get_session
 
 def generate_summary(subtitle_path: str, config: dict):
     """
@@ -303,10 +303,11 @@ def call_claude_api(prompt, base_url, api_key, model):
     }
     
     # 发送请求
-    response = requests.post(
+    response = get_session().post(
         f"{base_url}/v1/messages",
         headers=headers,
-        json=payload
+        json=payload,
+        timeout=(10, 300)  # 生成长总结耗时较长，单独放宽读取超时
     )
     
     if response.status_code != 200:
@@ -3,76 +3,139 @@ import os
 import sys
 import subprocess
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ..core import task_manager
+from ..core.media import remux_audio
+from ..config.config_manager import load_config, get_download_path
+from ..utils.helpers import available_cpu_count
 
-def extract_audio(video_path, audio_path):
+AUDIO_MODES = ("copy", "mp3")
+
+_transcode_pool = None
+_transcode_pool_lock = threading.Lock()
+
+def get_transcode_pool():
+    """获取MP3转码线程池，并发数默认等于容器可用的CPU数"""
+    global _transcode_pool
+    if _transcode_pool is None:
+        with _transcode_pool_lock:
+            if _transcode_pool is None:
+                workers = load_config().get("audio", {}).get("transcode_workers") or available_cpu_count()
+                _transcode_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mp3_transcode")
+                print(f"创建MP3转码线程池: 最多 {workers} 个并发转码")
+                sys.stdout.flush()
+    return _transcode_pool
+
+def audio_output_args(mode, output_path):
+    """返回把输入的第一条音轨写入 output_path 的FFmpeg输出参数，供合并后处理共用"""
+    if mode == "copy":
+        codec_args = ["-c:a", "copy", "-f", "mp4"]
+    else:
+        codec_args = ["-acodec", "libmp3lame", "-ab", "192k", "-ar", "44100", "-f", "mp3"]
+    return ["-map", "0:a:0", "-vn", "-sn", *codec_args, output_path]
+
+def _transcode_mp3(video_path, audio_path, submitted_at):
+    """在转码线程池中执行: 使用libmp3lame编码为MP3，返回 (是否成功, 排队等待的秒数)"""
+    queued = time.time() - submitted_at
+    
+    # 使用FFmpeg提取音频
+    command = [
+        "ffmpeg",
+        "-i", video_path,             # 输入文件
+        "-vn",                        # 不处理视频
+        "-acodec", "libmp3lame",      # 使用MP3编码器
+        "-ab", "192k",                # 比特率
+        "-ar", "44100",               # 采样率
+        "-y",                         # 覆盖已有文件
+        audio_path                    # 输出文件
+    ]
+    
+    # 执行命令并实时输出处理进度
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    
+    # 打印处理信息
+    print("正在提取音频，请稍候...")
+    sys.stdout.flush()
+    
+    # 读取FFmpeg输出并显示进度
+    for line in process.stderr:
+        if "time=" in line:
+            # 提取当前处理时间，显示进度
+            progress_info = line.strip()
+            print(f"\r{progress_info}", end="")
+            sys.stdout.flush()
+    
+    # 等待进程结束
+    process.wait()
+    if process.returncode != 0:
+        print(f"\n音频提取失败，返回代码: {process.returncode}")
+        sys.stdout.flush()
+    return process.returncode == 0, queued
+
+def extract_audio(video_path, audio_path, mode="mp3", return_info=False):
     """从视频中提取音频
     
     参数:
         video_path: 视频文件路径
         audio_path: 输出音频文件路径
+        mode: 'copy' 直接复制音轨封装为M4A (不重新编码)，'mp3' 重新编码为MP3
+        return_info: 为True时同时返回处理方式和耗时
     
     返回:
-        是否成功提取
+        是否成功提取；return_info 为True时返回 (是否成功, 信息字典)
     """
+    info = {"mode": mode, "elapsed": 0.0, "queued": 0.0}
+    
+    def result(success):
+        return (success, info) if return_info else success
+    
+    if mode not in AUDIO_MODES:
+        print(f"不支持的音频提取方式: {mode}")
+        sys.stdout.flush()
+        return result(False)
+    
     if not os.path.exists(video_path):
         print(f"视频文件不存在: {video_path}")
         sys.stdout.flush()
-        return False
+        return result(False)
     
     # 确保输出目录存在
     os.makedirs(os.path.dirname(os.path.abspath(audio_path)), exist_ok=True)
     
     try:
-        print(f"开始提取音频: {video_path} -> {audio_path}")
+        print(f"开始提取音频 ({mode}): {video_path} -> {audio_path}")
         sys.stdout.flush()
         
         start_time = time.time()
         
-        # 使用FFmpeg提取音频
-        command = [
-            "ffmpeg",
-            "-i", video_path,             # 输入文件
-            "-vn",                        # 不处理视频
-            "-acodec", "libmp3lame",      # 使用MP3编码器
-            "-ab", "192k",                # 比特率
-            "-ar", "44100",               # 采样率
-            "-y",                         # 覆盖已有文件
-            audio_path                    # 输出文件
-        ]
-        
-        # 执行命令并实时输出处理进度
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-        
-        # 打印处理信息
-        print("正在提取音频，请稍候...")
-        sys.stdout.flush()
-        
-        # 读取FFmpeg输出并显示进度
-        for line in process.stderr:
-            if "time=" in line:
-                # 提取当前处理时间，显示进度
-                progress_info = line.strip()
-                print(f"\r{progress_info}", end="")
-                sys.stdout.flush()
-        
-        # 等待进程结束
-        process.wait()
-        
-        # 检查进程返回值
-        if process.returncode == 0:
-            elapsed_time = time.time() - start_time
-            print(f"\n音频提取成功: {audio_path} (耗时: {elapsed_time:.2f}秒)")
-            sys.stdout.flush()
-            return True
+        if mode == "copy":
+            # 只复制音轨，不解码，长视频也只需不到一秒
+            success, error = remux_audio(video_path, audio_path)
+            if not success:
+                print(f"音频提取失败: {error}")
         else:
-            print(f"\n音频提取失败，返回代码: {process.returncode}")
+            # 转码占满一个CPU核心，通过线程池限制同时进行的转码数量
+            success, queued = get_transcode_pool().submit(
+                _transcode_mp3, video_path, audio_path, start_time
+            ).result()
+            info["queued"] = round(queued, 2)
+        
+        elapsed_time = time.time() - start_time
+        info["elapsed"] = round(elapsed_time, 2)
+        if success:
+            print(f"\n音频提取成功: {audio_path} (方式: {mode}, 耗时: {elapsed_time:.2f}秒)")
             sys.stdout.flush()
-            return False
+            return result(True)
+        
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        return result(False)
             
     except Exception as e:
         print(f"\n提取音频时出错: {e}")
@@ -88,4 +151,51 @@ def extract_audio(video_path, audio_path):
                 print(f"无法删除不完整的音频文件: {del_e}")
                 sys.stdout.flush()
         
-        return False
+        return result(False)
+
+AUDIO_FORMATS = ("m4a", "mp3")
+
+def get_audio_format(config, download_options):
+    """确定音频的输出格式，下载选项中的 audio_format 优先于配置中的默认值"""
+    audio_format = download_options.get("audio_format") or config.get("dash", {}).get("audio_format", "m4a")
+    audio_format = str(audio_format).lower()
+    return audio_format if audio_format in AUDIO_FORMATS else "m4a"
+
+def produce_audio(source_path, video_info, config, audio_format="m4a", task_id=None):
+    """由音频流或视频文件生成最终的音频文件
+    
+    参数:
+        source_path: 音频来源，可以是DASH音频流、已封装的M4A或包含音轨的视频
+        video_info: 视频信息字典
+        config: 配置信息
+        audio_format: 'm4a' 只复制音轨，'mp3' 重新编码为MP3
+        task_id: 不为空时把处理方式和耗时写入任务记录的 processing.audio
+    
+    返回:
+        (bool, str): 是否成功，音频文件路径
+    """
+    m4a_path = get_download_path(config, video_info, "audio_m4a")
+    
+    if audio_format == "mp3":
+        output_path = get_download_path(config, video_info, "audio")
+        success, info = extract_audio(source_path, output_path, mode="mp3", return_info=True)
+        # MP3转换完成后，作为中间文件的M4A不再保留
+        if success and source_path == m4a_path:
+            try:
+                os.remove(m4a_path)
+            except OSError as e:
+                print(f"删除中间音频文件失败: {e}")
+    elif source_path == m4a_path:
+        # DASH下载时已经保存好的M4A，无需再处理
+        output_path = m4a_path
+        success, info = os.path.exists(m4a_path), {"mode": "dash_stream", "elapsed": 0.0, "queued": 0.0}
+    else:
+        output_path = m4a_path
+        audio_part = f"{m4a_path}.part"
+        success, info = extract_audio(source_path, audio_part, mode="copy", return_info=True)
+        if success:
+            os.replace(audio_part, m4a_path)
+    
+    if task_id:
+        task_manager.update_task(task_id, {"processing": {"audio": info}})
+    return success, (output_path if success else "")
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from datetime import datetime
+from ..config.config_manager import load_config
+from ..core import task_manager
+
+# 单位均为 KB/s，0 表示不限速
+DEFAULT_BANDWIDTH = {
+    "total_limit": 0,  # 所有下载任务合计的速率上限
+    "per_task_limit": 0,  # 单个任务的速率上限
+    "schedule": []  # 分时段限速，例如 [{"start": "01:00", "end": "07:00", "total_limit": 0}]
+}
+
+CONFIG_RELOAD_INTERVAL = 5.0  # 重新读取限速配置的间隔(秒)
+STATUS_PUBLISH_INTERVAL = 2.0  # 向 tasks.json 写入速率状态的间隔(秒)
+
+_lock = threading.Lock()
+_tasks = {}  # task_id -> 任务带宽状态
+_global_clock = 0.0  # 全局发送时钟，保证合计速率不超过总上限
+_settings = None
+_settings_loaded_at = 0.0
+
+def _load_settings():
+    global _settings, _settings_loaded_at
+    now = time.monotonic()
+    if _settings is None or now - _settings_loaded_at >= CONFIG_RELOAD_INTERVAL:
+        settings = dict(DEFAULT_BANDWIDTH)
+        settings.update(load_config().get("bandwidth", {}))
+        _settings = settings
+        _settings_loaded_at = now
+    return _settings
+
+def _in_window(start, end, now_minutes):
+    """判断当前时间(分钟)是否在 [start, end) 时段内，支持跨越午夜的时段"""
+    start_h, start_m = [int(x) for x in start.split(":")]
+    end_h, end_m = [int(x) for x in end.split(":")]
+    start_minutes = start_h * 60 + start_m
+    end_minutes = end_h * 60 + end_m
+    if start_minutes <= end_minutes:
+        return start_minutes <= now_minutes < end_minutes
+    return now_minutes >= start_minutes or now_minutes < end_minutes
+
+def _current_limits(settings):
+    """返回当前时段生效的 (总上限, 单任务上限)，单位 KB/s"""
+    total_limit = settings.get("total_limit", 0)
+    per_task_limit = settings.get("per_task_limit", 0)
+
+    now = datetime.now()
+    now_minutes = now.hour * 60 + now.minute
+    for window in settings.get("schedule", []):
+        try:
+            if _in_window(window["start"], window["end"], now_minutes):
+                total_limit = window.get("total_limit", total_limit)
+                per_task_limit = window.get("per_task_limit", per_task_limit)
+                break
+        except (KeyError, ValueError) as e:
+            print(f"[带宽] 忽略格式错误的限速时段 {window}: {e}")
+    return total_limit, per_task_limit
+
+def _task_limit_locked(total_limit, per_task_limit):
+    """计算单个任务当前可用的速率(字节/秒)，总上限在活跃任务间平均分配"""
+    limits = []
+    if total_limit:
+        limits.append(total_limit * 1024 / max(1, len(_tasks)))
+    if per_task_limit:
+        limits.append(per_task_limit * 1024)
+    return min(limits) if limits else 0
+
+def register_task(task_id):
+    """登记一个开始下载的任务，同一任务可能同时下载多个文件"""
+    with _lock:
+        state = _tasks.get(task_id)
+        if state is None:
+            state = {
+                "refs": 0,
+                "clock": 0.0,
+                "window_bytes": 0,
+                "window_start": time.monotonic(),
+                "rate": 0.0,
+                "limit": 0.0
+            }
+            _tasks[task_id] = state
+        state["refs"] += 1
+
+def unregister_task(task_id):
+    """任务的一个文件下载结束，全部结束时移除任务"""
+    with _lock:
+        state = _tasks.get(task_id)
+        if state is None:
+            return
+        state["refs"] -= 1
+        if state["refs"] > 0:
+            return
+        del _tasks[task_id]
+    _publish_status(task_id, {"current_rate": 0, "active_limit": round(state["limit"] / 1024, 1) if state["limit"] else 0})
+
+def consume(task_id, nbytes):
+    """下载每个数据块后调用，按当前限速阻塞相应的时间，返回等待的秒数"""
+    global _global_clock
+    settings = _load_settings()
+    total_limit, per_task_limit = _current_limits(settings)
+
+    publish = None
+    with _lock:
+        state = _tasks.get(task_id)
+        if state is None:
+            return 0.0
+        now = time.monotonic()
+        wait = 0.0
+
+        task_rate = _task_limit_locked(total_limit, per_task_limit)
+        state["limit"] = task_rate
+        if task_rate:
+            # 令每个任务按自己的时钟发送，时钟落后于当前时间时不累积额度
+            start = max(state["clock"], now)
+            state["clock"] = start + nbytes / task_rate
+            wait = start - now
+        if total_limit:
+            start = max(_global_clock, now)
+            _global_clock = start + nbytes / (total_limit * 1024)
+            wait = max(wait, start - now)
+
+        # 统计实际速率
+        state["window_bytes"] += nbytes
+        elapsed = now - state["window_start"]
+        if elapsed >= STATUS_PUBLISH_INTERVAL:
+            state["rate"] = state["window_bytes"] / elapsed
+            state["window_bytes"] = 0
+            state["window_start"] = now
+            publish = {
+                "current_rate": round(state["rate"] / 1024, 1),
+                "active_limit": round(task_rate / 1024, 1) if task_rate else 0
+            }
+
+    if publish is not None:
+        _publish_status(task_id, publish)
+    if wait > 0:
+        time.sleep(wait)
+    return max(wait, 0.0)
+
+def _publish_status(task_id, status):
+    """把任务的当前速率和生效的限速写入 tasks.json (单位 KB/s，0 表示不限速)"""
+    if not task_id:
+        return
+    task_manager.update_task(task_id, {"bandwidth": status})
+
+def get_bandwidth_stats():
+    """返回当前限速配置和各任务的速率"""
+    total_limit, per_task_limit = _current_limits(_load_settings())
+    with _lock:
+        tasks = {
+            str(task_id): {
+                "downloads": state["refs"],
+                "current_rate": round(state["rate"] / 1024, 1),
+                "active_limit": round(state["limit"] / 1024, 1) if state["limit"] else 0
+            }
+            for task_id, state in _tasks.items()
+        }
+    return {
+        "total_limit": total_limit,
+        "per_task_limit": per_task_limit,
+        "active_tasks": len(tasks),
+        "tasks": tasks
+    }
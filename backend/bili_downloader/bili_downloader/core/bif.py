@@ -2,141 +2,769 @@
 import os
 import subprocess
 import struct
-import tempfile
+import threading
+import collections
+import math
+import re
+import time
 import shutil
-import glob # 用于查找文件
+import tempfile
+import io
+import mmap
 import sys # <-- 添加导入
+from concurrent.futures import ThreadPoolExecutor
+from ..core.media import probe_duration, _startupinfo
+from ..core.http_client import get_session
+from ..core.rate_limiter import bili_api_get
+from ..utils.helpers import available_cpu_count
+
+BIF_MAGIC = b'\x89BIF\r\n\x1a\n'
+HEADER_SIZE = 64
+INDEX_ENTRY_SIZE = 8 # 4 bytes timestamp + 4 bytes offset
+PIPE_READ_SIZE = 256 * 1024
+MOVE_CHUNK_SIZE = 1024 * 1024
+DEFAULT_INDEX_RESERVE = 600 # Index slots reserved when the duration is unknown
+READER_CACHE_SIZE = 32 # Memory-mapped BIF files kept open for frame lookups
+MIN_SLICE_SECONDS = 60 # Shorter time slices are not worth an extra FFmpeg process
+
+# full: decode every frame, pick I-frames on a fixed 1/interval grid (timestamps approximate)
+# keyframe: decode keyframes only, timestamps taken from each frame's PTS
+BIF_MODE_FULL = 'full'
+BIF_MODE_KEYFRAME = 'keyframe'
+BIF_MODES = (BIF_MODE_FULL, BIF_MODE_KEYFRAME)
+
+# BIF sources (chosen per task in app.download_media_with_status_update):
+# "ffmpeg" (default) always decodes the downloaded video;
+# "auto" uses Bilibili's pre-rendered videoshot sprites only for audio-only
+# tasks, where there is no video to decode, and FFmpeg otherwise;
+# "videoshot" prefers the sprites for audio-only tasks and for downloaded videos
+# without extra resolution variants, falling back to FFmpeg when a video exists
+BIF_SOURCE_AUTO = 'auto'
+BIF_SOURCE_FFMPEG = 'ffmpeg'
+BIF_SOURCE_VIDEOSHOT = 'videoshot'
+
+VIDEOSHOT_API = "https://api.bilibili.com/x/player/videoshot?bvid={bv_id}&cid={cid}&index=1"
+
+SHOWINFO_PTS_RE = re.compile(r'\[Parsed_showinfo.*?\bpts_time:\s*(-?[0-9.]+)')
+
+# dHash: each thumbnail is also scaled to a 9x8 grayscale image and every pixel is
+# compared with its right neighbour, giving a 64-bit perceptual hash
+DHASH_WIDTH = 9
+DHASH_HEIGHT = 8
+DHASH_FRAME_SIZE = DHASH_WIDTH * DHASH_HEIGHT
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+
+def thumbnail_input_args(mode: str = BIF_MODE_FULL):
+    """
+    Returns the FFmpeg input options for the given BIF mode.
+
+    In keyframe mode the video decoder skips every non-key frame, so only
+    keyframes are ever decoded. Audio decoding is not affected.
+    """
+    if mode == BIF_MODE_KEYFRAME:
+        return ['-skip_frame:v', 'nokey']
+    return []
+
+def thumbnail_output_args(output: str = 'pipe:1', interval: int = 1, width: int = 480, mode: str = BIF_MODE_FULL):
+    """
+    Returns the FFmpeg output options that write one JPEG thumbnail per interval
+    as a continuous image2pipe stream.
+
+    Shared by generate_bif and the combined post-processor so both select the
+    same frames. In keyframe mode frames are picked by their real timestamps and
+    showinfo logs each selected frame's PTS to stderr.
+    """
+    return [
+        '-map', '0:v:0',
+        '-an', '-sn', # No audio, no subtitles
+        '-vf', f"{thumbnail_select_filter(interval, mode)},scale={width}:-1",
+        '-vsync', 'vfr',
+        '-f', 'image2pipe',
+        '-c:v', 'mjpeg',
+        output
+    ]
+
+def thumbnail_select_filter(interval: int = 1, mode: str = BIF_MODE_FULL):
+    """Returns the filter chain that picks one frame per interval, before scaling."""
+    if mode == BIF_MODE_KEYFRAME:
+        return f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{interval})',showinfo"
+    return f"select='eq(pict_type,I)',fps=1/{interval}"
+
+def multi_thumbnail_output_args(outputs, interval: int = 1, widths=(480,), mode: str = BIF_MODE_FULL,
+                                hash_output: str = None):
+    """
+    Returns FFmpeg output options that decode and select the frames once, then
+    split them into one scaled image2pipe stream per width.
+
+    Frames are selected (and logged by showinfo) before the split, so every
+    output gets exactly the same frames and timestamps. With hash_output an
+    extra branch writes each frame as raw 9x8 grayscale pixels for dHash.
+    """
+    branches = [f"scale={width}:-1" for width in widths]
+    if hash_output:
+        branches.append(f"scale={DHASH_WIDTH}:{DHASH_HEIGHT}:flags=area,format=gray")
+    graph = f"[0:v:0]{thumbnail_select_filter(interval, mode)},split={len(branches)}"
+    graph += ''.join(f"[s{i}]" for i in range(len(branches)))
+    graph += ''.join(f";[s{i}]{branch}[t{i}]" for i, branch in enumerate(branches))
+    args = ['-filter_complex', graph]
+    for i, output in enumerate(outputs):
+        args += ['-map', f"[t{i}]", '-vsync', 'vfr', '-f', 'image2pipe', '-c:v', 'mjpeg', output]
+    if hash_output:
+        args += ['-map', f"[t{len(widths)}]", '-vsync', 'vfr', '-f', 'rawvideo', hash_output]
+    return args
+
+def dhash(pixels: bytes) -> int:
+    """64-bit difference hash of one 9x8 grayscale frame."""
+    value = 0
+    for row in range(DHASH_HEIGHT):
+        line = pixels[row * DHASH_WIDTH:(row + 1) * DHASH_WIDTH]
+        for x in range(DHASH_WIDTH - 1):
+            value = (value << 1) | (line[x] > line[x + 1])
+    return value
+
+def iter_dhashes(stream):
+    """Reads a raw 9x8 grayscale frame stream and yields one dHash per frame."""
+    while True:
+        pixels = stream.read(DHASH_FRAME_SIZE)
+        if len(pixels) < DHASH_FRAME_SIZE:
+            break
+        yield dhash(pixels)
+
+def estimate_frame_count(duration, interval: int = 1):
+    """Number of index slots to reserve for a video of the given duration (seconds)."""
+    if not duration:
+        return DEFAULT_INDEX_RESERVE
+    # A little headroom for rounding; an overflow is still handled by BifWriter
+    return int(math.ceil(duration / interval * 1.05)) + 16
+
+class BifWriter:
+    """
+    Writes a BIF file incrementally.
+
+    The header and index table are reserved up front, image data is appended as
+    frames arrive, and the index is patched in on close(). Only the 8-byte index
+    entries are kept in memory, never the images. If more frames arrive than
+    were reserved, the image data is shifted once on close() to make room.
+    """
+
+    def __init__(self, bif_path: str, reserved_count: int = DEFAULT_INDEX_RESERVE):
+        self.bif_path = bif_path
+        self.part_path = f"{bif_path}.part"
+        self.reserved_count = max(0, reserved_count)
+        self.entries = [] # (timestamp_ms, offset relative to the start of image data)
+        self.data_size = 0
+        os.makedirs(os.path.dirname(os.path.abspath(bif_path)), exist_ok=True)
+        self.file = open(self.part_path, 'w+b')
+        self.data_start = self._index_end(self.reserved_count)
+        self.file.seek(self.data_start)
+
+    @staticmethod
+    def _index_end(count):
+        return HEADER_SIZE + (count + 1) * INDEX_ENTRY_SIZE # +1 for the terminator
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, timestamp_ms: int, image_data: bytes):
+        """Appends one JPEG image shown from timestamp_ms onwards."""
+        self.entries.append((int(timestamp_ms), self.data_size))
+        self.file.write(image_data)
+        self.data_size += len(image_data)
+
+    def add_duplicate(self, timestamp_ms: int):
+        """Adds an index entry that points at the previous image instead of storing a copy."""
+        self.entries.append((int(timestamp_ms), self.entries[-1][1]))
+
+    def set_timestamps(self, timestamps_ms):
+        """Replaces the timestamps of all images added so far (e.g. with real PTS values)."""
+        self.entries = [(int(ts), offset) for ts, (_, offset) in zip(timestamps_ms, self.entries)]
+
+    def _shift_data(self, new_start):
+        """Moves the image data forward, copying from the end so nothing is overwritten."""
+        delta = new_start - self.data_start
+        remaining = self.data_size
+        while remaining > 0:
+            chunk = min(MOVE_CHUNK_SIZE, remaining)
+            remaining -= chunk
+            self.file.seek(self.data_start + remaining)
+            block = self.file.read(chunk)
+            self.file.seek(self.data_start + remaining + delta)
+            self.file.write(block)
+        self.data_start = new_start
+
+    def close(self):
+        """Patches the header and index table and moves the file into place."""
+        try:
+            image_count = len(self.entries)
+            if image_count > self.reserved_count:
+                print(f"[BIF] Index reservation exceeded ({image_count} > {self.reserved_count}), shifting image data")
+                sys.stdout.flush()
+                self._shift_data(self._index_end(image_count))
+
+            index = bytearray()
+            index += BIF_MAGIC                       # Magic number (8 bytes)
+            index += struct.pack('<I', 0)            # Version (4 bytes)
+            index += struct.pack('<I', image_count)  # Number of images (4 bytes)
+            index += struct.pack('<I', 1000)         # Timestamp multiplier (ms) (4 bytes)
+            index += b'\x00' * 44                    # Reserved (44 bytes)
+            for timestamp_ms, offset in self.entries:
+                index += struct.pack('<II', timestamp_ms, self.data_start + offset)
+            # Terminator entry: offset *after* last image data
+            index += struct.pack('<II', 0xFFFFFFFF, self.data_start + self.data_size)
+            # Unused reserved slots stay zero; readers stop at the terminator and offsets are absolute
+
+            self.file.seek(0)
+            self.file.write(index)
+            self.file.truncate(self.data_start + self.data_size)
+            self.file.close()
+            os.replace(self.part_path, self.bif_path)
+        finally:
+            self.discard()
+
+    def discard(self):
+        """Closes and removes the partial file (no-op after a successful close)."""
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+class BifReader:
+    """
+    Read-only view of a BIF file backed by mmap.
+
+    Lookups binary-search the index table in place and return memoryview
+    slices of the mapping, so image bytes are never copied. Repeated offsets
+    (deduplicated thumbnails) resolve to the shared image.
+    """
+
+    def __init__(self, bif_path: str):
+        self.bif_path = bif_path
+        stat = os.stat(bif_path)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        if stat.st_size < HEADER_SIZE + INDEX_ENTRY_SIZE:
+            raise ValueError(f"BIF file is too small: {bif_path}")
+        with open(bif_path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if self.view[:len(BIF_MAGIC)] != BIF_MAGIC:
+            raise ValueError(f"Not a BIF file: {bif_path}")
+        self.image_count, multiplier = struct.unpack_from('<II', self.map, 12)
+        self.multiplier = multiplier or 1000 # 0 means the default of 1000 ms
+        if HEADER_SIZE + (self.image_count + 1) * INDEX_ENTRY_SIZE > stat.st_size:
+            raise ValueError(f"BIF index exceeds the file size: {bif_path}")
+
+    def __len__(self):
+        return self.image_count
+
+    def _entry(self, index: int):
+        return struct.unpack_from('<II', self.map, HEADER_SIZE + index * INDEX_ENTRY_SIZE)
+
+    def timestamp_ms(self, index: int) -> int:
+        return self._entry(index)[0] * self.multiplier // 1000 # Same scaling as BifWriter and the frontend parser
+
+    def find(self, timestamp_ms: int) -> int:
+        """
+        Index of the image shown at timestamp_ms: the last one starting at or
+        before it. Entries repeating an image resolve to the first of the run.
+        """
+        low, high = 0, self.image_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp_ms(middle) <= timestamp_ms:
+                low = middle + 1
+            else:
+                high = middle
+        index = max(0, low - 1)
+        offset = self._entry(index)[1]
+        while index > 0 and self._entry(index - 1)[1] == offset:
+            index -= 1
+        return index
+
+    def image(self, index: int) -> memoryview:
+        """JPEG bytes of one image as a zero-copy slice of the mapping."""
+        start = self._entry(index)[1]
+        following = index + 1
+        while following < self.image_count and self._entry(following)[1] == start:
+            following += 1
+        end = self._entry(following)[1] # Terminator entry when following == image_count
+        if not HEADER_SIZE <= start < end <= len(self.view):
+            raise ValueError(f"Invalid image offsets {start}-{end} in {self.bif_path}")
+        return self.view[start:end]
+
+_reader_cache = collections.OrderedDict()
+_reader_lock = threading.Lock()
+
+def get_bif_reader(bif_path: str) -> BifReader:
+    """
+    Returns a cached BifReader for bif_path, reopened when the file changed on
+    disk. Evicted readers are unmapped once no response still uses their memory.
+    """
+    key = os.path.abspath(bif_path)
+    stat = os.stat(key)
+    with _reader_lock:
+        reader = _reader_cache.get(key)
+        if reader is not None and reader.signature == (stat.st_mtime_ns, stat.st_size):
+            _reader_cache.move_to_end(key)
+            return reader
+    reader = BifReader(key)
+    with _reader_lock:
+        _reader_cache[key] = reader
+        _reader_cache.move_to_end(key)
+        while len(_reader_cache) > READER_CACHE_SIZE:
+            _reader_cache.popitem(last=False)
+    return reader
+
+class DuplicateFilter:
+    """
+    Feeds thumbnails to a BifWriter in order once each frame's dHash is known.
+
+    A frame whose hash is within `threshold` bits of the last stored frame is
+    written as a repeated index entry only. JPEGs and hashes arrive from two
+    pipes read by different threads, so frames wait here until their hash is in.
+    """
+
+    def __init__(self, writer: BifWriter, interval: int = 1, threshold: int = 0):
+        self.writer = writer
+        self.interval = interval
+        self.threshold = threshold
+        self.frames = {}
+        self.hashes = []
+        self.next_index = 0
+        self.last_hash = None
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def add_frame(self, index: int, image_data: bytes):
+        with self.lock:
+            self.frames[index] = image_data
+            self._flush()
+
+    def add_hash(self, value: int):
+        with self.lock:
+            self.hashes.append(value)
+            self._flush()
+
+    def finish(self):
+        """Writes any frames left without a hash unchanged."""
+        with self.lock:
+            self._flush(force=True)
+
+    def _flush(self, force: bool = False):
+        while self.next_index in self.frames and (force or self.next_index < len(self.hashes)):
+            image_data = self.frames.pop(self.next_index)
+            value = self.hashes[self.next_index] if self.next_index < len(self.hashes) else None
+            timestamp_ms = self.next_index * self.interval * 1000 # Approximate timestamp calculation
+            if (value is not None and self.last_hash is not None and len(self.writer)
+                    and bin(value ^ self.last_hash).count('1') <= self.threshold):
+                self.writer.add_duplicate(timestamp_ms)
+                self.duplicates += 1
+            else:
+                self.writer.add(timestamp_ms, image_data)
+                self.last_hash = value
+            self.next_index += 1
+
+def iter_jpeg_frames(stream, read_size: int = PIPE_READ_SIZE):
+    """
+    Splits a concatenated MJPEG byte stream into individual JPEG images.
+
+    Frames are delimited by the SOI/EOI markers. FFmpeg's mjpeg encoder byte-stuffs
+    0xFF inside entropy-coded data, so EOI only occurs at the end of a frame.
+    """
+    buffer = bytearray()
+    search_from = 0
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            start = buffer.find(JPEG_SOI)
+            if start < 0:
+                # Keep a possible partial marker byte
+                del buffer[:max(0, len(buffer) - 1)]
+                search_from = 0
+                break
+            if start > 0:
+                del buffer[:start]
+                search_from = 0
+            end = buffer.find(JPEG_EOI, max(2, search_from))
+            if end < 0:
+                search_from = max(2, len(buffer) - 1)
+                break
+            yield bytes(buffer[:end + 2])
+            del buffer[:end + 2]
+            search_from = 0
+
+def stream_bif_from_command(ffmpeg_cmd, bif_path: str, interval: int = 1, reserved_count: int = DEFAULT_INDEX_RESERVE,
+                            pts_timestamps: bool = False, return_info: bool = False):
+    """
+    Runs an FFmpeg command whose stdout is an image2pipe JPEG stream and writes
+    the frames straight into a BIF file.
+
+    Args:
+        pts_timestamps: Use the pts_time values logged by a showinfo filter as
+                        the image timestamps instead of i * interval.
+        return_info: Also return a dict with the frame count and elapsed time.
+
+    Returns:
+        bool: True if successful, False otherwise.
+        str: Error message if failed, None otherwise.
+        dict: Only when return_info is True.
+    """
+    return stream_bifs_from_command(ffmpeg_cmd, [(bif_path, None)], interval, reserved_count,
+                                    pts_timestamps=pts_timestamps, return_info=return_info)
+
+def stream_bifs_from_command(ffmpeg_cmd, outputs, interval: int = 1, reserved_count: int = DEFAULT_INDEX_RESERVE,
+                             pts_timestamps: bool = False, hash_fds=None, dedupe_threshold: int = 0,
+                             return_info: bool = False):
+    """
+    Runs an FFmpeg command with one or more image2pipe JPEG outputs and writes
+    each of them into its own BIF file. All outputs must carry the same frames.
+
+    Args:
+        outputs: [(bif_path, fds)] where fds is None for FFmpeg's stdout, or the
+                 (read_fd, write_fd) pair of an os.pipe() that FFmpeg writes to
+                 as pipe:<write_fd>. Both ends are closed here.
+        pts_timestamps: Use the pts_time values logged by a showinfo filter as
+                        the image timestamps instead of i * interval.
+        hash_fds: (read_fd, write_fd) of a pipe carrying raw 9x8 grayscale
+                  frames; near-identical consecutive thumbnails are then
+                  stored once and repeated in the index.
+        dedupe_threshold: Maximum dHash distance (bits) for two frames to
+                          count as identical.
+        return_info: Also return a dict with the frame count and elapsed time.
+
+    Returns:
+        bool: True if successful, False otherwise.
+        str: Error message if failed, None otherwise.
+        dict: Only when return_info is True.
+    """
+    start_time = time.time()
+    info = {"frames": 0, "elapsed": 0.0, "timestamps": "pts" if pts_timestamps else "approximate"}
+    if hash_fds is not None:
+        outputs = list(outputs) + [(None, hash_fds)]
+
+    def result(success, error):
+        info["elapsed"] = round(time.time() - start_time, 2)
+        return (success, error, info) if return_info else (success, error)
+
+    write_fds = [fds[1] for _, fds in outputs if fds is not None]
+    streams = [os.fdopen(fds[0], 'rb') if fds is not None else None for _, fds in outputs]
+    hash_stream = streams.pop() if hash_fds is not None else None
+    writers = [BifWriter(bif_path, reserved_count) for bif_path, _ in outputs if bif_path is not None]
+    filters = [DuplicateFilter(writer, interval, dedupe_threshold) for writer in writers] if hash_stream else []
+    stderr_tail = collections.deque(maxlen=50)
+    pts_times = []
+    pump_errors = []
+    process = None
+
+    def discard_all():
+        for writer in writers:
+            writer.discard()
+
+    try:
+        try:
+            process = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       startupinfo=_startupinfo(), pass_fds=write_fds)
+        finally:
+            # Only FFmpeg may hold the write ends, otherwise the readers never see EOF
+            for fd in write_fds:
+                os.close(fd)
+
+        # Drain stderr in the background so FFmpeg never blocks on a full pipe
+        def drain_stderr():
+            for line in process.stderr:
+                text = line.decode('utf-8', errors='ignore')
+                if pts_timestamps:
+                    match = SHOWINFO_PTS_RE.search(text)
+                    if match:
+                        pts_times.append(float(match.group(1)))
+                        continue
+                stderr_tail.append(text)
+
+        # Every output has to be read concurrently, otherwise FFmpeg stalls on the first full pipe
+        def pump(index, stream):
+            try:
+                for i, image_data in enumerate(iter_jpeg_frames(stream)):
+                    if filters:
+                        filters[index].add_frame(i, image_data)
+                    else:
+                        writers[index].add(i * interval * 1000, image_data) # Approximate timestamp calculation
+            except Exception as e:
+                pump_errors.append(e)
+
+        def pump_hashes():
+            try:
+                for value in iter_dhashes(hash_stream):
+                    for duplicate_filter in filters:
+                        duplicate_filter.add_hash(value)
+            except Exception as e:
+                pump_errors.append(e)
+
+        threads = [threading.Thread(target=drain_stderr, daemon=True)]
+        for index, stream in enumerate(streams):
+            threads.append(threading.Thread(target=pump, args=(index, stream or process.stdout), daemon=True))
+        if hash_stream:
+            threads.append(threading.Thread(target=pump_hashes, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        process.wait()
+        info["returncode"] = process.returncode
+        for duplicate_filter in filters:
+            duplicate_filter.finish()
+        if filters:
+            info["duplicates"] = filters[0].duplicates
+
+        if pump_errors:
+            discard_all()
+            return result(False, f"Error reading thumbnails from FFmpeg: {pump_errors[0]}")
+
+        if process.returncode != 0:
+            stderr_output = ''.join(stderr_tail) or "(no stderr)"
+            error_msg = f"FFmpeg failed (code {process.returncode}): {stderr_output[-500:]}..." # Limit error length
+            print(f"[BIF] {error_msg}")
+            sys.stdout.flush()
+            discard_all()
+            return result(False, error_msg)
+
+        image_count = len(writers[0])
+        if not image_count or any(len(writer) != image_count for writer in writers):
+            print(f"[BIF] FFmpeg completed but thumbnails are missing ({[len(w) for w in writers]}). "
+                  f"Stderr: {''.join(stderr_tail)[-500:]}...")
+            sys.stdout.flush()
+            discard_all()
+            return result(False, "No thumbnails were generated by FFmpeg.")
 
-def generate_bif(video_path: str, bif_path: str, interval: int = 1, width: int = 480):
+        if pts_timestamps:
+            if len(pts_times) == image_count:
+                for writer in writers:
+                    writer.set_timestamps([max(0, round(t * 1000)) for t in pts_times])
+            else:
+                print(f"[BIF] Got {len(pts_times)} PTS values for {image_count} thumbnails, falling back to approximate timestamps")
+                sys.stdout.flush()
+                info["timestamps"] = "approximate"
+        for writer in writers:
+            writer.close()
+            print(f"[BIF] Successfully created BIF file with {image_count} thumbnails: {writer.bif_path}")
+        sys.stdout.flush()
+        info["frames"] = image_count
+        return result(True, None)
+    except BaseException:
+        discard_all()
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+        raise
+    finally:
+        for stream in streams + [hash_stream]:
+            if stream is not None:
+                stream.close()
+
+def resolve_bif_workers(workers) -> int:
+    """Number of parallel BIF workers; 0 or None means the CPU count of the container's cgroup."""
+    if not workers:
+        return available_cpu_count()
+    return max(1, int(workers))
+
+def _slice_ranges(duration, interval: int, workers: int):
+    """Splits [0, duration) into up to `workers` ranges whose starts lie on the thumbnail grid."""
+    count = max(1, min(workers, int(duration // MIN_SLICE_SECONDS)))
+    steps = int(math.ceil(duration / interval))
+    ranges = []
+    for k in range(count):
+        start = steps * k // count * interval
+        end = steps * (k + 1) // count * interval
+        if end > start:
+            ranges.append((start, end))
+    return ranges
+
+def _render_bif_slice(video_path: str, start, end, interval: int, width: int, mode: str, segment_path: str):
+    """
+    Thread-pool worker: renders the thumbnails of [start, end) with a seeked,
+    single-threaded FFmpeg and writes the JPEGs back to back into segment_path.
+
+    Returns:
+        list: [(absolute timestamp_ms, image size), ...], None if failed.
+        str: Error message if failed, None otherwise.
+    """
+    ffmpeg_cmd = [
+        'ffmpeg',
+        '-threads', '1',
+        *thumbnail_input_args(mode),
+        '-ss', str(start), # Input seeking: decoding starts at the keyframe before start
+        '-t', str(end - start + interval), # One extra interval so the fps filter does not drop the last slot
+        '-i', video_path,
+        '-threads', '1',
+        *thumbnail_output_args('pipe:1', interval, width, mode)
+    ]
+    sizes = []
+    with open(segment_path, 'wb') as segment, tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=stderr_file, startupinfo=_startupinfo())
+        for image_data in iter_jpeg_frames(process.stdout):
+            segment.write(image_data)
+            sizes.append(len(image_data))
+        process.wait()
+        stderr_file.seek(0)
+        stderr_output = stderr_file.read().decode('utf-8', errors='ignore')
+
+    if process.returncode != 0:
+        return None, f"FFmpeg failed on slice {start}-{end}s (code {process.returncode}): {stderr_output[-300:]}"
+    if mode == BIF_MODE_KEYFRAME:
+        pts_times = [float(t) for t in SHOWINFO_PTS_RE.findall(stderr_output)]
+        if len(pts_times) != len(sizes):
+            return None, f"Got {len(pts_times)} PTS values for {len(sizes)} thumbnails on slice {start}-{end}s"
+        # Timestamps restart at 0 after an input seek
+        times = [start + t for t in pts_times]
+    else:
+        times = [start + i * interval for i in range(len(sizes))]
+    return [(max(0, round(t * 1000)), size) for t, size in zip(times, sizes)], None
+
+def _generate_bif_parallel(video_path: str, bif_path: str, interval: int, width: int, duration, mode: str, workers: int,
+                           info: dict):
+    """
+    Renders the time slices concurrently and merges them into one BIF.
+
+    Each slice is its own FFmpeg process driven from a worker thread; the
+    threads only split the JPEG stream, so no Python processes are forked
+    from the (multithreaded) server.
+
+    Slices are merged in order and a frame is kept only if its timestamp is
+    inside its own slice and later than the previous one, so frames where the
+    slices meet are not duplicated and the index stays monotonic.
+
+    The slice count and frame count are recorded in info.
+
+    Returns:
+        bool: True if successful, False otherwise.
+        str: Error message if failed, None otherwise.
+    """
+    ranges = _slice_ranges(duration, interval, workers)
+    info["workers"] = len(ranges)
+    temp_dir = tempfile.mkdtemp(prefix="bif_slices_")
+    writer = None
+    try:
+        segment_paths = [os.path.join(temp_dir, f"{k}.mjpeg") for k in range(len(ranges))]
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="bif_slice") as pool:
+            futures = [pool.submit(_render_bif_slice, video_path, start, end, interval, width, mode, segment_path)
+                       for (start, end), segment_path in zip(ranges, segment_paths)]
+            results = [future.result() for future in futures]
+        for _, error_msg in results:
+            if error_msg:
+                return False, error_msg
+
+        writer = BifWriter(bif_path, estimate_frame_count(duration, interval))
+        last_timestamp = -1
+        for (start, end), segment_path, (frames, _) in zip(ranges, segment_paths, results):
+            with open(segment_path, 'rb') as segment:
+                for timestamp_ms, size in frames:
+                    image_data = segment.read(size)
+                    if timestamp_ms <= last_timestamp or timestamp_ms >= end * 1000:
+                        continue
+                    writer.add(timestamp_ms, image_data)
+                    last_timestamp = timestamp_ms
+        if not len(writer):
+            writer.discard()
+            return False, "No thumbnails were generated by FFmpeg."
+        image_count = len(writer)
+        writer.close()
+        info["frames"] = image_count
+        print(f"[BIF] Successfully created BIF file with {image_count} thumbnails from {len(ranges)} slices: {bif_path}")
+        sys.stdout.flush()
+        return True, None
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def generate_bif(video_path: str, bif_path: str, interval: int = 1, width: int = 480, duration=None,
+                 mode: str = BIF_MODE_FULL, workers: int = 1, dedupe_threshold=None, return_info: bool = False):
     """
     Generates a BIF file from a video file using FFmpeg.
 
+    Thumbnails are read from FFmpeg's stdout and appended to the BIF as they
+    arrive, so no temp files are written and peak memory is about one frame.
+
     Args:
         video_path: Path to the input video file.
         bif_path: Path where the output BIF file will be saved.
         interval: Interval between keyframes in seconds.
         width: Width of the thumbnail images.
+        duration: Video duration in seconds, used to reserve the index table
+                  (probed with ffprobe when omitted).
+        mode: 'full' decodes every frame; 'keyframe' decodes keyframes only and
+              uses each frame's PTS as its timestamp.
+        workers: Split the duration into this many time slices rendered by
+                 parallel FFmpeg processes (0 = the cgroup's CPU count, 1 = off).
+        dedupe_threshold: Store near-identical consecutive thumbnails only once
+                          (see generate_bifs); not combined with workers.
+        return_info: Also return a dict with the mode, frame count and elapsed time.
 
     Returns:
         bool: True if successful, False otherwise.
         str: Error message if failed, None otherwise.
+        dict: Only when return_info is True.
     """
-    temp_dir = None
+    start_time = time.time()
+    info = {"mode": mode, "frames": 0, "elapsed": 0.0}
+
+    def result(success, error):
+        return (success, error, info) if return_info else (success, error)
+
     try:
+        if mode not in BIF_MODES:
+            return result(False, f"Unsupported BIF mode: {mode}")
         if not os.path.exists(video_path):
-            return False, f"Video file not found: {video_path}"
+            return result(False, f"Video file not found: {video_path}")
 
-        os.makedirs(os.path.dirname(bif_path), exist_ok=True)
-        temp_dir = tempfile.mkdtemp(prefix="bif_thumbnails_")
-        print(f"[BIF] Created temp directory: {temp_dir}")
-        sys.stdout.flush() # <-- 添加刷新
+        if duration is None:
+            duration = probe_duration(video_path)
+
+        if dedupe_threshold is not None:
+            return generate_bifs(video_path, [(width, bif_path)], interval, duration, mode,
+                                 dedupe_threshold=dedupe_threshold, return_info=return_info)
 
-        # --- Step 1: Extract thumbnails using FFmpeg ---
+        workers = resolve_bif_workers(workers)
+        if workers > 1 and duration and duration >= 2 * MIN_SLICE_SECONDS:
+            print(f"[BIF] Rendering {duration:.0f}s of thumbnails with up to {workers} parallel FFmpeg workers")
+            sys.stdout.flush()
+            success, error_msg = _generate_bif_parallel(video_path, bif_path, interval, width, duration, mode, workers, info)
+            if success:
+                info["timestamps"] = "pts" if mode == BIF_MODE_KEYFRAME else "approximate"
+                info["elapsed"] = round(time.time() - start_time, 2)
+                return result(True, None)
+            info["workers"] = 1
+            print(f"[BIF] Parallel generation failed, retrying with a single FFmpeg process: {error_msg}")
+            sys.stdout.flush()
+
+        # --- Extract thumbnails using FFmpeg and stream them into the BIF ---
         ffmpeg_cmd = [
             'ffmpeg',
+            *thumbnail_input_args(mode),
             '-i', video_path,
-            '-an', '-sn', # No audio, no subtitles
-            '-vf', f"select='eq(pict_type,I)',fps=1/{interval},scale={width}:-1",
-            '-vsync', 'vfr',
-            os.path.join(temp_dir, 'thumb-%05d.jpg') # Use more digits for longer videos
+            *thumbnail_output_args('pipe:1', interval, width, mode)
         ]
         print(f"[BIF] Running FFmpeg command: {' '.join(ffmpeg_cmd)}")
         sys.stdout.flush() # <-- 添加刷新
-        # Use startupinfo on Windows to hide console window
-        startupinfo = None
-        if os.name == 'nt':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        process = subprocess.run(ffmpeg_cmd, capture_output=True, text=True, check=False, startupinfo=startupinfo, encoding='utf-8', errors='ignore')
-
-
-        if process.returncode != 0:
-            # Try to decode stderr even if there were errors
-            stderr_output = process.stderr if process.stderr else "(no stderr)"
-            error_msg = f"FFmpeg failed (code {process.returncode}): {stderr_output[:500]}..." # Limit error length
-            print(f"[BIF] {error_msg}")
-            sys.stdout.flush() # <-- 添加刷新
-            return False, error_msg
-
-        print("[BIF] FFmpeg finished extracting thumbnails.")
-        sys.stdout.flush() # <-- 添加刷新
-
-        # --- Step 2: Find generated thumbnails and get timestamps (approximate) ---
-        thumbnail_files = sorted(glob.glob(os.path.join(temp_dir, 'thumb-*.jpg')))
-        if not thumbnail_files:
-             # Check FFmpeg output again in case of silent failure
-             stderr_output = process.stderr if process.stderr else "(no stderr)"
-             stdout_output = process.stdout if process.stdout else "(no stdout)"
-             print(f"[BIF] FFmpeg completed but no thumbnails found. Stdout: {stdout_output[:200]}... Stderr: {stderr_output[:500]}...")
-             sys.stdout.flush() # <-- 添加刷新
-             return False, "No thumbnails were generated by FFmpeg."
-
-        print(f"[BIF] Found {len(thumbnail_files)} thumbnails.")
-        sys.stdout.flush() # <-- 添加刷新
 
-        timestamps_ms = []
-        images_data = []
-        # Approximate timestamp calculation
-        for i, thumb_path in enumerate(thumbnail_files):
-             ts_ms = i * interval * 1000
-             timestamps_ms.append(ts_ms)
-             try:
-                 with open(thumb_path, 'rb') as f_thumb:
-                     images_data.append(f_thumb.read())
-             except IOError as e:
-                 print(f"[BIF] Failed to read thumbnail {thumb_path}: {e}") # <-- 错误日志也要刷新
-                 sys.stdout.flush()
-                 return False, f"Failed to read thumbnail {thumb_path}: {e}"
-
-
-        # --- Step 3: Assemble the BIF file ---
-        image_count = len(thumbnail_files)
-        index_entry_size = 8 # 4 bytes timestamp + 4 bytes offset
-        header_size = 64
-        index_size = (image_count + 1) * index_entry_size # +1 for the terminator
-        first_image_offset = header_size + index_size
-
-        offsets = []
-        current_offset = first_image_offset
-
-        with open(bif_path, 'wb') as f_bif:
-            # Write Header (Little-Endian)
-            f_bif.write(b'\x89BIF\r\n\x1a\n')          # Magic number (8 bytes)
-            f_bif.write(struct.pack('<I', 0))              # Version (4 bytes)
-            f_bif.write(struct.pack('<I', image_count))     # Number of images (4 bytes)
-            f_bif.write(struct.pack('<I', 1000))           # Timestamp multiplier (ms) (4 bytes)
-            f_bif.write(b'\x00' * 44)                      # Reserved (44 bytes)
-
-            # Pre-calculate offsets before writing index
-            for img_data in images_data:
-                offsets.append(current_offset)
-                current_offset += len(img_data)
-
-            # Write Index Table
-            for i in range(image_count):
-                f_bif.write(struct.pack('<I', timestamps_ms[i])) # Timestamp (ms)
-                f_bif.write(struct.pack('<I', offsets[i]))       # Offset
-
-            # Write Terminator Entry
-            f_bif.write(struct.pack('<I', 0xFFFFFFFF)) # Terminator timestamp
-            f_bif.write(struct.pack('<I', current_offset)) # Offset *after* last image data
-
-            # Write Image Data
-            f_bif.seek(first_image_offset)
-            for img_data in images_data:
-                f_bif.write(img_data)
-
-        print(f"[BIF] Successfully created BIF file: {bif_path}")
-        sys.stdout.flush() # <-- 添加刷新
-        return True, None
+        success, error_msg, stream_info = stream_bif_from_command(
+            ffmpeg_cmd, bif_path, interval, estimate_frame_count(duration, interval),
+            pts_timestamps=(mode == BIF_MODE_KEYFRAME), return_info=True
+        )
+        info.update(stream_info)
+        return result(success, error_msg)
 
     except FileNotFoundError:
         error_msg = "FFmpeg command not found. Please ensure FFmpeg is installed and in your system's PATH."
         print(f"[BIF] {error_msg}")
         sys.stdout.flush() # <-- 添加刷新
-        return False, error_msg
+        return result(False, error_msg)
     except Exception as e:
         error_msg = f"Error generating BIF file: {e}"
         print(f"[BIF] {error_msg}")
@@ -144,15 +772,234 @@ def generate_bif(video_path: str, bif_path: str, interval: int = 1, width: int =
         import traceback
         traceback.print_exc()
         sys.stdout.flush() # <-- 添加刷新
-        return False, error_msg
+        return result(False, error_msg)
+
+def generate_bifs(video_path: str, targets, interval: int = 1, duration=None, mode: str = BIF_MODE_FULL,
+                  dedupe_threshold=None, return_info: bool = False):
+    """
+    Generates several BIF files of different widths (e.g. SD and HD trick-play)
+    from a single decode of the video.
+
+    The first target is written to FFmpeg's stdout, every other one to its own
+    pipe handed to FFmpeg by file descriptor. Where descriptors cannot be passed
+    (Windows) each width is generated by its own generate_bif run.
+
+    Args:
+        targets: [(width, bif_path), ...]
+        dedupe_threshold: When set, near-identical consecutive thumbnails (dHash
+                          distance up to this many bits) are stored only once.
+
+    Returns:
+        bool: True if every BIF was written, False otherwise.
+        str: Error message if failed, None otherwise.
+        dict: Only when return_info is True.
+    """
+    targets = list(targets)
+    info = {"mode": mode, "frames": 0, "elapsed": 0.0, "widths": [width for width, _ in targets]}
+
+    def result(success, error):
+        return (success, error, info) if return_info else (success, error)
 
+    if not targets:
+        return result(False, "No BIF targets given")
+    if dedupe_threshold is not None and os.name == 'nt':
+        print("[BIF] Duplicate thumbnail elimination needs an extra pipe and is not available on Windows")
+        sys.stdout.flush()
+        dedupe_threshold = None
+    if (len(targets) == 1 and dedupe_threshold is None) or os.name == 'nt':
+        start_time = time.time()
+        for width, bif_path in targets:
+            success, error_msg, single_info = generate_bif(video_path, bif_path, interval, width, duration=duration,
+                                                           mode=mode, return_info=True)
+            if not success:
+                return result(False, error_msg)
+            info["frames"] = single_info["frames"]
+        info["elapsed"] = round(time.time() - start_time, 2)
+        return result(True, None)
+
+    pipes = []
+    hash_fds = None
+    try:
+        if mode not in BIF_MODES:
+            return result(False, f"Unsupported BIF mode: {mode}")
+        if not os.path.exists(video_path):
+            return result(False, f"Video file not found: {video_path}")
+
+        if duration is None:
+            duration = probe_duration(video_path)
+
+        pipes = [os.pipe() for _ in targets[1:]]
+        pipe_outputs = ['pipe:1'] + [f"pipe:{write_fd}" for _, write_fd in pipes]
+        hash_output = None
+        if dedupe_threshold is not None:
+            hash_fds = os.pipe()
+            hash_output = f"pipe:{hash_fds[1]}"
+        ffmpeg_cmd = [
+            'ffmpeg',
+            *thumbnail_input_args(mode),
+            '-i', video_path,
+            *multi_thumbnail_output_args(pipe_outputs, interval, [width for width, _ in targets], mode, hash_output)
+        ]
+        print(f"[BIF] Running FFmpeg command: {' '.join(ffmpeg_cmd)}")
+        sys.stdout.flush()
+
+        outputs = [(targets[0][1], None)] + [(bif_path, fds) for (_, bif_path), fds in zip(targets[1:], pipes)]
+        pending_hash_fds, pipes, hash_fds = hash_fds, [], None # Closed by stream_bifs_from_command from here on
+        success, error_msg, stream_info = stream_bifs_from_command(
+            ffmpeg_cmd, outputs, interval, estimate_frame_count(duration, interval),
+            pts_timestamps=(mode == BIF_MODE_KEYFRAME), hash_fds=pending_hash_fds,
+            dedupe_threshold=dedupe_threshold or 0, return_info=True
+        )
+        info.update(stream_info)
+        return result(success, error_msg)
+
+    except FileNotFoundError:
+        error_msg = "FFmpeg command not found. Please ensure FFmpeg is installed and in your system's PATH."
+        print(f"[BIF] {error_msg}")
+        sys.stdout.flush()
+        return result(False, error_msg)
+    except Exception as e:
+        error_msg = f"Error generating BIF files: {e}"
+        print(f"[BIF] {error_msg}")
+        sys.stdout.flush()
+        return result(False, error_msg)
     finally:
-        # --- Step 4: Cleanup ---
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-                print(f"[BIF] Removed temp directory: {temp_dir}")
-                sys.stdout.flush() # <-- 添加刷新
-            except Exception as e:
-                print(f"[BIF] Warning: Failed to remove temp directory {temp_dir}: {e}")
-                sys.stdout.flush() # <-- 添加刷新 
\ No newline at end of file
+        for read_fd, write_fd in pipes + ([hash_fds] if hash_fds else []):
+            os.close(read_fd)
+            os.close(write_fd)
+
+def compare_bif_modes(video_path: str, interval: int = 1, width: int = 480, duration=None):
+    """
+    Generates a throwaway BIF with each mode and reports how long each took,
+    so the faster mode can be chosen per library.
+
+    Returns:
+        dict: {"full": {...}, "keyframe": {...}, "speedup": full / keyframe elapsed}
+    """
+    if duration is None:
+        duration = probe_duration(video_path)
+    temp_dir = tempfile.mkdtemp(prefix="bif_compare_")
+    comparison = {}
+    try:
+        for mode in BIF_MODES:
+            success, error_msg, info = generate_bif(video_path, os.path.join(temp_dir, f"{mode}.bif"), interval, width,
+                                                    duration=duration, mode=mode, return_info=True)
+            comparison[mode] = {"success": success, "elapsed": info["elapsed"], "frames": info["frames"]}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    keyframe_elapsed = comparison[BIF_MODE_KEYFRAME]["elapsed"]
+    if comparison[BIF_MODE_FULL]["success"] and comparison[BIF_MODE_KEYFRAME]["success"] and keyframe_elapsed > 0:
+        comparison["speedup"] = round(comparison[BIF_MODE_FULL]["elapsed"] / keyframe_elapsed, 2)
+    print(f"[BIF] Mode comparison: {comparison}")
+    sys.stdout.flush()
+    return comparison
+
+def _videoshot_timestamps(index, tile_count):
+    """
+    Normalises the videoshot timestamp index (seconds) to one entry per tile.
+
+    The index usually starts with an extra leading 0 before the first tile's
+    own 0 timestamp; it is dropped when present.
+    """
+    timestamps = list(index or [])
+    if len(timestamps) > 1 and timestamps[0] == 0 and timestamps[1] == 0:
+        timestamps = timestamps[1:]
+    return timestamps[:tile_count]
+
+def _slice_sprite(sprite_data: bytes, columns: int, rows: int):
+    """Splits one sprite sheet into its tiles with FFmpeg's untile filter, yielding JPEG bytes."""
+    ffmpeg_cmd = [
+        'ffmpeg',
+        '-f', 'image2pipe',
+        '-i', 'pipe:0',
+        '-vf', f"untile={columns}x{rows}",
+        '-vsync', 'passthrough',
+        '-f', 'image2pipe',
+        '-c:v', 'mjpeg',
+        '-q:v', '2',
+        'pipe:1'
+    ]
+    process = subprocess.run(ffmpeg_cmd, input=sprite_data, capture_output=True, check=False, startupinfo=_startupinfo())
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed to slice sprite (code {process.returncode}): "
+                           f"{process.stderr.decode('utf-8', errors='ignore')[-300:]}")
+    return iter_jpeg_frames(io.BytesIO(process.stdout))
+
+def generate_bif_from_videoshot(bv_id: str, cid, bif_path: str, headers=None, return_info: bool = False):
+    """
+    Builds a BIF from the storyboard sprite sheets served by Bilibili's videoshot API.
+
+    Only a handful of sprite JPEGs are downloaded and sliced, no video is needed,
+    so this also works for audio-only tasks. Thumbnails keep the sprite's native
+    tile size.
+
+    Returns:
+        bool: True if successful, False otherwise (e.g. the video has no sprites).
+        str: Error message if failed, None otherwise.
+        dict: Only when return_info is True.
+    """
+    start_time = time.time()
+    info = {"mode": "videoshot", "frames": 0, "elapsed": 0.0, "sprites": 0}
+
+    def result(success, error):
+        info["elapsed"] = round(time.time() - start_time, 2)
+        return (success, error, info) if return_info else (success, error)
+
+    try:
+        response = bili_api_get(VIDEOSHOT_API.format(bv_id=bv_id, cid=cid), headers=headers)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("code") != 0:
+            return result(False, f"videoshot API error: {data.get('message')}")
+
+        shot = data.get("data") or {}
+        sprite_urls = shot.get("image") or []
+        columns = shot.get("img_x_len") or 0
+        rows = shot.get("img_y_len") or 0
+        if not sprite_urls or not columns or not rows:
+            return result(False, "No videoshot sprites available for this video")
+
+        tiles_per_sprite = columns * rows
+        timestamps = _videoshot_timestamps(shot.get("index"), tiles_per_sprite * len(sprite_urls))
+        if not timestamps:
+            return result(False, "videoshot response has no timestamp index")
+
+        print(f"[BIF] Building BIF from {len(sprite_urls)} videoshot sprites ({columns}x{rows} tiles, {len(timestamps)} thumbnails)")
+        sys.stdout.flush()
+
+        writer = BifWriter(bif_path, len(timestamps))
+        try:
+            for sprite_number, sprite_url in enumerate(sprite_urls):
+                first_tile = sprite_number * tiles_per_sprite
+                if first_tile >= len(timestamps):
+                    break
+                if sprite_url.startswith("//"):
+                    sprite_url = "https:" + sprite_url
+                sprite_response = get_session().get(sprite_url, headers=headers)
+                sprite_response.raise_for_status()
+                info["sprites"] += 1
+
+                for tile_number, image_data in enumerate(_slice_sprite(sprite_response.content, columns, rows)):
+                    # The last sprite is usually only partly filled
+                    if first_tile + tile_number >= len(timestamps):
+                        break
+                    writer.add(timestamps[first_tile + tile_number] * 1000, image_data)
+
+            if not len(writer):
+                writer.discard()
+                return result(False, "No thumbnails could be sliced from the videoshot sprites")
+            info["frames"] = len(writer)
+            writer.close()
+        except BaseException:
+            writer.discard()
+            raise
+
+        print(f"[BIF] Successfully created BIF file from videoshot sprites with {info['frames']} thumbnails: {bif_path}")
+        sys.stdout.flush()
+        return result(True, None)
+
+    except Exception as e:
+        error_msg = f"Error generating BIF from videoshot: {e}"
+        print(f"[BIF] {error_msg}")
+        sys.stdout.flush()
+        return result(False, error_msg)
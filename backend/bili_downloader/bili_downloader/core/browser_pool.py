@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import queue
+import threading
+import importlib.util
+from ..config.config_manager import load_config
+
+DEFAULT_BROWSER_POOL = {
+    "size": 2,  # 常驻浏览器数量，同时也是同时打开页面数的上限
+    "idle_timeout": 300,  # 浏览器空闲超过该时长(秒)后关闭，下次使用时再启动
+    "headless": True,
+    "block_resources": True,
+    "job_timeout": 170  # 单个任务的期限(秒)，略小于字幕子进程的期限
+}
+
+# 精简的 Firefox 配置：不自动播放、不缓存媒体、不预取，减少每个页面的内存和带宽
+LIGHTWEIGHT_FIREFOX_PREFS = {
+    "media.autoplay.default": 5,
+    "media.cache_size": 0,
+    "permissions.default.image": 2,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "browser.cache.disk.enable": False,
+    "dom.webnotifications.enabled": False
+}
+
+# Playwright 同步API的对象只能在创建它的线程中使用，
+# 所以每个常驻浏览器由一个专属工作线程持有，任务通过队列交给这些线程执行
+
+class _Job:
+    def __init__(self, func):
+        self.func = func
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False  # 调用方已超时放弃，尚未开始的任务直接跳过
+        self.worker = None  # 正在执行该任务的工作线程
+
+class BrowserPool:
+    """常驻的 Playwright Firefox 浏览器池
+
+    每个任务在一个已启动的浏览器上执行，由任务自己创建新的上下文，
+    避免每次调用都启动和关闭整个浏览器。执行前检查浏览器是否仍然连接，
+    崩溃的浏览器会被重新启动；空闲超时后工作线程关闭浏览器并退出。
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.retired = set()  # 任务超时后不再接收新任务的工作线程
+        self.started_workers = 0
+        self.idle_workers = 0
+        self.live_browsers = 0
+        self.stats = {
+            "jobs": 0,
+            "launches": 0,
+            "launches_avoided": 0,
+            "recycled": 0,
+            "timeouts": 0,
+            "context_wait_total": 0.0,
+            "context_wait_max": 0.0
+        }
+
+    def run(self, func, timeout=None):
+        """在池中的某个浏览器上执行 func(browser)，阻塞直到完成或超过 timeout 秒
+
+        返回 func 的返回值；func 抛出的异常 (包括浏览器启动失败) 会在调用线程中重新抛出。
+        超时抛出 TimeoutError，执行该任务的工作线程被移出池，等 func 返回后关闭浏览器退出，
+        池中会另外启动新的工作线程。
+        """
+        # 未安装时直接在调用线程抛出 ImportError，而不是在工作线程中失败
+        if importlib.util.find_spec("playwright") is None:
+            raise ImportError("No module named 'playwright'")
+
+        if timeout is None:
+            timeout = self.settings["job_timeout"]
+        job = _Job(func)
+        self.jobs.put(job)
+        self._ensure_worker()
+        if not job.done.wait(timeout):
+            with self.lock:
+                job.abandoned = True
+                self.stats["timeouts"] += 1
+                if job.worker is not None:
+                    # 线程无法被强制结束，只能让它不再接收新任务
+                    self.retired.add(job.worker)
+                    self.workers = [worker for worker in self.workers if worker is not job.worker]
+            name = job.worker.name if job.worker is not None else "排队中"
+            print(f"[浏览器池] 任务超过 {timeout} 秒未完成，退役工作线程 ({name})")
+            sys.stdout.flush()
+            raise TimeoutError(f"浏览器任务超过 {timeout} 秒未完成")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _ensure_worker(self):
+        with self.lock:
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            if self.idle_workers < self.jobs.qsize() and len(self.workers) < max(1, int(self.settings["size"])):
+                self.started_workers += 1
+                worker = threading.Thread(target=self._worker_loop, name=f"browser-pool-{self.started_workers}", daemon=True)
+                self.workers.append(worker)
+                # 新线程启动前就计为空闲，避免并发提交的任务重复创建线程
+                self.idle_workers += 1
+                worker.start()
+
+    def _launch(self, playwright):
+        prefs = LIGHTWEIGHT_FIREFOX_PREFS if self.settings.get("block_resources", True) else None
+        browser = playwright.firefox.launch(headless=self.settings["headless"], firefox_user_prefs=prefs)
+        with self.lock:
+            self.stats["launches"] += 1
+            self.live_browsers += 1
+        print(f"[浏览器池] 已启动浏览器 ({threading.current_thread().name})")
+        sys.stdout.flush()
+        return browser
+
+    def _close(self, browser):
+        try:
+            browser.close()
+        except Exception as e:
+            print(f"[浏览器池] 关闭浏览器出错: {e}")
+        with self.lock:
+            self.live_browsers -= 1
+
+    def _worker_loop(self):
+        from playwright.sync_api import sync_playwright
+
+        playwright = None
+        browser = None
+        try:
+            while True:
+                try:
+                    job = self.jobs.get(timeout=self.settings["idle_timeout"])
+                except queue.Empty:
+                    with self.lock:
+                        # 超时与新任务提交可能同时发生，队列非空时继续服务
+                        if self.jobs.empty():
+                            self.idle_workers -= 1
+                            break
+                    continue
+
+                with self.lock:
+                    if job.abandoned:
+                        continue
+                    job.worker = threading.current_thread()
+                    self.idle_workers -= 1
+                    wait = time.monotonic() - job.created
+                    self.stats["jobs"] += 1
+                    self.stats["context_wait_total"] += wait
+                    self.stats["context_wait_max"] = max(self.stats["context_wait_max"], wait)
+                try:
+                    if playwright is None:
+                        playwright = sync_playwright().start()
+                    if browser is not None and not browser.is_connected():
+                        print("[浏览器池] 浏览器已断开，重新启动")
+                        sys.stdout.flush()
+                        with self.lock:
+                            self.stats["recycled"] += 1
+                        self._close(browser)
+                        browser = None
+                    if browser is None:
+                        browser = self._launch(playwright)
+                    else:
+                        with self.lock:
+                            self.stats["launches_avoided"] += 1
+                    job.result = job.func(browser)
+                except BaseException as e:
+                    job.error = e
+                finally:
+                    job.done.set()
+                    with self.lock:
+                        retired = threading.current_thread() in self.retired
+                        self.retired.discard(threading.current_thread())
+                        if not retired:
+                            self.idle_workers += 1
+                if retired:
+                    break
+        finally:
+            if browser is not None:
+                self._close(browser)
+            if playwright is not None:
+                try:
+                    playwright.stop()
+                except Exception as e:
+                    print(f"[浏览器池] 停止 Playwright 出错: {e}")
+            print(f"[浏览器池] 工作线程退出 ({threading.current_thread().name})")
+            sys.stdout.flush()
+
+    def get_stats(self):
+        with self.lock:
+            jobs = self.stats["jobs"]
+            return {
+                "size": self.live_browsers,
+                "max_size": self.settings["size"],
+                "workers": len([worker for worker in self.workers if worker.is_alive()]),
+                "queued": self.jobs.qsize(),
+                "jobs": jobs,
+                "launches": self.stats["launches"],
+                "launches_avoided": self.stats["launches_avoided"],
+                "recycled": self.stats["recycled"],
+                "timeouts": self.stats["timeouts"],
+                "avg_context_wait": round(self.stats["context_wait_total"] / jobs, 3) if jobs else 0.0,
+                "max_context_wait": round(self.stats["context_wait_max"], 3)
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_browser_pool():
+    """获取进程内共享的浏览器池 (首次调用时按配置创建)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = dict(DEFAULT_BROWSER_POOL)
+                settings.update(load_config().get("browser_pool", {}))
+                _pool = BrowserPool(settings)
+    return _pool
+
+def get_browser_pool_stats():
+    """返回浏览器池的运行指标，尚未使用过时返回空的指标"""
+    if _pool is None:
+        return {"size": 0, "jobs": 0, "launches": 0, "launches_avoided": 0}
+    return _pool.get_stats()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from ..core.http_client import get_session
+
+DEFAULT_CDN = {
+    "probe": True,  # 下载前探测各镜像的速度
+    "probe_size": 256 * 1024,  # 探测时下载的字节数
+    "probe_timeout": 5,  # 单个镜像的探测超时(秒)
+    "cache_ttl": 600,  # 节点测速结果的缓存时间(秒)
+    "min_throughput": 128,  # 下载中速率低于该值(KB/s)时切换镜像，0表示不切换
+    "slow_check_interval": 5  # 检测慢速的时间窗口(秒)
+}
+
+_host_stats = {}  # host -> {"throughput": 字节/秒, "updated": 时间戳}
+_host_stats_lock = threading.Lock()
+
+def get_cdn_settings(config):
+    settings = dict(DEFAULT_CDN)
+    settings.update(config.get("cdn", {}))
+    return settings
+
+def _host(url):
+    return urlparse(url).netloc
+
+def record_throughput(url, throughput):
+    """记录某个CDN节点的实测速度 (字节/秒)，失败的节点记为0"""
+    with _host_stats_lock:
+        _host_stats[_host(url)] = {"throughput": throughput, "updated": time.time()}
+
+def _cached_throughput(url, ttl):
+    with _host_stats_lock:
+        stats = _host_stats.get(_host(url))
+    if stats and time.time() - stats["updated"] < ttl:
+        return stats["throughput"]
+    return None
+
+def _probe_mirror(url, headers, probe_size, timeout):
+    """用一次小范围Range请求测量节点速度 (包含建连和首字节时间)"""
+    probe_headers = dict(headers or {})
+    probe_headers["Range"] = f"bytes=0-{probe_size - 1}"
+    start = time.monotonic()
+    try:
+        response = get_session().get(url, headers=probe_headers, stream=True, timeout=timeout)
+        try:
+            response.raise_for_status()
+            received = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+                if received >= probe_size or time.monotonic() - start > timeout:
+                    break
+        finally:
+            response.close()
+        elapsed = max(time.monotonic() - start, 1e-3)
+        throughput = received / elapsed
+    except Exception as e:
+        print(f"[CDN] 探测节点失败 {_host(url)}: {e}")
+        throughput = 0
+    record_throughput(url, throughput)
+    return throughput
+
+def rank_mirrors(urls, headers, config):
+    """按实测速度从快到慢排列候选地址 (主地址 + backup_url)
+
+    每个CDN节点的测速结果会缓存一段时间，缓存有效的节点不再重复探测。
+    """
+    urls = [url for i, url in enumerate(urls) if url and url not in urls[:i]]
+    settings = get_cdn_settings(config)
+    if len(urls) <= 1 or not settings["probe"]:
+        return urls
+
+    scores = {}
+    to_probe = []
+    for url in urls:
+        cached = _cached_throughput(url, settings["cache_ttl"])
+        if cached is None:
+            to_probe.append(url)
+        else:
+            scores[url] = cached
+
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=len(to_probe)) as executor:
+            results = executor.map(
+                lambda u: _probe_mirror(u, headers, settings["probe_size"], settings["probe_timeout"]),
+                to_probe
+            )
+            scores.update(zip(to_probe, results))
+
+    # 排序稳定，同速节点保持API返回的顺序
+    ranked = sorted(urls, key=lambda u: -scores.get(u, 0))
+    summary = ", ".join(f"{_host(u)}={scores.get(u, 0) / 1024:.0f}KB/s" for u in ranked)
+    print(f"[CDN] 镜像测速结果: {summary}")
+    sys.stdout.flush()
+    return ranked
+
+class MirrorSet:
+    """一次下载可用的镜像列表，供各分段在慢速或断线时切换节点"""
+
+    def __init__(self, urls, min_throughput=0, slow_check_interval=5):
+        self.urls = list(urls)
+        self.min_throughput = min_throughput * 1024
+        self.slow_check_interval = slow_check_interval
+
+    def __len__(self):
+        return len(self.urls)
+
+    def url(self, index):
+        return self.urls[index % len(self.urls)]
+
+    def prefer(self, index):
+        """把指定镜像移到列表最前面"""
+        self.urls.insert(0, self.urls.pop(index % len(self.urls)))
+
+    def should_switch(self, throughput):
+        """当前节点速率低于阈值且还有其他镜像时需要切换"""
+        return len(self.urls) > 1 and self.min_throughput > 0 and throughput < self.min_throughput
+
+    def switch(self, index, reason, throughput=0):
+        """从 index 切换到下一个镜像，返回新的下标，并记录当前节点的实测速度"""
+        record_throughput(self.url(index), throughput)
+        if len(self.urls) <= 1:
+            return index
+        new_index = (index + 1) % len(self.urls)
+        print(f"[CDN] {reason}，从 {_host(self.url(index))} 切换到 {_host(self.url(new_index))}")
+        sys.stdout.flush()
+        return new_index
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ..config.config_manager import get_download_path
+from ..core.rate_limiter import bili_api_get
+
+DANMAKU_SEG_API = "https://api.bilibili.com/x/v2/dm/web/seg.so"
+SEGMENT_SECONDS = 360  # 每个分段包含6分钟的弹幕
+
+DEFAULT_DANMAKU = {
+    "segment_workers": 4,  # 并行下载的分段数
+    "font_name": "Microsoft YaHei",
+    "font_size": 50,  # 1080P 下标准字号(25)弹幕的字号
+    "opacity": 0.8,  # 弹幕不透明度
+    "scroll_duration": 8,  # 滚动弹幕从右到左经过屏幕的时长(秒)
+    "fixed_duration": 4  # 顶部、底部弹幕的停留时长(秒)
+}
+
+PLAY_RES_X = 1920
+PLAY_RES_Y = 1080
+
+# DanmakuElem.mode: 1-3 滚动，4 底部，5 顶部，6 逆向；7 高级、8 代码、9 BAS 弹幕无法转换为ASS
+MODE_SCROLL = (1, 2, 3, 6)
+MODE_BOTTOM = 4
+MODE_TOP = 5
+
+# seg.so 返回 DmSegMobileReply 的 protobuf 编码：字段1为重复的 DanmakuElem。
+# 这里只用到少数几个字段，直接按 wire format 解码，不依赖 protobuf 库
+ELEM_INT_FIELDS = {2: "progress", 3: "mode", 4: "fontsize", 5: "color"}
+ELEM_STR_FIELDS = {7: "content"}
+
+def _read_varint(data, pos):
+    """从 pos 处读取一个 varint，返回 (值, 新位置)；数据不完整时抛出 IndexError"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def _skip_field(data, pos, wire_type):
+    """跳过一个不需要的字段，返回新位置"""
+    if wire_type == 0:
+        return _read_varint(data, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = _read_varint(data, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError(f"不支持的 protobuf wire type: {wire_type}")
+
+def decode_danmaku_elem(data):
+    """解码一条 DanmakuElem，返回只包含排版所需字段的字典"""
+    elem = {"progress": 0, "mode": 1, "fontsize": 25, "color": 0xFFFFFF, "content": ""}
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if field in ELEM_INT_FIELDS and wire_type == 0:
+            elem[ELEM_INT_FIELDS[field]], pos = _read_varint(data, pos)
+        elif field in ELEM_STR_FIELDS and wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            elem[ELEM_STR_FIELDS[field]] = bytes(data[pos:pos + length]).decode("utf-8", errors="replace")
+            pos += length
+        else:
+            pos = _skip_field(data, pos, wire_type)
+    return elem
+
+def iter_danmaku_elems(chunks):
+    """从 seg.so 响应的数据块中逐条解码 DanmakuElem
+
+    只缓存尚未凑齐的一条弹幕，已解码的数据随即丢弃。
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        pos = 0
+        while pos < len(buffer):
+            try:
+                key, value_pos = _read_varint(buffer, pos)
+                if key & 0x07 == 2:
+                    length, value_pos = _read_varint(buffer, value_pos)
+                    next_pos = value_pos + length
+                else:
+                    next_pos = _skip_field(buffer, value_pos, key & 0x07)
+            except IndexError:
+                break
+            if next_pos > len(buffer):
+                break
+            if key == (1 << 3 | 2):
+                yield decode_danmaku_elem(bytes(buffer[value_pos:next_pos]))
+            pos = next_pos
+        del buffer[:pos]
+    if buffer:
+        raise ValueError(f"弹幕分段数据不完整，剩余 {len(buffer)} 字节")
+
+def _fetch_segment(cid, index, headers):
+    """下载并解码一个弹幕分段，返回按出现时间排序的弹幕列表"""
+    url = f"{DANMAKU_SEG_API}?type=1&oid={cid}&segment_index={index}"
+    response = bili_api_get(url, headers=headers, timeout=30, stream=True)
+    try:
+        response.raise_for_status()
+        if "json" in response.headers.get("content-type", "").lower():
+            # 出错时接口返回JSON，例如分段超出视频时长
+            data = response.json()
+            if data.get("code") not in (0, None):
+                raise ValueError(f"弹幕接口返回错误: {data.get('code')} {data.get('message')}")
+            return []
+        elems = [elem for elem in iter_danmaku_elems(response.iter_content(64 * 1024)) if elem["content"]]
+    finally:
+        response.close()
+    elems.sort(key=lambda elem: elem["progress"])
+    return elems
+
+def _ass_time(seconds):
+    """秒数转换为ASS时间格式 h:mm:ss.cc"""
+    centiseconds = int(round(seconds * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+def _ass_escape(text):
+    return (text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+            .replace("\r", "").replace("\n", "\\N"))
+
+def _text_width(text, font_size):
+    """估算文字宽度：全角字符按一个字号，半角字符按半个字号"""
+    return sum(font_size if ord(ch) > 0xFF else font_size * 0.5 for ch in text)
+
+class DanmakuLayout:
+    """为弹幕分配滚动、顶部、底部轨道
+
+    按出现时间顺序逐条处理，只保存每条轨道上最后一条弹幕的状态。
+    滚动弹幕要求前一条的尾部已经进入屏幕，并且新弹幕追不上它；
+    没有空闲轨道时放到最早空出的轨道上 (允许重叠而不是丢弃)。
+    """
+
+    def __init__(self, settings):
+        self.font_size = settings["font_size"]
+        self.scroll_duration = settings["scroll_duration"]
+        self.fixed_duration = settings["fixed_duration"]
+        self.lane_height = int(self.font_size * 1.1)
+        lane_count = max(1, PLAY_RES_Y // self.lane_height)
+        # 每条滚动轨道: (尾部完全进入屏幕的时间, 完全离开屏幕的时间)
+        self.scroll_lanes = [(0.0, 0.0)] * lane_count
+        # 每条顶部/底部轨道: 消失的时间；只占屏幕的一半，避免互相覆盖
+        self.top_lanes = [0.0] * max(1, lane_count // 2)
+        self.bottom_lanes = [0.0] * max(1, lane_count // 2)
+
+    def _scroll_lane(self, start, width):
+        speed = (PLAY_RES_X + width) / self.scroll_duration
+        arrive = start + PLAY_RES_X / speed  # 新弹幕头部到达屏幕左侧的时间
+        best = 0
+        for lane, (tail_in, exit_time) in enumerate(self.scroll_lanes):
+            if tail_in <= start and exit_time <= arrive:
+                best = lane
+                break
+            if self.scroll_lanes[lane][1] < self.scroll_lanes[best][1]:
+                best = lane
+        self.scroll_lanes[best] = (start + width / speed, start + self.scroll_duration)
+        return best
+
+    def _fixed_lane(self, lanes, start):
+        best = 0
+        for lane, end_time in enumerate(lanes):
+            if end_time <= start:
+                best = lane
+                break
+            if end_time < lanes[best]:
+                best = lane
+        lanes[best] = start + self.fixed_duration
+        return best
+
+    def dialogue(self, elem):
+        """返回一条弹幕的 ASS Dialogue 行，无法显示的弹幕返回 None"""
+        mode = elem["mode"]
+        if mode not in MODE_SCROLL and mode not in (MODE_TOP, MODE_BOTTOM):
+            return None
+        start = elem["progress"] / 1000.0
+        text = elem["content"]
+        size = int(round(self.font_size * elem["fontsize"] / 25.0))
+        overrides = []
+        if size != self.font_size:
+            overrides.append(f"\\fs{size}")
+        color = elem["color"] & 0xFFFFFF
+        if color != 0xFFFFFF:
+            overrides.append(f"\\c&H{color & 0xFF:02X}{(color >> 8) & 0xFF:02X}{color >> 16:02X}&")
+
+        if mode in MODE_SCROLL:
+            width = _text_width(text, size)
+            y = self._scroll_lane(start, width) * self.lane_height
+            if mode == 6:
+                overrides.insert(0, f"\\move({-width:.0f},{y},{PLAY_RES_X},{y})")
+            else:
+                overrides.insert(0, f"\\move({PLAY_RES_X},{y},{-width:.0f},{y})")
+            end = start + self.scroll_duration
+        elif mode == MODE_TOP:
+            y = self._fixed_lane(self.top_lanes, start) * self.lane_height
+            overrides.insert(0, f"\\an8\\pos({PLAY_RES_X // 2},{y})")
+            end = start + self.fixed_duration
+        else:
+            y = PLAY_RES_Y - self._fixed_lane(self.bottom_lanes, start) * self.lane_height
+            overrides.insert(0, f"\\an2\\pos({PLAY_RES_X // 2},{y})")
+            end = start + self.fixed_duration
+
+        return f"Dialogue: 2,{_ass_time(start)},{_ass_time(end)},Danmaku,,0,0,0,,{{{''.join(overrides)}}}{_ass_escape(text)}\n"
+
+def _ass_header(title, settings):
+    alpha = f"{int(round((1 - settings['opacity']) * 255)):02X}"
+    return (
+        "[Script Info]\n"
+        f"Title: {title}\n"
+        "ScriptType: v4.00+\n"
+        "WrapStyle: 2\n"
+        "ScaledBorderAndShadow: yes\n"
+        f"PlayResX: {PLAY_RES_X}\n"
+        f"PlayResY: {PLAY_RES_Y}\n"
+        "\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+        "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+        "MarginL, MarginR, MarginV, Encoding\n"
+        f"Style: Danmaku,{settings['font_name']},{settings['font_size']},&H{alpha}FFFFFF,&H{alpha}FFFFFF,"
+        f"&H{alpha}000000,&H{alpha}000000,0,0,0,0,100,100,0,0,1,1,0,7,0,0,0,1\n"
+        "\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+
+def download_danmaku(video_info, config, headers):
+    """下载视频的全部弹幕并转换为ASS字幕，返回 (bool, str|None)元组
+
+    各个6分钟分段并行下载，按顺序逐段排版写入，不需要先把所有弹幕读入内存。
+    """
+    bv_id = video_info["bv_id"]
+    cid = video_info.get("cid")
+    if not cid:
+        return False, "缺少 cid，无法下载弹幕"
+
+    settings = dict(DEFAULT_DANMAKU)
+    settings.update(config.get("danmaku", {}))
+    duration = video_info.get("duration") or 0
+    segment_count = max(1, -(-int(duration) // SEGMENT_SECONDS))
+    ass_path = get_download_path(config, video_info, "danmaku")
+    part_path = ass_path + ".part"
+
+    start_time = time.time()
+    written = 0
+    skipped = 0
+    layout = DanmakuLayout(settings)
+    workers = max(1, min(int(settings["segment_workers"]), segment_count))
+    print(f"开始下载弹幕: {segment_count} 个分段，{workers} 路并行")
+    sys.stdout.flush()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        # 同时最多只有 workers + 1 个分段在下载或等待写入，已下载的分段不会在内存中堆积
+        pending = deque()
+        next_index = 1
+        with open(part_path, "w", encoding="utf-8-sig") as f:
+            f.write(_ass_header(video_info.get("title", bv_id), settings))
+            # 分段按时间顺序写入，写前面的分段时后面的分段继续下载
+            while pending or next_index <= segment_count:
+                while next_index <= segment_count and len(pending) < workers + 1:
+                    pending.append(executor.submit(_fetch_segment, cid, next_index, headers))
+                    next_index += 1
+                for elem in pending.popleft().result():
+                    line = layout.dialogue(elem)
+                    if line is None:
+                        skipped += 1
+                        continue
+                    f.write(line)
+                    written += 1
+        os.replace(part_path, ass_path)
+    except Exception as e:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        print(f"下载弹幕失败: {e}")
+        sys.stdout.flush()
+        return False, f"下载弹幕失败: {str(e)[:50]}"
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    print(f"弹幕已保存到: {ass_path} ({written} 条，跳过 {skipped} 条高级/代码弹幕，耗时 {time.time() - start_time:.1f} 秒)")
+    sys.stdout.flush()
+    return True, None
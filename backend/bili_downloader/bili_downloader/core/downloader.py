@@ -1,81 +1,447 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-import requests
+import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from ..core.http_client import get_session
+from ..core import bandwidth
+from ..core.cdn import MirrorSet
 
-def download_file(url, file_path, headers=None, chunk_size=1024*1024):
+# 分段下载默认参数
+DEFAULT_SEGMENTS = 4
+DEFAULT_MIN_SEGMENT_SIZE = 4 * 1024 * 1024  # 每段至少4MB，太小的文件分段没有意义
+SEGMENT_MAX_RETRIES = 3  # 单个分段的最大重试次数
+JOURNAL_SAVE_INTERVAL = 1.0  # 续传日志的最短保存间隔(秒)
+RANGE_READ_SIZE = 256 * 1024  # 分段下载每次读取的最大字节数，读得越小越能及时发现慢速节点
+
+def _create_progress_bar(total_size, desc="下载视频: "):
+    """创建统一格式的进度条"""
+    return tqdm(
+        total=total_size,
+        unit='B',
+        unit_scale=True,
+        unit_divisor=1024,
+        desc=desc,
+        ascii=False,
+        ncols=100,
+        bar_format="{desc} |{bar}| {percentage:.1f}% - {n_fmt}/{total_fmt} ({rate_fmt})"
+    )
+
+def probe_range_support(url, headers=None):
+    """探测服务器是否支持Range请求
+
+    使用 bytes=0-0 的GET请求代替HEAD，部分CDN节点不响应HEAD请求。
+
+    返回:
+        支持Range时返回 {"url", "total_size", "etag", "last_modified"}，不支持时返回None
+    """
+    probe_headers = dict(headers or {})
+    probe_headers["Range"] = "bytes=0-0"
+
+    response = get_session().get(url, headers=probe_headers, stream=True, timeout=15)
+    try:
+        response.raise_for_status()
+
+        # 服务器忽略Range头时会返回200和完整内容
+        if response.status_code != 206:
+            return None
+
+        accept_ranges = response.headers.get("accept-ranges", "").lower()
+        if accept_ranges == "none":
+            return None
+
+        # Content-Range: bytes 0-0/123456
+        content_range = response.headers.get("content-range", "")
+        if "/" not in content_range:
+            return None
+        total = content_range.rsplit("/", 1)[1].strip()
+        if not total.isdigit():
+            return None
+        return {
+            "url": url,
+            "total_size": int(total),
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified")
+        }
+    finally:
+        response.close()
+
+class _DownloadJournal:
+    """记录 .part 文件中已完成字节区间的续传日志
+
+    日志保存在 <part文件>.json 中，包含文件总大小、ETag/Last-Modified
+    以及已写入磁盘的区间列表 [[start, end), ...]。
+    """
+
+    def __init__(self, journal_path, total_size, etag=None, last_modified=None, completed=None):
+        self.journal_path = journal_path
+        self.total_size = total_size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.completed = _merge_ranges(completed or [])
+        self.source_url = None  # 校验值所属的镜像地址
+        self._lock = threading.Lock()
+        self._last_save = 0
+
+    @classmethod
+    def load(cls, journal_path, remote):
+        """读取日志，与服务器当前的校验信息不一致时返回None"""
+        if not os.path.exists(journal_path):
+            return None
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"读取续传日志失败，将重新下载: {e}")
+            return None
+
+        if state.get("total_size") != remote["total_size"]:
+            return None
+        # 只有双方都提供了校验值时才比较，避免CDN节点切换导致误判
+        for key in ("etag", "last_modified"):
+            if state.get(key) and remote.get(key) and state[key] != remote[key]:
+                return None
+        return cls(journal_path, remote["total_size"], remote.get("etag"),
+                   remote.get("last_modified"), state.get("completed"))
+
+    def add(self, start, end):
+        """标记 [start, end) 已写入，并按间隔保存日志"""
+        with self._lock:
+            self.completed = _merge_ranges(self.completed + [[start, end]])
+            if time.time() - self._last_save >= JOURNAL_SAVE_INTERVAL:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        state = {
+            "total_size": self.total_size,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "completed": self.completed,
+            "updated": time.time()
+        }
+        # 写入临时文件后替换，避免进程中断时留下损坏的日志
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.journal_path)
+        self._last_save = time.time()
+
+    def missing_ranges(self):
+        """返回尚未下载的区间列表 [[start, end), ...]"""
+        missing = []
+        position = 0
+        for start, end in self.completed:
+            if start > position:
+                missing.append([position, start])
+            position = max(position, end)
+        if position < self.total_size:
+            missing.append([position, self.total_size])
+        return missing
+
+    def completed_size(self):
+        return sum(end - start for start, end in self.completed)
+
+    def remove(self):
+        for path in (self.journal_path, f"{self.journal_path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _merge_ranges(ranges):
+    """合并重叠或相邻的半开区间"""
+    merged = []
+    for start, end in sorted([list(r) for r in ranges]):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def _plan_ranges(missing, segments, min_segment_size):
+    """把待下载区间切分为最多 segments 个任务，每段不小于 min_segment_size"""
+    ranges = [list(r) for r in missing]
+    while len(ranges) < segments:
+        largest = max(ranges, key=lambda r: r[1] - r[0])
+        size = largest[1] - largest[0]
+        if size < min_segment_size * 2:
+            break
+        middle = largest[0] + size // 2
+        ranges.remove(largest)
+        ranges.extend([[largest[0], middle], [middle, largest[1]]])
+    return sorted(ranges)
+
+def _content_range_total(response):
+    """解析 Content-Range 中的文件总大小，无法解析时返回None"""
+    content_range = response.headers.get("content-range", "")
+    total = content_range.rsplit("/", 1)[-1].strip()
+    return int(total) if total.isdigit() else None
+
+def _download_range(mirrors, file_path, headers, start, end, chunk_size, progress_bar, progress_lock, journal, task_id=None):
+    """下载 [start, end) 区间并写入 .part 文件的对应位置
+
+    断线时从已写入处续传并换用下一个镜像；速率持续低于阈值时也会中途切换镜像。
+    """
+    expected = end - start
+    written = 0
+    last_error = None
+    mirror_index = 0
+    attempt = 0
+
+    while attempt < SEGMENT_MAX_RETRIES:
+        url = mirrors.url(mirror_index)
+        range_headers = dict(headers or {})
+        range_headers["Range"] = f"bytes={start + written}-{end - 1}"
+        # 文件在服务器端发生变化时，If-Range 会让服务器返回200完整内容而不是错误的分段
+        # 弱ETag不能用于If-Range，只使用强校验值；校验值只对探测时使用的节点有效
+        validator = journal.etag if journal.etag and not journal.etag.startswith("W/") else journal.last_modified
+        if validator and url == journal.source_url:
+            range_headers["If-Range"] = validator
+        switched = False
+        try:
+            response = get_session().get(url, headers=range_headers, stream=True, timeout=30)
+            try:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise IOError(f"服务器未返回分段内容，远程文件可能已变化 (状态码 {response.status_code})")
+                if _content_range_total(response) not in (None, journal.total_size):
+                    raise IOError(f"镜像返回的文件大小与预期不一致: {response.headers.get('content-range')}")
+
+                window_start = time.monotonic()
+                window_bytes = 0
+                window_wait = 0.0
+                with open(file_path, 'r+b') as f:
+                    f.seek(start + written)
+                    for chunk in response.iter_content(chunk_size=min(chunk_size, RANGE_READ_SIZE)):
+                        if not chunk:
+                            continue
+                        # 防止服务器返回超出区间的数据
+                        chunk = chunk[:expected - written]
+                        f.write(chunk)
+                        # 先写入磁盘再记入日志，保证日志里的区间一定已落盘
+                        f.flush()
+                        chunk_start = start + written
+                        written += len(chunk)
+                        journal.add(chunk_start, start + written)
+                        with progress_lock:
+                            progress_bar.update(len(chunk))
+                        # 按全局带宽限制节流
+                        window_wait += bandwidth.consume(task_id, len(chunk))
+                        if written >= expected:
+                            break
+
+                        # 测速时扣除限速等待的时间，避免把主动限速误判为节点慢
+                        window_bytes += len(chunk)
+                        window_elapsed = time.monotonic() - window_start
+                        if window_elapsed >= mirrors.slow_check_interval:
+                            throughput = window_bytes / max(window_elapsed - window_wait, 1e-3)
+                            if mirrors.should_switch(throughput):
+                                mirror_index = mirrors.switch(mirror_index, f"分段 {start}-{end - 1} 速度过慢 ({throughput / 1024:.0f}KB/s)", throughput)
+                                switched = True
+                                break
+                            window_start = time.monotonic()
+                            window_bytes = 0
+                            window_wait = 0.0
+            finally:
+                response.close()
+
+            if written == expected:
+                return written
+            if switched:
+                # 主动切换镜像不计入失败次数
+                continue
+            last_error = IOError(f"分段 {start}-{end - 1} 数据不完整: {written}/{expected}")
+        except Exception as e:
+            last_error = e
+
+        attempt += 1
+        print(f"分段 {start}-{end - 1} 第 {attempt}/{SEGMENT_MAX_RETRIES} 次下载中断: {last_error}")
+        sys.stdout.flush()
+        if len(mirrors) > 1:
+            mirror_index = mirrors.switch(mirror_index, "连接中断")
+        else:
+            time.sleep(attempt)
+
+    raise IOError(f"分段 {start}-{end - 1} 下载失败: {last_error}")
+
+def _download_ranges(mirrors, file_path, headers, remote, segments, min_segment_size, chunk_size, task_id=None, desc="下载视频: "):
+    """按Range下载到 .part 文件，已有有效日志时只下载缺失的区间"""
+    total_size = remote["total_size"]
+    journal_path = f"{file_path}.json"
+
+    journal = None
+    if os.path.exists(file_path) and os.path.getsize(file_path) == total_size:
+        journal = _DownloadJournal.load(journal_path, remote)
+
+    if journal is None:
+        # 没有可用的续传记录，预分配文件从头下载
+        journal = _DownloadJournal(journal_path, total_size, remote.get("etag"), remote.get("last_modified"))
+        with open(file_path, 'wb') as f:
+            f.truncate(total_size)
+        journal.save()
+    else:
+        print(f"发现续传记录，已完成 {journal.completed_size()}/{total_size} 字节，继续下载")
+        sys.stdout.flush()
+    journal.source_url = remote["url"]
+
+    ranges = _plan_ranges(journal.missing_ranges(), segments, min_segment_size)
+    if ranges:
+        print(f"使用 {len(ranges)} 个连接分段下载，文件大小: {total_size} 字节")
+        sys.stdout.flush()
+
+    progress_bar = _create_progress_bar(total_size, desc)
+    progress_bar.update(journal.completed_size())
+    progress_lock = threading.Lock()
+
+    try:
+        if ranges:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [
+                    executor.submit(_download_range, mirrors, file_path, headers, start, end, chunk_size,
+                                    progress_bar, progress_lock, journal, task_id)
+                    for start, end in ranges
+                ]
+                # 逐个取结果，任一分段失败都会在这里抛出异常
+                for future in futures:
+                    future.result()
+    finally:
+        progress_bar.close()
+        # 无论成功失败都保存日志，下次可以从这里继续
+        journal.save()
+
+    # 校验所有区间是否完整覆盖文件
+    if journal.missing_ranges():
+        raise IOError(f"分段下载数据不完整: {journal.completed_size()}/{total_size}")
+
+    journal.remove()
+    return total_size
+
+def _download_single(url, file_path, headers, chunk_size, task_id=None, desc="下载视频: "):
+    """单连接流式下载"""
+    response = get_session().get(url, headers=headers, stream=True)
+    response.raise_for_status()
+
+    # 获取文件大小
+    total_size = int(response.headers.get('content-length', 0))
+
+    # 初始化进度条
+    progress_bar = _create_progress_bar(total_size, desc)
+
+    # 使用with语句确保文件正确关闭
+    with open(file_path, 'wb') as f:
+        downloaded_size = 0
+
+        # 分块下载
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                f.write(chunk)
+                downloaded_size += len(chunk)
+                progress_bar.update(len(chunk))
+                # 按全局带宽限制节流
+                bandwidth.consume(task_id, len(chunk))
+                # 强制刷新输出，确保实时显示进度
+                sys.stdout.flush()
+
+                # 定期刷新文件，保证数据写入磁盘
+                if downloaded_size % (10 * chunk_size) == 0:
+                    f.flush()
+
+    # 关闭进度条
+    progress_bar.close()
+
+    return total_size
+
+def download_file(url, file_path, headers=None, chunk_size=1024*1024,
+                  segments=1, min_segment_size=DEFAULT_MIN_SEGMENT_SIZE, task_id=None,
+                  min_throughput=0, slow_check_interval=5, desc="下载视频: "):
     """下载文件并显示进度条
-    
+
+    服务器支持Range请求时，会在 <file_path>.json 中记录已完成的字节区间，
+    下载失败后保留不完整的文件，再次调用时从断点继续。调用方通常应传入
+    .part 路径，并在下载成功后自行重命名为最终文件名。
+
     参数:
-        url: 下载链接
+        url: 下载链接，也可以是按优先级排列的镜像地址列表
         file_path: 保存路径
         headers: 请求头
         chunk_size: 分块大小，单位为字节
-    
+        segments: 并发分段数，大于1时使用多连接分段下载
+        min_segment_size: 每个分段的最小字节数
+        task_id: 所属任务ID，用于全局带宽分配和在任务状态中显示速率
+        min_throughput: 速率低于该值(KB/s)时切换到下一个镜像，0表示只在断线时切换
+        slow_check_interval: 检测慢速的时间窗口(秒)
+        desc: 进度条前缀，并行下载多个文件时用于区分
+
     返回:
         下载是否成功
     """
+    resumable = False
+    bandwidth.register_task(task_id)
     try:
         # 创建必要的目录
         os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
-        
-        # 发起请求
-        response = requests.get(url, headers=headers, stream=True)
-        response.raise_for_status()
-        
-        # 获取文件大小
-        total_size = int(response.headers.get('content-length', 0))
-        
-        # 初始化进度条
-        progress_bar = tqdm(
-            total=total_size,
-            unit='B',
-            unit_scale=True,
-            unit_divisor=1024,
-            desc=f"下载视频: ",
-            ascii=False,
-            ncols=100,
-            bar_format="{desc} |{bar}| {percentage:.1f}% - {n_fmt}/{total_fmt} ({rate_fmt})"
-        )
-        
-        # 使用with语句确保文件正确关闭
-        with open(file_path, 'wb') as f:
-            downloaded_size = 0
-            
-            # 分块下载
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    progress_bar.update(len(chunk))
-                    # 强制刷新输出，确保实时显示进度
-                    sys.stdout.flush()
-                    
-                    # 定期刷新文件，保证数据写入磁盘
-                    if downloaded_size % (10 * chunk_size) == 0:
-                        f.flush()
-            
-        # 关闭进度条
-        progress_bar.close()
-        
+
+        mirrors = MirrorSet(url if isinstance(url, (list, tuple)) else [url], min_throughput, slow_check_interval)
+
+        # 按顺序探测镜像，第一个可用的镜像决定是否支持Range
+        remote = None
+        for index in range(len(mirrors)):
+            try:
+                remote = probe_range_support(mirrors.url(index), headers)
+                # 各分段从第一个可用的镜像开始下载
+                mirrors.prefer(index)
+                break
+            except Exception as probe_e:
+                print(f"探测Range支持失败: {probe_e}")
+                mirrors.switch(index, "镜像不可用")
+
+        if remote is None:
+            print("服务器不支持Range请求，使用单连接下载 (不支持断点续传)")
+            sys.stdout.flush()
+            # 旧的续传日志已无法使用
+            stale_journal = f"{file_path}.json"
+            if os.path.exists(stale_journal):
+                os.remove(stale_journal)
+            total_size = None
+            for index in range(len(mirrors)):
+                try:
+                    total_size = _download_single(mirrors.url(index), file_path, headers, chunk_size, task_id, desc)
+                    break
+                except Exception as single_e:
+                    if index == len(mirrors) - 1:
+                        raise
+                    mirrors.switch(index, f"下载失败 ({single_e})")
+        else:
+            resumable = True
+            total_size = _download_ranges(mirrors, file_path, headers, remote, max(1, segments), min_segment_size, chunk_size, task_id, desc)
+
         # 打印完成信息
         print(f"视频下载完成: {file_path}")
         sys.stdout.flush()  # 确保消息立即显示
-        
+
         # 校验文件大小
         if total_size > 0 and os.path.getsize(file_path) != total_size:
             print(f"警告: 文件大小不匹配，预期 {total_size}，实际 {os.path.getsize(file_path)}")
             sys.stdout.flush()  # 确保消息立即显示
             return False
-        
+
         return True
-        
+
     except Exception as e:
         print(f"下载失败: {e}")
         sys.stdout.flush()  # 确保错误消息立即显示
-        
+
+        # 可续传的下载保留不完整的文件和日志，下次从断点继续
+        if resumable:
+            print(f"已保留不完整的文件用于断点续传: {file_path}")
+            sys.stdout.flush()
+            return False
+
         # 如果文件已经创建，但下载失败，则删除不完整的文件
         if os.path.exists(file_path):
             try:
@@ -85,5 +451,7 @@ def download_file(url, file_path, headers=None, chunk_size=1024*1024):
             except Exception as del_e:
                 print(f"无法删除不完整的文件: {del_e}")
                 sys.stdout.flush()  # 确保消息立即显示
-        
+
         return False
+    finally:
+        bandwidth.unregister_task(task_id)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import threading
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from ..config.config_manager import load_config
+
+# 默认连接池与超时设置，可通过 config.json 中的 "http" 节覆盖
+DEFAULT_POOL_CONNECTIONS = 16  # 缓存的主机连接池数量 (api.bilibili.com、各个CDN节点等)
+DEFAULT_POOL_MAXSIZE = 32  # 每个主机保持的最大keep-alive连接数，需大于分段下载并发数
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+
+class _PooledSession(requests.Session):
+    """为所有未显式指定超时的请求补上默认超时的Session"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        return super().request(method, url, **kwargs)
+
+def _create_session(http_config):
+    pool_connections = http_config.get("pool_connections", DEFAULT_POOL_CONNECTIONS)
+    pool_maxsize = http_config.get("pool_maxsize", DEFAULT_POOL_MAXSIZE)
+    timeout = (
+        http_config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+        http_config.get("read_timeout", DEFAULT_READ_TIMEOUT)
+    )
+
+    session = _PooledSession(timeout)
+    # urllib3 按主机维护连接池，同一主机的请求会复用已建立的TCP/TLS连接
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Cookie 由调用方通过请求头显式传入，不让响应的 Set-Cookie 污染共享会话
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    print(f"[http_client] 创建共享HTTP会话: pool_connections={pool_connections}, pool_maxsize={pool_maxsize}, timeout={timeout}")
+    return session
+
+def get_session():
+    """获取进程内共享的HTTP会话 (线程安全，首次调用时创建)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session(load_config().get("http", {}))
+    return _session
+
+def reset_session():
+    """关闭当前会话，下次调用 get_session 时按最新配置重建"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
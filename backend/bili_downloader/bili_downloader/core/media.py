@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import subprocess
+
+def _startupinfo():
+    """Windows下隐藏FFmpeg控制台窗口"""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
+
+def probe_duration(media_path):
+    """使用ffprobe读取媒体文件时长(秒)，失败时返回None"""
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        media_path
+    ]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, check=False,
+                                 startupinfo=_startupinfo(), encoding='utf-8', errors='ignore')
+        if process.returncode != 0:
+            print(f"ffprobe 读取时长失败: {process.stderr[:200]}")
+            return None
+        return float(process.stdout.strip())
+    except (FileNotFoundError, ValueError) as e:
+        print(f"ffprobe 读取时长失败: {e}")
+        return None
+
+def has_audio_stream(media_path):
+    """使用ffprobe检查媒体文件是否包含音轨，无法判断时返回None"""
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        media_path
+    ]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, check=False,
+                                 startupinfo=_startupinfo(), encoding='utf-8', errors='ignore')
+    except FileNotFoundError as e:
+        print(f"ffprobe 检查音轨失败: {e}")
+        return None
+    if process.returncode != 0:
+        print(f"ffprobe 检查音轨失败: {process.stderr[:200]}")
+        return None
+    return bool(process.stdout.strip())
+
+def duration_matches(actual, expected, tolerance_ratio=0.01, min_tolerance=2.0):
+    """判断实际时长与预期时长是否一致，允许1%或2秒以内的误差"""
+    if actual is None or not expected:
+        return False
+    return abs(actual - expected) <= max(min_tolerance, expected * tolerance_ratio)
+
+def concat_segments(segment_paths, output_path):
+    """使用FFmpeg concat demuxer以流复制方式无损拼接多个分段
+
+    参数:
+        segment_paths: 按播放顺序排列的分段文件路径
+        output_path: 输出文件路径，输出格式固定为MP4
+
+    返回:
+        (bool, str|None): 是否成功，失败时的错误信息
+    """
+    list_path = f"{output_path}.concat.txt"
+    try:
+        # concat 列表中的路径需要转义单引号
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for path in segment_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        command = [
+            "ffmpeg",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_path,
+            "-c", "copy",  # 只复制码流，不重新编码
+            "-f", "mp4",
+            "-y",
+            output_path
+        ]
+        print(f"开始拼接 {len(segment_paths)} 个视频分段: {output_path}")
+        sys.stdout.flush()
+        process = subprocess.run(command, capture_output=True, text=True, check=False,
+                                 startupinfo=_startupinfo(), encoding='utf-8', errors='ignore')
+        if process.returncode != 0:
+            return False, f"FFmpeg 拼接失败 (code {process.returncode}): {process.stderr[-500:]}"
+        return True, None
+    except FileNotFoundError:
+        return False, "未找到 FFmpeg，请确认已安装并加入 PATH"
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+def mux_streams(video_stream_path, audio_stream_path, output_path):
+    """把DASH的视频流和音频流以流复制方式合并为MP4，audio_stream_path 为None时只封装视频
+
+    返回:
+        (bool, str|None): 是否成功，失败时的错误信息
+    """
+    command = ["ffmpeg", "-i", video_stream_path]
+    if audio_stream_path:
+        command += ["-i", audio_stream_path, "-map", "0:v:0", "-map", "1:a:0"]
+    command += [
+        "-c", "copy",  # 只复制码流，不重新编码
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        "-y",
+        output_path
+    ]
+    print(f"开始合并视频流和音频流: {output_path}")
+    sys.stdout.flush()
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, check=False,
+                                 startupinfo=_startupinfo(), encoding='utf-8', errors='ignore')
+    except FileNotFoundError:
+        return False, "未找到 FFmpeg，请确认已安装并加入 PATH"
+    if process.returncode != 0:
+        return False, f"FFmpeg 合并失败 (code {process.returncode}): {process.stderr[-500:]}"
+    return True, None
+
+def remux_audio(audio_stream_path, output_path):
+    """以流复制方式把音频流(DASH m4s或MP4中的音轨)封装为独立的M4A文件
+
+    返回:
+        (bool, str|None): 是否成功，失败时的错误信息
+    """
+    command = [
+        "ffmpeg",
+        "-i", audio_stream_path,
+        "-vn",
+        "-c", "copy",
+        "-strict", "experimental",  # 较旧的FFmpeg需要该参数才允许在MP4中封装FLAC
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        "-y",
+        output_path
+    ]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, check=False,
+                                 startupinfo=_startupinfo(), encoding='utf-8', errors='ignore')
+    except FileNotFoundError:
+        return False, "未找到 FFmpeg，请确认已安装并加入 PATH"
+    if process.returncode != 0:
+        return False, f"FFmpeg 封装音频失败 (code {process.returncode}): {process.stderr[-500:]}"
+    return True, None
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import requests
+from ..core.rate_limiter import bili_api_get
 
 # 默认请求头
 DEFAULT_HEADERS = {
@@ -34,7 +34,7 @@ def check_login_status(cookie, return_json=False):
     
     try:
         # 尝试访问用户个人信息API
-        response = requests.get("https://api.bilibili.com/x/web-interface/nav", headers=headers, timeout=10)
+        response = bili_api_get("https://api.bilibili.com/x/web-interface/nav", headers=headers, timeout=10)
         data = response.json()
         
         # 成功验证cookie
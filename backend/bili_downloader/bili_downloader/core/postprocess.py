@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+from ..core.audio import extract_audio, audio_output_args, get_transcode_pool
+from ..core.bif import (generate_bif, thumbnail_input_args, thumbnail_output_args, stream_bif_from_command,
+                        estimate_frame_count, BIF_MODE_FULL, BIF_MODE_KEYFRAME)
+from ..core.media import probe_duration, has_audio_stream
+
+def process_audio_and_bif(video_path, audio_path, audio_mode, bif_path, interval=1, width=480, duration=None,
+                          bif_mode=BIF_MODE_FULL):
+    """用一次FFmpeg调用同时提取音频和生成BIF缩略图，视频只解复用、解码一次
+    
+    音频写入文件，缩略图通过管道直接写入BIF。视频没有音轨时只生成BIF；
+    合并执行后两个输出分别判断，只重新执行失败的那一步，成功的结果直接保留。
+    
+    参数:
+        video_path: 视频文件路径
+        audio_path: 输出音频文件路径
+        audio_mode: 'copy' 复制音轨为M4A，'mp3' 重新编码为MP3
+        bif_path: 输出BIF文件路径
+        duration: 视频时长(秒)，用于预留BIF索引表，为空时用ffprobe读取
+        bif_mode: 'full' 解码全部帧，'keyframe' 只解码关键帧并使用真实PTS作为时间戳
+    
+    返回:
+        dict: {"audio": {...}, "bif": {...}}，各自包含 success、error、mode 和 elapsed
+    """
+    start_time = time.time()
+    audio_part = f"{audio_path}.part"
+    os.makedirs(os.path.dirname(os.path.abspath(audio_path)), exist_ok=True)
+    if duration is None:
+        duration = probe_duration(video_path)
+    
+    if has_audio_stream(video_path) is False:
+        # 没有音轨时合并命令必然失败，直接只生成BIF，视频仍只解码一次
+        print("[后处理] 视频没有音轨，只生成BIF")
+        sys.stdout.flush()
+        bif_success, bif_error, bif_info = generate_bif(video_path, bif_path, interval, width, duration=duration,
+                                                        mode=bif_mode, return_info=True)
+        bif_info.update({"success": bif_success, "error": bif_error})
+        audio_info = {"success": False, "error": "视频没有音轨", "mode": audio_mode,
+                      "elapsed": round(time.time() - start_time, 2)}
+        return {"audio": audio_info, "bif": bif_info}
+    
+    command = [
+        "ffmpeg",
+        "-y",
+        *thumbnail_input_args(bif_mode),
+        "-i", video_path,
+        *audio_output_args(audio_mode, audio_part),
+        *thumbnail_output_args("pipe:1", interval, width, bif_mode)
+    ]
+    reserved_count = estimate_frame_count(duration, interval)
+    pts_timestamps = bif_mode == BIF_MODE_KEYFRAME
+    print(f"[后处理] 单次解码同时提取音频和缩略图: {' '.join(command)}")
+    sys.stdout.flush()
+    
+    run_info = {}
+    try:
+        if audio_mode == "mp3":
+            # MP3编码占满一个CPU核心，与单独转码共用同一个线程池限制并发
+            bif_success, bif_error, run_info = get_transcode_pool().submit(
+                stream_bif_from_command, command, bif_path, interval, reserved_count, pts_timestamps, return_info=True
+            ).result()
+        else:
+            bif_success, bif_error, run_info = stream_bif_from_command(command, bif_path, interval, reserved_count,
+                                                                       pts_timestamps, return_info=True)
+    except FileNotFoundError:
+        bif_success, bif_error = False, "未找到 FFmpeg"
+    
+    elapsed = round(time.time() - start_time, 2)
+    # 两个输出分别判断：成功的一个直接保留，只重新执行失败的那一步
+    audio_success = (run_info.get("returncode") == 0 and os.path.exists(audio_part)
+                     and os.path.getsize(audio_part) > 0)
+    results = {}
+    if audio_success:
+        os.replace(audio_part, audio_path)
+        results["audio"] = {"success": True, "error": None, "mode": f"combined_{audio_mode}", "elapsed": elapsed}
+    elif os.path.exists(audio_part):
+        os.remove(audio_part)
+    if bif_success:
+        results["bif"] = {"success": True, "error": None, "mode": f"combined_{bif_mode}", "elapsed": elapsed}
+    
+    if audio_success and bif_success:
+        print(f"[后处理] 单次解码完成 (耗时: {elapsed:.2f}秒)")
+        sys.stdout.flush()
+        return results
+    
+    print(f"[后处理] 单次解码未全部成功 (音频: {audio_success}, BIF: {bif_success})，只重新执行失败的步骤: {bif_error}")
+    sys.stdout.flush()
+    
+    if not audio_success:
+        audio_success, audio_info = extract_audio(video_path, audio_path, mode=audio_mode, return_info=True)
+        audio_info.update({"success": audio_success, "error": None if audio_success else "音频提取失败"})
+        results["audio"] = audio_info
+    
+    if not bif_success:
+        bif_success, bif_error, bif_info = generate_bif(video_path, bif_path, interval, width, duration=duration,
+                                                        mode=bif_mode, return_info=True)
+        bif_info.update({"success": bif_success, "error": bif_error})
+        results["bif"] = bif_info
+    return results
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import random
+import threading
+from urllib.parse import urlparse
+from ..config.config_manager import load_config
+from ..core.http_client import get_session
+
+# B站风控相关的返回码: -412 请求被拦截, -799 请求过于频繁, -352 风控校验失败
+RISK_CONTROL_CODES = (-412, -799, -352)
+
+# 按接口路径划分限流族，不同接口的风控阈值相互独立
+ENDPOINT_FAMILIES = [
+    ("/x/web-interface/view", "view"),
+    ("/x/web-interface/nav", "nav"),
+    ("/x/player/playurl", "playurl"),
+    ("/x/player/wbi/playurl", "playurl"),
+    ("/x/player", "player"),
+    ("/x/v2/dm", "danmaku"),
+]
+
+DEFAULT_RATE_LIMIT = {
+    "max_rate": 4.0,  # 每个接口族每秒最多请求数 (同时也是恢复的上限)
+    "min_rate": 0.2,  # 被风控后速率下降的下限
+    "burst": 4,  # 令牌桶容量，允许的瞬时突发请求数
+    "recovery_step": 0.05,  # 每次成功请求后速率回升的步长 (请求/秒)
+    "decrease_factor": 0.5,  # 每次被风控后速率乘以该系数
+    "max_retries": 4,  # 被风控后的最大重试次数
+    "backoff_base": 2.0,  # 退避基础时长(秒)，按 2^n 增长
+    "backoff_max": 60.0,  # 单次退避的最长时间(秒)
+    "families": {}  # 按接口族覆盖以上参数，例如 {"playurl": {"max_rate": 2}}
+}
+
+class _AdaptiveTokenBucket:
+    """单个接口族的自适应令牌桶
+
+    被风控时按乘性系数降低速率，之后每次成功请求按固定步长缓慢回升 (AIMD)。
+    """
+
+    def __init__(self, family, settings):
+        self.family = family
+        self.settings = settings
+        self.max_rate = float(settings["max_rate"])
+        self.min_rate = float(settings["min_rate"])
+        self.burst = float(settings["burst"])
+        self.recovery_step = float(settings["recovery_step"])
+        self.decrease_factor = float(settings["decrease_factor"])
+
+        self.rate = self.max_rate
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+        # 统计信息
+        self.requests = 0
+        self.throttle_events = 0
+        self.last_throttle_at = None
+        self.total_wait_time = 0.0
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """取得一个令牌，必要时阻塞等待"""
+        with self.lock:
+            self._refill_locked()
+            # 先预占令牌 (可为负数)，并发调用者会依次排队而不是同时醒来
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.requests += 1
+        if wait > 0:
+            time.sleep(wait)
+            self.record_wait(wait)
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.total_wait_time += seconds
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+    def on_throttle(self):
+        with self.lock:
+            self._refill_locked()
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # 清空令牌，风控后不允许立即突发
+            self.tokens = min(self.tokens, 0.0)
+            self.throttle_events += 1
+            self.last_throttle_at = time.time()
+            return self.rate
+
+    def stats(self):
+        with self.lock:
+            return {
+                "current_rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "min_rate": self.min_rate,
+                "requests": self.requests,
+                "throttle_events": self.throttle_events,
+                "last_throttle_at": self.last_throttle_at,
+                "total_wait_time": round(self.total_wait_time, 3)
+            }
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def _load_settings(family):
+    rate_config = load_config().get("rate_limit", {})
+    settings = dict(DEFAULT_RATE_LIMIT)
+    settings.update({k: v for k, v in rate_config.items() if k != "families"})
+    settings.update(rate_config.get("families", {}).get(family, {}))
+    return settings
+
+def get_limiter(family):
+    """获取指定接口族的限流器 (首次使用时按配置创建)"""
+    bucket = _buckets.get(family)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(family)
+            if bucket is None:
+                bucket = _AdaptiveTokenBucket(family, _load_settings(family))
+                _buckets[family] = bucket
+    return bucket
+
+def family_for_url(url):
+    """根据接口路径判断所属的限流族"""
+    path = urlparse(url).path
+    for prefix, family in ENDPOINT_FAMILIES:
+        if path.startswith(prefix):
+            return family
+    return "api"
+
+def is_risk_controlled(response):
+    """判断响应是否被B站风控 (HTTP 412 或业务码 -412/-799/-352)"""
+    if response.status_code == 412:
+        return True
+    if "json" not in response.headers.get("content-type", "").lower():
+        return False
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get("code") in RISK_CONTROL_CODES
+
+def bili_api_get(url, headers=None, family=None, **kwargs):
+    """经过自适应限流的B站API GET请求
+
+    遇到风控响应时降低该接口族的速率，并按指数退避加随机抖动重试。
+    重试次数用尽后返回最后一次的响应，由调用方按原有逻辑处理错误。
+    """
+    family = family or family_for_url(url)
+    limiter = get_limiter(family)
+    settings = limiter.settings
+    max_retries = int(settings["max_retries"])
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        response = get_session().get(url, headers=headers, **kwargs)
+
+        if not is_risk_controlled(response):
+            limiter.on_success()
+            return response
+
+        new_rate = limiter.on_throttle()
+        if attempt >= max_retries:
+            print(f"[限流] {family} 接口被风控，已重试 {max_retries} 次，放弃")
+            sys.stdout.flush()
+            return response
+
+        # 指数退避加随机抖动，避免多个任务同时重试
+        backoff = min(settings["backoff_max"], settings["backoff_base"] * (2 ** attempt))
+        delay = random.uniform(backoff / 2, backoff)
+        print(f"[限流] {family} 接口被风控 (HTTP {response.status_code})，速率降至 {new_rate:.2f}/s，{delay:.1f} 秒后第 {attempt + 1}/{max_retries} 次重试")
+        sys.stdout.flush()
+        time.sleep(delay)
+        limiter.record_wait(delay)
+
+    return response
+
+def get_rate_limiter_stats():
+    """返回所有接口族的限流统计信息"""
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    return {bucket.family: bucket.stats() for bucket in buckets}
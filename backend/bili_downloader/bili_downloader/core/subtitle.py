@@ -1,14 +1,48 @@
 # -*- coding: utf-8 -*-
 import os
 import json
-import requests
+import shutil
+import asyncio
 import time
 import re
-import random
 import logging
+import importlib.util
 from ..utils.helpers import format_time, sanitize_filename
-from ..core.downloader import download_file
 from ..config.config_manager import get_download_path
+from ..core.http_client import get_session
+from ..core.rate_limiter import bili_api_get
+from ..core.wbi import signed_url
+from ..core.browser_pool import get_browser_pool, LIGHTWEIGHT_FIREFOX_PREFS
+
+PLAYER_WBI_API = "https://api.bilibili.com/x/player/wbi/v2"
+PLAYER_API = "https://api.bilibili.com/x/player/v2"
+
+# 浏览器抓取字幕时各步骤的超时(毫秒)
+NAVIGATION_TIMEOUT_MS = 20000  # 收到视频页面响应
+PLAYER_TIMEOUT_MS = 15000  # 播放器容器出现
+ACTION_TIMEOUT_MS = 5000  # 悬停播放器、点击字幕按钮
+SUBTITLE_RESPONSE_TIMEOUT_MS = 10000  # 点击后第一条字幕响应到达
+BROWSER_MAX_ATTEMPTS = 3  # 每个视频最多打开页面的次数
+BATCH_PAGES_PER_CONTEXT = 4  # 批量抓取时每个浏览器上下文承载的并发页面数
+
+PLAYER_CONTAINER_SELECTOR = "div.bpx-player-container"
+SUBTITLE_BUTTON_SELECTOR = "div.bpx-player-ctrl-btn.bpx-player-ctrl-subtitle"
+BROWSER_CONTEXT_OPTIONS = {
+    "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:109.0) Gecko/20100101 Firefox/115.0",
+    "viewport": {"width": 1470, "height": 770},
+    "service_workers": "block"
+}
+
+# 浏览器抓取字幕时拦截的请求：只需要播放器初始化和字幕请求，其余资源一律不加载
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "imageset", "object", "beacon", "ping", "csp_report"}
+BLOCKED_URL_PATTERN = re.compile(
+    r"\.m4s(\?|$)|\.flv(\?|$)|bilivideo\.(com|cn)|akamaized\.net"  # 音视频分段
+    r"|data\.bilibili\.com|cm\.bilibili\.com|hm\.baidu\.com|/log/web|/x/report/|/x/click-interface/"  # 统计和广告
+    r"|/x/v2/reply|/x/web-interface/archive/related|/x/web-interface/wbi/index|/x/v2/dm/"  # 评论、推荐、弹幕
+    r"|/x/web-interface/card|/x/relation/|/x/web-show/|/x/vip/|/x/msgfeed/|/x/web-interface/nav/stat"
+)
+# 即使命中上面的规则也放行，保证播放器能拿到字幕列表并请求字幕
+ALLOWED_URL_PATTERN = re.compile(r"aisubtitle\.hdslb\.com|/x/player/|/x/web-interface/(wbi/)?view|/x/web-interface/nav(\?|$)")
 
 # 初始化日志配置
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,6 +65,17 @@ def download_subtitle(video_info, config, headers):
         logging.error(f"[任务 {bv_id}] {error_msg}")
         return False, error_msg
     
+    # 优先直接请求播放器接口获取字幕列表，找不到字幕时才启动浏览器
+    try:
+        api_start = time.time()
+        success, api_msg = download_subtitle_from_api(video_info, config, headers)
+        if success:
+            logging.info(f"[任务 {bv_id}] 已通过播放器接口获取字幕，耗时 {time.time() - api_start:.2f} 秒")
+            return True, None
+        logging.info(f"[任务 {bv_id}] 播放器接口未获取到字幕 ({api_msg})，回退到浏览器")
+    except Exception as e:
+        logging.warning(f"[任务 {bv_id}] 播放器接口获取字幕出错，回退到浏览器: {e}")
+
     # 使用无头浏览器获取字幕
     try:
         logging.info(f"[任务 {bv_id}] 尝试使用浏览器获取字幕...")
@@ -51,13 +96,205 @@ def download_subtitle(video_info, config, headers):
         traceback.print_exc() # 打印详细的异常堆栈
         return False, f"浏览器异常: {str(e)[:50]}" # 返回简化的异常信息
 
+def _fetch_subtitle_list(bv_id, cid, headers):
+    """请求播放器接口返回字幕轨道列表，WBI签名接口失败时再试旧接口"""
+    params = {"bvid": bv_id, "cid": cid}
+    for url in (signed_url(PLAYER_WBI_API, params, headers), f"{PLAYER_API}?bvid={bv_id}&cid={cid}"):
+        try:
+            data = bili_api_get(url, headers=headers, timeout=10).json()
+        except Exception as e:
+            logging.warning(f"[任务 {bv_id}] 请求播放器接口失败 ({url}): {e}")
+            continue
+        if data.get("code") != 0:
+            logging.warning(f"[任务 {bv_id}] 播放器接口返回错误: {data.get('code')} {data.get('message')}")
+            continue
+        return (data.get("data") or {}).get("subtitle", {}).get("subtitles") or []
+    return []
+
+def _write_srt(body, srt_path):
+    """把字幕JSON的 body 列表写成SRT文件，返回写入的条数"""
+    count = 0
+    with open(srt_path, 'w', encoding='utf-8') as f:
+        for line in body:
+            if isinstance(line, dict) and "from" in line and "to" in line and "content" in line:
+                count += 1
+                f.write(f"{count}\n")
+                f.write(f"{format_time(line['from'])} --> {format_time(line['to'])}\n")
+                f.write(f"{line['content']}\n\n")
+    return count
+
+def download_subtitle_from_api(video_info, config, headers):
+    """通过播放器接口获取字幕列表并直接下载每条字幕的JSON，返回 (bool, str|None)元组
+
+    只需要两三个普通HTTP请求，不启动浏览器。中文字幕优先作为主字幕。
+    """
+    bv_id = video_info.get("bv_id", "未知BV")
+    cid = video_info.get("cid")
+    if not cid:
+        return False, "缺少 cid，无法查询字幕列表"
+
+    tracks = _fetch_subtitle_list(bv_id, cid, headers)
+    tracks = [track for track in tracks if track.get("subtitle_url")]
+    if not tracks:
+        return False, "播放器接口未返回字幕"
+    tracks.sort(key=lambda track: 0 if "zh" in track.get("lan", "") else 1)
+    logging.info(f"[任务 {bv_id}] 播放器接口返回 {len(tracks)} 条字幕: {[track.get('lan') for track in tracks]}")
+
+    session = get_session()
+    main_saved = False
+    last_error_msg = "字幕内容为空"
+    for track in tracks:
+        lang = re.sub(r'[^A-Za-z0-9_-]', '_', track.get("lan") or "unknown")
+        subtitle_url = track["subtitle_url"]
+        if subtitle_url.startswith("//"):
+            subtitle_url = "https:" + subtitle_url
+        try:
+            response = session.get(subtitle_url, headers={"User-Agent": headers.get("User-Agent", ""),
+                                                          "Referer": "https://www.bilibili.com"})
+            response.raise_for_status()
+            content_text = response.text
+            subtitle_data = json.loads(content_text)
+        except Exception as e:
+            last_error_msg = f"下载字幕 {lang} 失败: {e}"
+            logging.error(f"[任务 {bv_id}] {last_error_msg}")
+            continue
+        body = subtitle_data.get("body") if isinstance(subtitle_data, dict) else None
+        if not isinstance(body, list) or not body:
+            last_error_msg = f"字幕 {lang} 缺少 'body' 列表结构"
+            logging.error(f"[任务 {bv_id}] {last_error_msg}")
+            continue
+
+        try:
+            with open(get_download_path(config, video_info, f"subtitle_{lang}_raw"), 'w', encoding='utf-8') as f:
+                f.write(content_text)
+        except Exception as write_e:
+            logging.error(f"[任务 {bv_id}] 保存原始字幕 JSON 失败: {write_e}")
+        try:
+            srt_path = get_download_path(config, video_info, f"subtitle_{lang}")
+            count = _write_srt(body, srt_path)
+            if not main_saved:
+                _write_srt(body, get_download_path(config, video_info, "subtitle"))
+                main_saved = True
+            logging.info(f"[任务 {bv_id}] 字幕 {lang} 已保存为SRT ({count} 条): {srt_path}")
+        except Exception as srt_write_e:
+            last_error_msg = f"写入 SRT 文件失败: {srt_write_e}"
+            logging.error(f"[任务 {bv_id}] {last_error_msg}")
+
+    return (True, None) if main_saved else (False, last_error_msg)
+
+def _is_subtitle_response(response):
+    """判断浏览器中的响应是否为字幕JSON"""
+    if 'aisubtitle.hdslb.com' not in response.url or response.status != 200:
+        return False
+    return 'json' in response.headers.get('content-type', '').lower()
+
+def _should_block_request(request):
+    """字幕抓取用不到的请求返回 True"""
+    url = request.url
+    if ALLOWED_URL_PATTERN.search(url):
+        return False
+    return request.resource_type in BLOCKED_RESOURCE_TYPES or bool(BLOCKED_URL_PATTERN.search(url))
+
+def _block_irrelevant_requests(context, blocked):
+    """在浏览器上下文中拦截字幕抓取用不到的请求，按资源类型统计到 blocked"""
+    def handle_route(route):
+        request = route.request
+        if _should_block_request(request):
+            blocked[request.resource_type] = blocked.get(request.resource_type, 0) + 1
+            route.abort()
+        else:
+            route.continue_()
+
+    context.route("**/*", handle_route)
+
+def _parse_cookie_string_for_playwright(cookie_string):
+    """把 Cookie 请求头转换为 Playwright 的 cookie 列表"""
+    cookies = []
+    for item in cookie_string.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' in item:
+            name, value = item.split('=', 1)
+            cookies.append({
+                'name': name,
+                'value': value,
+                'domain': '.bilibili.com',
+                'path': '/'
+            })
+    return cookies
+
+def _save_captured_subtitles(video_info, config, captured_subtitles):
+    """把浏览器捕获到的字幕响应保存为原始JSON和SRT，返回 (bool, str|None)元组
+
+    按捕获顺序处理，第一个成功转换的响应同时保存为主字幕。
+    """
+    bv_id = video_info.get("bv_id", "未知BV")
+    last_error_msg = "未捕获到字幕请求"
+    logging.info(f"[任务 {bv_id}] 总共捕获到 {len(captured_subtitles)} 个字幕响应")
+
+    for i, req_data in enumerate(captured_subtitles):
+        subtitle_url = req_data["url"]
+        content_text = req_data["text"]
+        logging.info(f"[任务 {bv_id}] 处理第 {i+1} 个字幕响应: {subtitle_url}")
+        logging.info(f"[任务 {bv_id}] 字幕响应文本 (前100字符): {content_text[:100]}")
+
+        # 获取字幕语言标识
+        subtitle_lang = f"browser_response_{i+1}"
+
+        # 保存字幕JSON，保存失败不影响后续解析
+        try:
+            subtitle_json_path = get_download_path(config, video_info, f"subtitle_{subtitle_lang}_raw")
+            with open(subtitle_json_path, 'w', encoding='utf-8') as f:
+                f.write(content_text)
+            logging.info(f"[任务 {bv_id}] 原始字幕 JSON 已保存到: {subtitle_json_path}")
+        except Exception as write_e:
+            logging.error(f"[任务 {bv_id}] 保存原始字幕 JSON 失败: {write_e}")
+
+        try:
+            subtitle_data = json.loads(content_text)
+        except Exception as json_e:
+            last_error_msg = f"解析字幕JSON出错: {json_e}"
+            logging.error(f"[任务 {bv_id}] {last_error_msg}")
+            continue
+
+        body = subtitle_data.get("body") if isinstance(subtitle_data, dict) else None
+        if not isinstance(body, list):
+            last_error_msg = "字幕 JSON 缺少 'body' 列表结构"
+            logging.error(f"[任务 {bv_id}] {last_error_msg}")
+            continue
+        logging.info(f"[任务 {bv_id}] 找到 'body' 字段，包含 {len(body)} 条字幕")
+
+        try:
+            srt_path = get_download_path(config, video_info, f"subtitle_{subtitle_lang}")
+            count = _write_srt(body, srt_path)
+            logging.info(f"[任务 {bv_id}] 字幕已转换为SRT格式 ({count} 条): {srt_path}")
+        except Exception as srt_write_e:
+            last_error_msg = f"写入 SRT 文件失败: {srt_write_e}"
+            logging.error(f"[任务 {bv_id}] {last_error_msg}")
+            continue
+
+        # 创建主字幕文件的副本 (与BV号同名)
+        main_srt_path = get_download_path(config, video_info, "subtitle")
+        try:
+            shutil.copy2(srt_path, main_srt_path)
+            logging.info(f"[任务 {bv_id}] 已创建主字幕文件: {main_srt_path}")
+        except Exception as copy_e:
+            logging.error(f"[任务 {bv_id}] 复制主字幕文件失败: {copy_e}")
+        return True, None
+
+    return False, last_error_msg
+
 def download_subtitle_with_browser(video_info, config, cookie_str):
-    """使用无头浏览器获取字幕，返回 (bool, str|None)元组"""
+    """使用无头浏览器获取字幕，返回 (bool, str|None)元组
+
+    单个视频使用浏览器池中常驻的浏览器；批量抓取请使用 download_subtitles_with_browser。
+    """
     bv_id = video_info.get("bv_id", "未知BV")
     logging.info(f"[任务 {bv_id}] 进入 download_subtitle_with_browser 函数")
     
     try:
-        from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+        from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
         logging.info(f"[任务 {bv_id}] Playwright 已导入")
     except ImportError as e:
         error_msg = f"导入 Playwright 失败: {e}. 请确保已安装."
@@ -65,8 +302,6 @@ def download_subtitle_with_browser(video_info, config, cookie_str):
         # 这里再次抛出，让上层捕获并提示安装
         raise ImportError("请先安装 playwright: pip install playwright 并运行 playwright install")
     
-    # 获取视频信息
-    cid = video_info.get("cid")
     title = video_info.get("title")
     if not title:
          error_msg = "缺少视频标题，无法继续"
@@ -89,281 +324,110 @@ def download_subtitle_with_browser(video_info, config, cookie_str):
     video_url = f"https://www.bilibili.com/video/{bv_id}"
     logging.info(f"[任务 {bv_id}] 准备使用无头浏览器访问: {video_url}")
     
-    # 解析 Cookie 函数
-    def parse_cookie_string_for_playwright(cookie_string):
-        cookies = []
-        for item in cookie_string.split(';'):
-            item = item.strip()
-            if not item:
-                continue
-            if '=' in item:
-                name, value = item.split('=', 1)
-                cookies.append({
-                    'name': name,
-                    'value': value,
-                    'domain': '.bilibili.com',
-                    'path': '/'
-                })
-        return cookies
-    
     # 设置全局变量
     global_captured_subtitles = []  # 全局变量存储所有尝试中捕获的字幕
-    MAX_ATTEMPTS = 3  # 最大尝试次数
-    HEADLESS_MODE = True  # 无头模式
-    subtitle_found = False
-    last_error_msg = "未知错误"
-    
-    try:
-        with sync_playwright() as p:
-            browser = None
+    block_resources = config.get("browser_pool", {}).get("block_resources", True)
+
+    # 每次尝试在浏览器池的常驻浏览器上新建上下文，不再每次启动浏览器
+    def capture(browser):
+        # 进行多次尝试
+        for attempt in range(1, BROWSER_MAX_ATTEMPTS + 1):
+            logging.info(f"[任务 {bv_id}] ===== 第 {attempt}/{BROWSER_MAX_ATTEMPTS} 次尝试获取字幕 =====")
+            context = None
+            page = None
+            subtitle_responses = []  # 本次尝试捕获到的字幕响应
+            phases = {}  # 各阶段耗时(秒)
+            blocked_requests = {}  # 按资源类型统计被拦截的请求数
+            phase_start = time.monotonic()
+
+            def end_phase(name):
+                nonlocal phase_start
+                now = time.monotonic()
+                phases[name] = round(now - phase_start, 2)
+                phase_start = now
+
             try:
-                # 初始化浏览器
-                logging.info(f"[任务 {bv_id}] 初始化 Playwright (Firefox)...")
-                browser = p.firefox.launch(headless=HEADLESS_MODE)
-                
-                # 进行多次尝试
-                for attempt in range(1, MAX_ATTEMPTS + 1):
-                    logging.info(f"[任务 {bv_id}] ===== 第 {attempt}/{MAX_ATTEMPTS} 次尝试获取字幕 =====")
-                    context = None
-                    page = None
-                    attempt_captured_subtitles = []  # 每次尝试捕获的字幕
-                    
+                # 创建上下文和页面
+                context = browser.new_context(**BROWSER_CONTEXT_OPTIONS)
+                if block_resources:
+                    _block_irrelevant_requests(context, blocked_requests)
+                if cookie_str:
+                    cookies = _parse_cookie_string_for_playwright(cookie_str)
+                    if cookies:
+                        context.add_cookies(cookies)
+                        logging.info(f"[任务 {bv_id}] 已添加 {len(cookies)} 个 Cookie")
+
+                # 播放器可能在点击前就自动加载字幕，所以从页面创建起就开始记录字幕响应
+                page = context.new_page()
+                page.on("response", lambda response: subtitle_responses.append(response) if _is_subtitle_response(response) else None)
+                end_phase("context")
+
+                # 收到页面响应即可，不等待整个文档解析完
+                logging.info(f"[任务 {bv_id}] 导航到视频页面: {video_url}")
+                page.goto(video_url, wait_until="commit", timeout=NAVIGATION_TIMEOUT_MS)
+                end_phase("navigate")
+
+                player_container = page.wait_for_selector(PLAYER_CONTAINER_SELECTOR, state="attached", timeout=PLAYER_TIMEOUT_MS)
+                end_phase("player")
+
+                if not subtitle_responses:
+                    # hover 和 click 会自动等待元素可见、稳定并可交互
+                    player_container.hover(timeout=ACTION_TIMEOUT_MS)
                     try:
-                        # 创建上下文和页面
-                        logging.info(f"[任务 {bv_id}] 创建浏览器上下文...")
-                        context = browser.new_context(
-                            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:109.0) Gecko/20100101 Firefox/115.0",
-                            viewport={"width": 1470, "height": 770}
-                        )
-                        
-                        # 设置网络响应监听器
-                        def handle_response(response):
-                            url = response.url
-                            if 'aisubtitle.hdslb.com' in url and response.status == 200:
-                                try:
-                                    content_type = response.headers.get('content-type', '').lower()
-                                    if 'json' in content_type or 'application/json' in content_type:
-                                        logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 捕获到字幕响应: {url}")
-                                        try:
-                                            # 同步读取响应文本
-                                            content_text = response.text()
-                                            logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 成功读取响应文本 (前50字符): {content_text[:50]}")
-                                            # 存储 URL 和文本内容
-                                            subtitle_data = {
-                                                "url": url,
-                                                "text": content_text
-                                            }
-                                            attempt_captured_subtitles.append(subtitle_data)
-                                            global_captured_subtitles.append(subtitle_data)
-                                        except Exception as read_e:
-                                            logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 读取字幕响应文本失败: {read_e}")
-                                except Exception as resp_e:
-                                    logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 处理响应时出错: {resp_e}")
-                        
-                        # 添加 Cookie 并打开页面
-                        if cookie_str:
-                            logging.info(f"[任务 {bv_id}] 解析并添加 Cookie...")
-                            cookies = parse_cookie_string_for_playwright(cookie_str)
-                            if cookies:
-                                context.add_cookies(cookies)
-                                logging.info(f"[任务 {bv_id}] 已添加 {len(cookies)} 个 Cookie")
-                        
-                        logging.info(f"[任务 {bv_id}] 创建新页面...")
-                        page = context.new_page()
-                        page.on("response", handle_response)
-                        
-                        # 打开视频页面
-                        logging.info(f"[任务 {bv_id}] 导航到视频页面: {video_url}")
-                        page.goto(video_url, wait_until="domcontentloaded", timeout=60000)
-                        logging.info(f"[任务 {bv_id}] 页面加载完成 (domcontentloaded)")
-                        
-                        # 等待播放器容器加载
-                        player_container_selector = "div.bpx-player-container"
-                        logging.info(f"[任务 {bv_id}] 等待播放器容器加载: {player_container_selector}")
-                        player_container = page.wait_for_selector(player_container_selector, state="attached", timeout=30000)
-                        logging.info(f"[任务 {bv_id}] 播放器容器已加载。")
-                        
-                        # 模拟鼠标悬停到播放器
-                        logging.info(f"[任务 {bv_id}] 模拟鼠标悬停到播放器...")
-                        player_container.scroll_into_view_if_needed()
-                        time.sleep(1)
-                        player_container.hover()
-                        logging.info(f"[任务 {bv_id}] 鼠标已悬停。")
-                        time.sleep(0.5)
-                        
-                        # 点击字幕按钮
-                        subtitle_button_selector = "div.bpx-player-ctrl-btn.bpx-player-ctrl-subtitle"
-                        subtitle_button = page.locator(subtitle_button_selector).first
-                        logging.info(f"[任务 {bv_id}] 尝试点击字幕按钮...")
-                        try:
-                            subtitle_button.click(timeout=10000)
-                            logging.info(f"[任务 {bv_id}] 字幕按钮已点击。")
-                        except Exception as click_e:
-                            logging.error(f"[任务 {bv_id}] 点击字幕按钮失败，尝试 JavaScript 点击: {click_e}")
-                            try:
-                                page.evaluate("(selector) => document.querySelector(selector).click()", subtitle_button_selector)
-                                logging.info(f"[任务 {bv_id}] JavaScript 点击成功。")
-                            except Exception as js_e:
-                                logging.error(f"[任务 {bv_id}] JavaScript 点击也失败: {js_e}")
-                                raise
-                        
-                        # 点击后短暂等待，确保点击事件被处理
-                        time.sleep(1)
-                        
-                        # 检查是否已经捕获到字幕
-                        if attempt_captured_subtitles:
-                            logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 已直接捕获 {len(attempt_captured_subtitles)} 个字幕响应")
-                        
-                        # 主动关闭上下文以触发字幕请求
-                        logging.info(f"[任务 {bv_id}] 主动关闭上下文以触发字幕请求...")
-                        
-                    except Exception as e:
-                        logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 执行过程中出现错误: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        
-                    finally:
-                        # 关闭上下文 - 这可能会触发字幕请求
-                        if context:
-                            logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 关闭浏览器上下文...")
-                            try:
-                                context.close()
-                            except Exception as ce:
-                                logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 关闭上下文出错: {ce}")
-                    
-                    # 检查本次尝试捕获结果
-                    if attempt_captured_subtitles:
-                        logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 在关闭上下文后发现 {len(attempt_captured_subtitles)} 个字幕响应")
-                        # 如果成功捕获字幕，可以提前结束尝试
-                        break
-                    else:
-                        logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 未捕获到字幕数据")
-                        if attempt < MAX_ATTEMPTS:
-                            logging.info(f"[任务 {bv_id}] 将在 2 秒后开始第 {attempt+1} 次尝试...")
-                            time.sleep(2)
-                
-                # 处理捕获到的字幕
-                subtitle_found = False
-                if global_captured_subtitles:
-                    logging.info(f"[任务 {bv_id}] 总共捕获到 {len(global_captured_subtitles)} 个字幕响应")
-                    
-                    for i, req_data in enumerate(global_captured_subtitles):
-                        subtitle_url = req_data["url"]
-                        content_text = req_data["text"]
-                        
-                        try:
-                            logging.info(f"[任务 {bv_id}] 处理第 {i+1} 个字幕响应: {subtitle_url}")
-                            logging.info(f"[任务 {bv_id}] 字幕响应文本 (前100字符): {content_text[:100]}")
-                            
-                            # 获取字幕语言标识
-                            subtitle_lang = f"browser_response_{i+1}"
-                            
-                            # 保存字幕JSON
-                            subtitle_json_path = get_download_path(config, video_info, f"subtitle_{subtitle_lang}_raw")
-                            
-                            try:
-                                with open(subtitle_json_path, 'w', encoding='utf-8') as f:
-                                    f.write(content_text)
-                                logging.info(f"[任务 {bv_id}] 原始字幕 JSON 已保存到: {subtitle_json_path}")
-                            except Exception as write_e:
-                                 logging.error(f"[任务 {bv_id}] 保存原始字幕 JSON 失败: {write_e}")
-                                 # 保存失败不影响后续解析尝试
-                            
-                            # 尝试解析JSON
-                            try:
-                                subtitle_data = json.loads(content_text)
-                                logging.info(f"[任务 {bv_id}] 字幕 JSON 解析成功")
-                                
-                                # 检查body结构
-                                if "body" in subtitle_data and isinstance(subtitle_data["body"], list):
-                                    logging.info(f"[任务 {bv_id}] 找到 'body' 字段，包含 {len(subtitle_data['body'])} 条字幕")
-                                    # 转换为SRT
-                                    srt_path = get_download_path(config, video_info, f"subtitle_{subtitle_lang}")
-                                    
-                                    try:
-                                        with open(srt_path, 'w', encoding='utf-8') as f:
-                                            for j, line in enumerate(subtitle_data["body"]):
-                                                # 添加对line结构的健壮性检查
-                                                if isinstance(line, dict) and "from" in line and "to" in line and "content" in line:
-                                                    start_time = format_time(line["from"])
-                                                    end_time = format_time(line["to"])
-                                                    content = line["content"]
-                                                    
-                                                    f.write(f"{j+1}\n") # 使用内部计数器j
-                                                    f.write(f"{start_time} --> {end_time}\n")
-                                                    f.write(f"{content}\n\n")
-                                                else:
-                                                    logging.warning(f"[任务 {bv_id}] 警告: 第 {j+1} 条字幕行格式不正确: {line}")
-                                                    continue # 跳过格式错误的行
-                                        
-                                        logging.info(f"[任务 {bv_id}] 字幕已转换为SRT格式: {srt_path}")
-                                        subtitle_found = True # *** 只有 SRT 写入成功才设置为 True ***
-                                        
-                                        # 创建主字幕文件的副本 (与BV号同名)
-                                        if i == 0:  # 只用第一个字幕作为主字幕
-                                            main_srt_path = get_download_path(config, video_info, "subtitle")
-                                            import shutil
-                                            try:
-                                                shutil.copy2(srt_path, main_srt_path)
-                                                logging.info(f"[任务 {bv_id}] 已创建主字幕文件: {main_srt_path}")
-                                            except Exception as copy_e:
-                                                logging.error(f"[任务 {bv_id}] 复制主字幕文件失败: {copy_e}")
-                                                
-                                    except Exception as srt_write_e:
-                                        last_error_msg = f"写入 SRT 文件失败: {srt_write_e}"
-                                        logging.error(f"[任务 {bv_id}] {last_error_msg}")
-                                        # SRT写入失败，不能算成功
-                                        subtitle_found = False
-                                else:
-                                    last_error_msg = f"字幕 JSON 缺少 'body' 列表结构。Keys: {subtitle_data.keys()}"
-                                    logging.error(f"[任务 {bv_id}] {last_error_msg}")
-                                    # 没有body，不能算成功
-                                    subtitle_found = False 
-                                    
-                            except Exception as json_e:
-                                last_error_msg = f"解析字幕JSON出错: {json_e}"
-                                logging.error(f"[任务 {bv_id}] {last_error_msg}")
-                                # JSON解析失败，不能算成功
-                                subtitle_found = False
-                                
-                        except Exception as outer_e:
-                            logging.error(f"[任务 {bv_id}] 处理响应内容时发生意外错误: {outer_e}")
-                            last_error_msg = f"处理响应时出错: {outer_e}"
-                            # 出错，不能算成功
-                            subtitle_found = False
-                            
-                        # 如果处理某个响应成功，就跳出循环
-                        if subtitle_found:
-                            break
-                            
-                else:
-                    last_error_msg = "未捕获到字幕请求"
-                    logging.error(f"[任务 {bv_id}] {last_error_msg}")
-            
+                        page.locator(SUBTITLE_BUTTON_SELECTOR).first.click(timeout=ACTION_TIMEOUT_MS)
+                    except Exception as click_e:
+                        logging.error(f"[任务 {bv_id}] 点击字幕按钮失败，尝试 JavaScript 点击: {click_e}")
+                        page.evaluate("(selector) => document.querySelector(selector).click()", SUBTITLE_BUTTON_SELECTOR)
+                    end_phase("button")
+
+                if not subtitle_responses:
+                    # 第一条字幕响应到达即返回
+                    subtitle_responses.append(page.wait_for_event("response", predicate=_is_subtitle_response,
+                                                                  timeout=SUBTITLE_RESPONSE_TIMEOUT_MS))
+                    end_phase("subtitle")
+
+                seen_urls = set()
+                for response in subtitle_responses:
+                    if response.url in seen_urls:
+                        continue
+                    seen_urls.add(response.url)
+                    try:
+                        content_text = response.text()
+                        logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 捕获到字幕响应: {response.url}")
+                        global_captured_subtitles.append({"url": response.url, "text": content_text})
+                    except Exception as read_e:
+                        logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 读取字幕响应文本失败: {read_e}")
+                end_phase("read")
+
+            except PlaywrightTimeoutError as e:
+                logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 等待超时，已完成阶段: {list(phases)}: {e}")
             except Exception as e:
-                last_error_msg = f"浏览器操作异常: {str(e)[:100]}" # 截断异常信息
-                logging.error(f"[任务 {bv_id}] {last_error_msg}")
-                import traceback
-                traceback.print_exc()
-                subtitle_found = False # 确保出错时为 False
+                logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 执行过程中出现错误: {e}")
+
             finally:
-                # 确保浏览器被关闭
-                if browser:
+                if context:
                     try:
-                        browser.close()
-                        logging.info(f"[任务 {bv_id}] 浏览器实例已关闭")
-                    except Exception as be:
-                        logging.error(f"[任务 {bv_id}] 关闭浏览器实例出错: {be}")
-    
+                        context.close()
+                    except Exception as ce:
+                        logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 关闭上下文出错: {ce}")
+                logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 各阶段耗时(秒): {phases}")
+                if blocked_requests:
+                    logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 已拦截请求 {sum(blocked_requests.values())} 个: {blocked_requests}")
+
+            if global_captured_subtitles:
+                break
+            logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 未捕获到字幕数据")
+
+    try:
+        logging.info(f"[任务 {bv_id}] 使用浏览器池中的 Firefox 捕获字幕...")
+        get_browser_pool().run(capture)
+        subtitle_found, last_error_msg = _save_captured_subtitles(video_info, config, global_captured_subtitles)
     except Exception as e:
         last_error_msg = f"浏览器操作异常: {str(e)[:100]}" # 截断异常信息
         logging.error(f"[任务 {bv_id}] {last_error_msg}")
         import traceback
         traceback.print_exc()
         subtitle_found = False # 确保出错时为 False
-    finally:
-        # 这里不需要操作，因为真正的浏览器关闭在with语句内部完成
-        pass
     
     if subtitle_found:
         logging.info(f"[任务 {bv_id}] download_subtitle_with_browser 最终成功返回")
@@ -371,3 +435,184 @@ def download_subtitle_with_browser(video_info, config, cookie_str):
     else:
         logging.error(f"[任务 {bv_id}] download_subtitle_with_browser 最终失败返回: {last_error_msg}")
         return False, last_error_msg
+
+async def _capture_page_async(context, video_info, attempt):
+    """在 context 中打开一个新页面抓取 video_info 的字幕响应，返回 [{"url", "text"}]"""
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    bv_id = video_info.get("bv_id", "未知BV")
+    video_url = f"https://www.bilibili.com/video/{bv_id}"
+    subtitle_responses = []
+    captured = []
+    phases = {}
+    phase_start = time.monotonic()
+
+    def end_phase(name):
+        nonlocal phase_start
+        now = time.monotonic()
+        phases[name] = round(now - phase_start, 2)
+        phase_start = now
+
+    page = await context.new_page()
+    page.on("response", lambda response: subtitle_responses.append(response) if _is_subtitle_response(response) else None)
+    try:
+        await page.goto(video_url, wait_until="commit", timeout=NAVIGATION_TIMEOUT_MS)
+        end_phase("navigate")
+        player_container = await page.wait_for_selector(PLAYER_CONTAINER_SELECTOR, state="attached", timeout=PLAYER_TIMEOUT_MS)
+        end_phase("player")
+
+        if not subtitle_responses:
+            await player_container.hover(timeout=ACTION_TIMEOUT_MS)
+            try:
+                await page.locator(SUBTITLE_BUTTON_SELECTOR).first.click(timeout=ACTION_TIMEOUT_MS)
+            except Exception as click_e:
+                logging.error(f"[任务 {bv_id}] 点击字幕按钮失败，尝试 JavaScript 点击: {click_e}")
+                await page.evaluate("(selector) => document.querySelector(selector).click()", SUBTITLE_BUTTON_SELECTOR)
+            end_phase("button")
+
+        if not subtitle_responses:
+            subtitle_responses.append(await page.wait_for_event("response", predicate=_is_subtitle_response,
+                                                                timeout=SUBTITLE_RESPONSE_TIMEOUT_MS))
+            end_phase("subtitle")
+
+        seen_urls = set()
+        for response in subtitle_responses:
+            if response.url in seen_urls:
+                continue
+            seen_urls.add(response.url)
+            try:
+                captured.append({"url": response.url, "text": await response.text()})
+            except Exception as read_e:
+                logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 读取字幕响应文本失败: {read_e}")
+    except PlaywrightTimeoutError as e:
+        logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 等待超时，已完成阶段: {list(phases)}: {e}")
+    except Exception as e:
+        logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 执行过程中出现错误: {e}")
+    finally:
+        try:
+            await page.close()
+        except Exception as ce:
+            logging.error(f"[任务 {bv_id}] [尝试 {attempt}] 关闭页面出错: {ce}")
+        logging.info(f"[任务 {bv_id}] [尝试 {attempt}] 各阶段耗时(秒): {phases}")
+    return captured
+
+async def _capture_subtitles_async(video_infos, config, cookie_str, concurrency, results):
+    """在一个浏览器中以最多 concurrency 个并发页面抓取字幕，每个视频抓到后立即写入SRT"""
+    from playwright.async_api import async_playwright
+
+    pool_config = config.get("browser_pool", {})
+    block_resources = pool_config.get("block_resources", True)
+    # 页面分布到几个上下文中，既共享缓存又不会让单个上下文承载过多页面
+    context_count = max(1, min(len(video_infos), -(-concurrency // BATCH_PAGES_PER_CONTEXT)))
+    semaphore = asyncio.Semaphore(concurrency)
+    cookies = _parse_cookie_string_for_playwright(cookie_str) if cookie_str else []
+    blocked_requests = {}
+
+    async def handle_route(route):
+        request = route.request
+        if _should_block_request(request):
+            blocked_requests[request.resource_type] = blocked_requests.get(request.resource_type, 0) + 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async with async_playwright() as playwright:
+        browser = await playwright.firefox.launch(headless=pool_config.get("headless", True),
+                                                  firefox_user_prefs=LIGHTWEIGHT_FIREFOX_PREFS if block_resources else None)
+        try:
+            contexts = []
+            for _ in range(context_count):
+                context = await browser.new_context(**BROWSER_CONTEXT_OPTIONS)
+                if block_resources:
+                    await context.route("**/*", handle_route)
+                if cookies:
+                    await context.add_cookies(cookies)
+                contexts.append(context)
+
+            async def process(index, video_info):
+                bv_id = video_info.get("bv_id", "未知BV")
+                captured = []
+                async with semaphore:
+                    for attempt in range(1, BROWSER_MAX_ATTEMPTS + 1):
+                        captured = await _capture_page_async(contexts[index % context_count], video_info, attempt)
+                        if captured:
+                            break
+                        logging.warning(f"[任务 {bv_id}] [尝试 {attempt}] 未捕获到字幕数据")
+                # 写文件不占用页面名额，并放到线程中执行，避免阻塞事件循环中的其他页面
+                try:
+                    results[bv_id] = await asyncio.to_thread(_save_captured_subtitles, video_info, config, captured)
+                except Exception as e:
+                    results[bv_id] = (False, f"保存字幕失败: {str(e)[:100]}")
+                logging.info(f"[批量字幕] {bv_id}: {'成功' if results[bv_id][0] else results[bv_id][1]} ({len(results)}/{len(video_infos)})")
+
+            await asyncio.gather(*(process(index, video_info) for index, video_info in enumerate(video_infos)))
+        finally:
+            await browser.close()
+    if blocked_requests:
+        logging.info(f"[批量字幕] 已拦截请求 {sum(blocked_requests.values())} 个: {blocked_requests}")
+
+def download_subtitles_with_browser(video_infos, config, cookie_str, concurrency=None):
+    """使用异步 Playwright 并发抓取多个视频的字幕
+
+    Returns:
+        {bv_id: (bool, str|None)}，与 download_subtitle_with_browser 的返回值一致
+    """
+    # 在调用线程中检查依赖，缺少 Playwright 时抛出 ImportError 而不是在事件循环中失败
+    if importlib.util.find_spec("playwright") is None:
+        raise ImportError("请先安装 playwright: pip install playwright 并运行 playwright install")
+
+    if not video_infos:
+        return {}
+    if concurrency is None:
+        concurrency = config.get("browser_pool", {}).get("batch_concurrency", 4)
+    concurrency = max(1, int(concurrency))
+    results = {}
+    start = time.time()
+    logging.info(f"[批量字幕] 开始抓取 {len(video_infos)} 个视频的字幕，并发数 {concurrency}")
+    try:
+        asyncio.run(_capture_subtitles_async(video_infos, config, cookie_str, concurrency, results))
+    except Exception as e:
+        logging.error(f"[批量字幕] 浏览器操作异常: {e}")
+        import traceback
+        traceback.print_exc()
+    for video_info in video_infos:
+        results.setdefault(video_info.get("bv_id", "未知BV"), (False, "浏览器异常，未完成抓取"))
+
+    elapsed = time.time() - start
+    succeeded = sum(1 for success, _ in results.values() if success)
+    logging.info(f"[批量字幕] 完成 {succeeded}/{len(video_infos)}，耗时 {elapsed:.1f} 秒 "
+                 f"({len(video_infos) * 60 / max(elapsed, 0.001):.1f} 个视频/分钟)")
+    return results
+
+def download_subtitles(video_infos, config, headers, concurrency=None):
+    """批量下载字幕：先逐个尝试播放器接口，剩下的视频一起交给异步浏览器并发抓取
+
+    Returns:
+        {bv_id: (bool, str|None)}
+    """
+    results = {}
+    if not ("Cookie" in headers and headers["Cookie"]):
+        error_msg = "未设置有效 Cookie，无法获取 AI 字幕。请在设置中配置 Cookie。"
+        return {video_info.get("bv_id", "未知BV"): (False, error_msg) for video_info in video_infos}
+
+    remaining = []
+    for video_info in video_infos:
+        bv_id = video_info.get("bv_id", "未知BV")
+        try:
+            success, api_msg = download_subtitle_from_api(video_info, config, headers)
+        except Exception as e:
+            success, api_msg = False, str(e)
+        if success:
+            results[bv_id] = (True, None)
+        else:
+            logging.info(f"[任务 {bv_id}] 播放器接口未获取到字幕 ({api_msg})，加入浏览器批量抓取")
+            remaining.append(video_info)
+
+    if remaining:
+        try:
+            results.update(download_subtitles_with_browser(remaining, config, headers["Cookie"], concurrency))
+        except ImportError as e:
+            logging.error(f"缺少 Playwright 依赖: {e}")
+            for video_info in remaining:
+                results[video_info.get("bv_id", "未知BV")] = (False, "缺少 Playwright")
+    return results
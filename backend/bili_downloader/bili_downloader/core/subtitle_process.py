@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import queue
+import signal
+import atexit
+import threading
+import subprocess
+from ..config.config_manager import load_config
+
+DEFAULT_SUBTITLE_PROCESS = {
+    "size": 2,  # 同时运行的字幕子进程数
+    "job_timeout": 180,  # 单次字幕抓取的期限(秒)，超时后杀掉整个子进程树
+    "max_jobs_per_worker": 20  # 每个子进程处理多少个任务后回收，防止浏览器泄漏的内存累积
+}
+
+# 子进程以 python -m 方式运行本模块，需要能导入顶层的 bili_downloader 包
+PACKAGE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+WORKER_MODULE = "bili_downloader.bili_downloader.core.subtitle_process"
+
+# 字幕抓取放在独立的子进程中执行：Playwright 和 Firefox 卡死时，
+# 线程无法被强制结束，而子进程连同它启动的浏览器可以整个杀掉
+
+def _descendants(pid):
+    """返回 pid 的所有子孙进程 (依赖 /proc，其他平台返回空列表)"""
+    children = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm 字段可能包含空格和括号，ppid 在最后一个 ')' 之后的第二个字段
+        fields = stat[stat.rfind(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    result = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            result.append(child)
+            pending.append(child)
+    return result
+
+def kill_process_tree(process):
+    """杀掉子进程及其启动的所有进程
+
+    Playwright 会把浏览器放到单独的进程组中，只杀进程组不够，
+    所以先暂停整棵进程树防止继续派生新进程，再逐个发送 SIGKILL。
+    """
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        process.wait()
+        return
+
+    stopped = []
+    tree = [process.pid]
+    while tree:
+        for pid in tree:
+            try:
+                os.kill(pid, signal.SIGSTOP)
+            except OSError:
+                pass
+            stopped.append(pid)
+        tree = [pid for pid in _descendants(process.pid) if pid not in stopped]
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    for pid in stopped:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    process.wait()
+
+class _Worker:
+    def __init__(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get("PYTHONPATH")]))
+        env["PYTHONIOENCODING"] = "utf-8"
+        kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", WORKER_MODULE],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            env=env, encoding="utf-8", **kwargs
+        )
+        self.jobs = 0
+        self.results = queue.Queue()
+        # 读取线程把结果行放入队列，等待结果时就可以设置期限 (Windows 的管道不支持 select)
+        threading.Thread(target=self._read_results, name=f"subtitle-worker-{self.process.pid}", daemon=True).start()
+
+    def _read_results(self):
+        for line in self.process.stdout:
+            self.results.put(line)
+        self.results.put(None)
+
+    def run(self, job, timeout):
+        """发送任务并等待结果；超时返回 None，子进程退出时抛出 EOFError"""
+        self.process.stdin.write(json.dumps(job, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+        self.jobs += 1
+        try:
+            line = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if line is None:
+            raise EOFError(f"字幕子进程已退出 (返回码 {self.process.poll()})")
+        return json.loads(line)
+
+    def kill(self):
+        kill_process_tree(self.process)
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+class SubtitleProcessPool:
+    """在受监管的子进程中执行 download_subtitle
+
+    每个任务有独立的期限，超时的子进程连同它启动的浏览器一起被杀掉；
+    子进程处理 max_jobs_per_worker 个任务后也会被回收。
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.slots = threading.BoundedSemaphore(max(1, int(settings["size"])))
+        self.lock = threading.Lock()
+        self.idle = []
+        self.busy = 0
+        self.stats = {
+            "jobs": 0,
+            "spawned": 0,
+            "recycled": 0,
+            "killed": 0,
+            "crashed": 0
+        }
+
+    def run(self, video_info, config, headers, timeout=None):
+        """在子进程中下载字幕，返回 (bool, str|None)元组"""
+        if timeout is None:
+            timeout = self.settings["job_timeout"]
+        bv_id = video_info.get("bv_id", "未知BV")
+        job = {"video_info": video_info, "config": config, "headers": headers}
+
+        with self.slots:
+            with self.lock:
+                # 空闲期间意外退出的子进程直接丢弃
+                self.idle = [idle for idle in self.idle if idle.process.poll() is None]
+                worker = self.idle.pop() if self.idle else None
+                self.busy += 1
+                self.stats["jobs"] += 1
+            try:
+                if worker is None:
+                    worker = _Worker()
+                    with self.lock:
+                        self.stats["spawned"] += 1
+                try:
+                    result = worker.run(job, timeout)
+                except (EOFError, OSError, ValueError) as e:
+                    print(f"[字幕子进程] {bv_id}: 子进程异常退出: {e}")
+                    sys.stdout.flush()
+                    worker.kill()
+                    with self.lock:
+                        self.stats["crashed"] += 1
+                    return False, "字幕子进程异常退出"
+
+                if result is None:
+                    print(f"[字幕子进程] {bv_id}: 超过 {timeout} 秒未完成，杀掉子进程 {worker.process.pid} 及其浏览器")
+                    sys.stdout.flush()
+                    worker.kill()
+                    with self.lock:
+                        self.stats["killed"] += 1
+                    return False, f"超时 ({timeout}秒)"
+
+                if worker.jobs >= int(self.settings["max_jobs_per_worker"]):
+                    print(f"[字幕子进程] 子进程 {worker.process.pid} 已处理 {worker.jobs} 个任务，回收")
+                    sys.stdout.flush()
+                    worker.kill()
+                    with self.lock:
+                        self.stats["recycled"] += 1
+                else:
+                    with self.lock:
+                        self.idle.append(worker)
+                return bool(result.get("success")), result.get("error")
+            finally:
+                with self.lock:
+                    self.busy -= 1
+
+    def shutdown(self):
+        with self.lock:
+            workers, self.idle = self.idle, []
+        for worker in workers:
+            worker.kill()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, idle=len(self.idle), busy=self.busy, max_size=self.settings["size"])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_subtitle_process_pool():
+    """获取进程内共享的字幕子进程池 (首次调用时按配置创建)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = dict(DEFAULT_SUBTITLE_PROCESS)
+                settings.update(load_config().get("subtitle_process", {}))
+                _pool = SubtitleProcessPool(settings)
+                atexit.register(_pool.shutdown)
+    return _pool
+
+def get_subtitle_process_stats():
+    """返回字幕子进程池的运行指标，尚未使用过时返回空的指标"""
+    if _pool is None:
+        return {"jobs": 0, "spawned": 0, "recycled": 0, "killed": 0, "crashed": 0}
+    return _pool.get_stats()
+
+def _worker_main():
+    """子进程入口：从 stdin 逐行读取任务，把结果逐行写回原来的 stdout"""
+    # 下载过程中的 print 都转到 stderr，stdout 只用于返回结果
+    results = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    from ..core.subtitle import download_subtitle
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            success, error = download_subtitle(job["video_info"], job["config"], job["headers"])
+        except Exception as e:
+            success, error = False, f"子进程异常: {str(e)[:50]}"
+        results.write(json.dumps({"success": bool(success), "error": error}, ensure_ascii=False) + "\n")
+        results.flush()
+
+if __name__ == "__main__":
+    _worker_main()
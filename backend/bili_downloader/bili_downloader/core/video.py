@@ -1,15 +1,28 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-import json
 import re
 import time
-import requests
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from ..utils.helpers import sanitize_filename
-from ..core.downloader import download_file
+from ..core.downloader import download_file, DEFAULT_SEGMENTS, DEFAULT_MIN_SEGMENT_SIZE
+from ..core.http_client import get_session
+from ..core.rate_limiter import bili_api_get
+from ..core.cdn import rank_mirrors, get_cdn_settings
+from ..core.media import concat_segments, mux_streams, remux_audio, probe_duration, duration_matches
+from ..core.audio import produce_audio, get_audio_format
 from ..config.config_manager import get_download_path
 
+MAX_PARALLEL_DURLS = 4  # 同时下载的durl分段数
+
+# 请求DASH格式 (16)，同时声明支持HDR(64)、4K(128)、杜比音频(256)、杜比视界(512)、8K(1024)和AV1(2048)
+DASH_FNVAL = 4048
+
+# DASH视频流的codecid与编码名称对应关系
+DASH_CODECS = {7: "avc", 12: "hevc", 13: "av1"}
+DEFAULT_QUALITY_PREFERENCE = [120, 116, 112, 80, 64, 32, 16]
+DEFAULT_CODEC_PREFERENCE = ["avc", "hevc", "av1"]
+
 def get_video_info(bv_id, cookie=""):
     """获取视频信息"""
     # 确保BV号格式正确
@@ -34,7 +47,7 @@ def get_video_info(bv_id, cookie=""):
         
         # 获取视频信息
         video_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bv_id}"
-        response = requests.get(video_url, headers=headers)
+        response = bili_api_get(video_url, headers=headers)
         response.raise_for_status()
         data = response.json()
         
@@ -87,15 +100,8 @@ def get_video_info(bv_id, cookie=""):
         sys.stdout.flush()
         return None
 
-def download_and_process_video(video_info, config, download_options, headers):
-    """下载并处理视频"""
-    bv_id = video_info["bv_id"]
-    cid = video_info["cid"]
-    title = video_info["title"]
-    
-    # 使用新的路径规则获取视频保存路径
-    video_path = get_download_path(config, video_info, "video")
-    
+def _save_metadata(video_info, config, headers):
+    """下载封面图并生成NFO文件"""
     # 下载封面图
     if video_info.get("cover_url"):
         cover_path = get_download_path(config, video_info, "poster")
@@ -104,6 +110,36 @@ def download_and_process_video(video_info, config, download_options, headers):
     # 生成NFO文件
     nfo_path = get_download_path(config, video_info, "nfo")
     generate_nfo_file(video_info, nfo_path)
+
+def _request_playurl(bv_id, cid, config, headers):
+    """请求playurl接口，成功时返回其中的data字段，失败返回None"""
+    dash_config = config.get("dash", {})
+    if dash_config.get("enabled", True):
+        # DASH: 视频流和音频流分开返回，可获取1080P以上清晰度和HEVC/AV1编码
+        download_url = f"https://api.bilibili.com/x/player/playurl?bvid={bv_id}&cid={cid}&qn=127&otype=json&fnval={DASH_FNVAL}&fnver=0&fourk=1"
+    else:
+        download_url = f"https://api.bilibili.com/x/player/playurl?bvid={bv_id}&cid={cid}&qn=80&otype=json&fnval=1&fnver=0"
+    response = bili_api_get(download_url, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+    
+    # 检查响应
+    if data["code"] != 0:
+        error_msg = data["message"]
+        print(f"获取下载地址失败: {error_msg}")
+        return None
+    return data["data"]
+
+def download_and_process_video(video_info, config, download_options, headers, task_id=None):
+    """下载并处理视频"""
+    bv_id = video_info["bv_id"]
+    cid = video_info["cid"]
+    title = video_info["title"]
+    
+    # 使用新的路径规则获取视频保存路径
+    video_path = get_download_path(config, video_info, "video")
+    
+    _save_metadata(video_info, config, headers)
     
     # 如果只需要音频且视频已存在，跳过视频下载
     if download_options.get("audio", False) and not download_options.get("video", False):
@@ -115,19 +151,11 @@ def download_and_process_video(video_info, config, download_options, headers):
         # 获取视频下载地址
         print(f"获取视频下载地址: {bv_id}, cid={cid}")
         
-        download_url = f"https://api.bilibili.com/x/player/playurl?bvid={bv_id}&cid={cid}&qn=80&otype=json&fnval=1&fnver=0"
-        response = requests.get(download_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        # 检查响应
-        if data["code"] != 0:
-            error_msg = data["message"]
-            print(f"获取下载地址失败: {error_msg}")
+        play_data = _request_playurl(bv_id, cid, config, headers)
+        if play_data is None:
             return False, ""
         
-        # 提取视频地址
-        durl = data["data"]["durl"][0]["url"]
+        timelength = play_data.get("timelength", 0) / 1000
         
         # 下载视频
         print(f"开始下载视频: {title}")
@@ -135,10 +163,27 @@ def download_and_process_video(video_info, config, download_options, headers):
         # 确保目录存在
         os.makedirs(os.path.dirname(video_path), exist_ok=True)
         
-        # 下载视频文件
-        success = download_file(durl, video_path, headers)
+        # 先下载到 .part 文件，中断后可以断点续传
+        part_path = f"{video_path}.part"
+        durls = play_data.get("durl") or []
+        if play_data.get("dash"):
+            # 需要音频时保留音频流，直接作为音频的来源，无需再从视频中分离
+            audio_m4a_path = get_download_path(config, video_info, "audio_m4a") if download_options.get("audio", False) else None
+            success = _download_dash(play_data["dash"], video_path, part_path, timelength,
+                                     config, headers, task_id, audio_m4a_path)
+        elif not durls:
+            print("获取下载地址失败: 响应中没有可用的视频流")
+            return False, ""
+        elif len(durls) == 1:
+            success = _download_entry(durls[0], part_path, config, headers, task_id)
+        else:
+            # 长视频会被拆成多个分段，全部下载后无损拼接
+            success = _download_durl_segments(durls, video_path, part_path, timelength, config, headers, task_id)
         
         if success:
+            # 下载完整后原子地重命名为最终文件名，不会出现半个视频文件
+            os.replace(part_path, video_path)
+            
             # 如果视频下载失败，返回失败状态
             if not os.path.exists(video_path):
                 print(f"下载视频失败: 文件不存在 - {video_path}")
@@ -158,6 +203,263 @@ def download_and_process_video(video_info, config, download_options, headers):
         print(f"下载视频时出错: {e}")
         return False, ""
 
+def download_audio_only(video_info, config, download_options, headers, task_id=None):
+    """仅下载音频，只获取DASH音频流，不下载视频
+    
+    音频流以流复制方式封装为M4A，只有要求MP3格式时才重新编码。
+    接口没有返回DASH音频流时回退为下载视频后提取音频。
+    
+    返回:
+        (bool, str): 是否成功，音频文件路径
+    """
+    bv_id = video_info["bv_id"]
+    cid = video_info["cid"]
+    audio_format = get_audio_format(config, download_options)
+    
+    _save_metadata(video_info, config, headers)
+    
+    try:
+        print(f"获取音频下载地址: {bv_id}, cid={cid}")
+        play_data = _request_playurl(bv_id, cid, config, headers)
+        if play_data is None:
+            return False, ""
+        
+        dash = play_data.get("dash") or {}
+        audio_stream = _select_audio_stream(dash, config.get("dash", {}).get("prefer_hires_audio", True))
+        if audio_stream is None:
+            print("接口没有返回独立的音频流，改为下载视频后提取音频")
+            video_success, video_path = download_and_process_video(video_info, config, download_options, headers, task_id)
+            if not video_success:
+                return False, ""
+            return produce_audio(video_path, video_info, config, audio_format, task_id)
+        
+        m4a_path = get_download_path(config, video_info, "audio_m4a")
+        os.makedirs(os.path.dirname(m4a_path), exist_ok=True)
+        
+        # 音频流下载完成后才会重命名为 .m4s，已存在时直接复用
+        stream_path = f"{m4a_path}.audio.m4s"
+        if not os.path.exists(stream_path):
+            stream_part = f"{stream_path}.part"
+            if not _download_entry(audio_stream, stream_part, config, headers, task_id, "下载音频: "):
+                print(f"下载音频失败: {bv_id}")
+                return False, ""
+            os.replace(stream_part, stream_path)
+        
+        # 直接由音频流生成最终文件，MP3时也不需要中间的M4A
+        audio_success, audio_path = produce_audio(stream_path, video_info, config, audio_format, task_id)
+        if audio_success:
+            os.remove(stream_path)
+            print(f"音频下载完成: {audio_path}")
+            sys.stdout.flush()
+        return audio_success, audio_path
+    except Exception as e:
+        print(f"下载音频时出错: {e}")
+        return False, ""
+
+def _select_audio_stream(dash, prefer_hires=True):
+    """选择要下载的音频流
+    
+    prefer_hires 为True时优先选择Hi-Res无损(FLAC)，其次杜比全景声，否则选择普通音轨中码率最高的一条。
+    """
+    if prefer_hires:
+        flac_audio = (dash.get("flac") or {}).get("audio")
+        if flac_audio:
+            print("选择Hi-Res无损音轨")
+            return flac_audio
+        dolby_audios = (dash.get("dolby") or {}).get("audio") or []
+        if dolby_audios:
+            print("选择杜比全景声音轨")
+            return max(dolby_audios, key=lambda a: a.get("bandwidth", 0))
+    audios = dash.get("audio") or []
+    if not audios:
+        return None
+    return max(audios, key=lambda a: a.get("bandwidth", 0))
+
+def _candidate_urls(entry):
+    """取出durl/DASH条目的主地址和备用地址 (DASH条目同时存在驼峰和下划线两种字段名)"""
+    primary = entry.get("url") or entry.get("baseUrl") or entry.get("base_url")
+    backups = entry.get("backup_url") or entry.get("backupUrl") or []
+    return [primary] + list(backups)
+
+def _download_entry(entry, file_path, config, headers, task_id=None, desc="下载视频: "):
+    """下载单个durl或DASH流条目，主地址和备用地址按实测速度排序"""
+    mirror_urls = rank_mirrors(_candidate_urls(entry), headers, config)
+    
+    downloader_config = config.get("downloader", {})
+    cdn_settings = get_cdn_settings(config)
+    return download_file(
+        mirror_urls, file_path, headers,
+        segments=downloader_config.get("segments", DEFAULT_SEGMENTS),
+        min_segment_size=downloader_config.get("min_segment_size", DEFAULT_MIN_SEGMENT_SIZE),
+        task_id=task_id,
+        min_throughput=cdn_settings["min_throughput"],
+        slow_check_interval=cdn_settings["slow_check_interval"],
+        desc=desc
+    )
+
+def _download_durl_segments(durls, video_path, part_path, timelength, config, headers, task_id=None):
+    """并行下载playurl返回的所有durl分段，再用concat demuxer流复制拼接到 part_path
+    
+    拼接结果的时长与 timelength 校验一致后才删除临时分段，校验失败时保留分段，
+    下次重试可以跳过已完成的分段直接重新拼接。
+    """
+    segment_count = len(durls)
+    print(f"视频共有 {segment_count} 个分段，开始并行下载")
+    sys.stdout.flush()
+    
+    # 分段下载完成后才会重命名为 .segN，已存在的分段直接复用
+    durls = sorted(durls, key=lambda d: d.get("order", 0))
+    segment_paths = [f"{video_path}.seg{i + 1}" for i in range(segment_count)]
+    
+    def download_segment(index):
+        segment_path = segment_paths[index]
+        if os.path.exists(segment_path):
+            print(f"分段 {index + 1}/{segment_count} 已存在，跳过下载")
+            return True
+        segment_part = f"{segment_path}.part"
+        desc = f"分段 {index + 1}/{segment_count}: "
+        if not _download_entry(durls[index], segment_part, config, headers, task_id, desc):
+            print(f"分段 {index + 1}/{segment_count} 下载失败")
+            return False
+        os.replace(segment_part, segment_path)
+        print(f"分段 {index + 1}/{segment_count} 下载完成")
+        sys.stdout.flush()
+        return True
+    
+    with ThreadPoolExecutor(max_workers=min(segment_count, MAX_PARALLEL_DURLS)) as executor:
+        results = list(executor.map(download_segment, range(segment_count)))
+    if not all(results):
+        return False
+    
+    concat_success, concat_error = concat_segments(segment_paths, part_path)
+    if not concat_success:
+        print(f"拼接视频分段失败: {concat_error}")
+        return False
+    
+    # 校验拼接后的总时长，确认没有丢失分段
+    actual_duration = probe_duration(part_path)
+    if timelength and not duration_matches(actual_duration, timelength):
+        print(f"拼接后的视频时长与预期不符: 预期 {timelength:.1f} 秒，实际 {actual_duration}")
+        os.remove(part_path)
+        return False
+    print(f"视频分段拼接完成并通过时长校验: {actual_duration} 秒")
+    
+    for segment_path in segment_paths:
+        try:
+            os.remove(segment_path)
+        except OSError as e:
+            print(f"删除临时分段失败: {e}")
+    sys.stdout.flush()
+    return True
+
+def _select_dash_streams(dash, dash_config):
+    """按配置的清晰度和编码偏好选出一条视频流，音频流取码率最高的一条
+    
+    偏好列表中的清晰度都不可用时使用最高清晰度，偏好的编码都不可用时使用该清晰度下的第一条流。
+    
+    返回:
+        (dict, dict|None): 视频流条目和音频流条目，无声视频的音频流为None
+    """
+    videos = dash.get("video") or []
+    if not videos:
+        return None, None
+    
+    quality_preference = dash_config.get("quality_preference") or DEFAULT_QUALITY_PREFERENCE
+    codec_preference = dash_config.get("codec_preference") or DEFAULT_CODEC_PREFERENCE
+    
+    available_qualities = {v.get("id") for v in videos}
+    quality = next((q for q in quality_preference if q in available_qualities),
+                   max(available_qualities))
+    candidates = [v for v in videos if v.get("id") == quality]
+    
+    def codec_rank(stream):
+        codec = DASH_CODECS.get(stream.get("codecid"))
+        return codec_preference.index(codec) if codec in codec_preference else len(codec_preference)
+    
+    video_stream = min(candidates, key=codec_rank)
+    
+    return video_stream, _select_audio_stream(dash, prefer_hires=False)
+
+def _download_dash(dash, video_path, part_path, timelength, config, headers, task_id=None, audio_m4a_path=None):
+    """并行下载DASH视频流和音频流，再用流复制合并到 part_path
+    
+    audio_m4a_path 不为空时，音频流同时封装为M4A保存到该路径，供音频下载直接使用。
+    """
+    video_stream, audio_stream = _select_dash_streams(dash, config.get("dash", {}))
+    if video_stream is None:
+        print("DASH响应中没有视频流")
+        return False
+    
+    codec = DASH_CODECS.get(video_stream.get("codecid"), video_stream.get("codecs", "未知"))
+    print(f"选择DASH视频流: 清晰度 {video_stream.get('id')}，编码 {codec}，"
+          f"分辨率 {video_stream.get('width')}x{video_stream.get('height')}")
+    if audio_stream:
+        print(f"选择DASH音频流: {audio_stream.get('id')}，码率 {audio_stream.get('bandwidth', 0) // 1000}kbps")
+    else:
+        print("该视频没有音频流")
+    sys.stdout.flush()
+    
+    # 流下载完成后才会重命名为 .m4s，已存在的流直接复用
+    streams = [("视频流", video_stream, f"{video_path}.video.m4s")]
+    if audio_stream:
+        streams.append(("音频流", audio_stream, f"{video_path}.audio.m4s"))
+    
+    def download_stream(stream):
+        name, entry, stream_path = stream
+        if os.path.exists(stream_path):
+            print(f"{name}已存在，跳过下载")
+            return True
+        stream_part = f"{stream_path}.part"
+        if not _download_entry(entry, stream_part, config, headers, task_id, f"{name}: "):
+            print(f"{name}下载失败")
+            return False
+        os.replace(stream_part, stream_path)
+        print(f"{name}下载完成")
+        sys.stdout.flush()
+        return True
+    
+    with ThreadPoolExecutor(max_workers=len(streams)) as executor:
+        results = list(executor.map(download_stream, streams))
+    if not all(results):
+        return False
+    
+    video_stream_path = streams[0][2]
+    audio_stream_path = streams[1][2] if audio_stream else None
+    
+    mux_start = time.time()
+    mux_success, mux_error = mux_streams(video_stream_path, audio_stream_path, part_path)
+    if not mux_success:
+        print(f"合并视频流和音频流失败: {mux_error}")
+        return False
+    
+    expected_duration = dash.get("duration") or timelength
+    actual_duration = probe_duration(part_path)
+    if expected_duration and not duration_matches(actual_duration, expected_duration):
+        print(f"合并后的视频时长与预期不符: 预期 {expected_duration:.1f} 秒，实际 {actual_duration}")
+        os.remove(part_path)
+        return False
+    print(f"视频流和音频流合并完成 (耗时: {time.time() - mux_start:.2f}秒)")
+    
+    if audio_stream_path and audio_m4a_path:
+        audio_part = f"{audio_m4a_path}.part"
+        remux_success, remux_error = remux_audio(audio_stream_path, audio_part)
+        if remux_success:
+            os.replace(audio_part, audio_m4a_path)
+            print(f"音频流已保存为M4A: {audio_m4a_path}")
+        else:
+            # 音频仍可以从合并后的视频中提取，这里失败不影响视频下载
+            print(f"保存M4A音频失败: {remux_error}")
+            if os.path.exists(audio_part):
+                os.remove(audio_part)
+    
+    for _, _, stream_path in streams:
+        try:
+            os.remove(stream_path)
+        except OSError as e:
+            print(f"删除临时流文件失败: {e}")
+    sys.stdout.flush()
+    return True
+
 def sanitize_filename(filename):
     """移除文件名中的非法字符，避免路径问题"""
     # 移除Windows和类Unix系统中不允许的字符
@@ -197,7 +499,7 @@ def download_cover(cover_url, cover_path, headers):
         
         # 下载封面图
         print(f"开始下载封面图: {cover_path}")
-        response = requests.get(cover_url, headers=headers)
+        response = get_session().get(cover_url, headers=headers)
         response.raise_for_status()
         
         with open(cover_path, 'wb') as f:
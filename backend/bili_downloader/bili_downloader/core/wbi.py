@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import hashlib
+import threading
+from urllib.parse import urlencode, urlparse
+from ..core.rate_limiter import bili_api_get
+
+NAV_API = "https://api.bilibili.com/x/web-interface/nav"
+
+# WBI 签名所用的字符重排表，由 img_key + sub_key 按该顺序取前32位得到 mixin_key
+MIXIN_KEY_ENC_TAB = [
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+]
+MIXIN_KEY_TTL = 6 * 3600  # B站每天轮换密钥，缓存几个小时即可
+FILTERED_CHARS = "!'()*"  # 签名前需要从参数值中去掉的字符
+
+_mixin_key = None
+_mixin_key_time = 0.0
+_mixin_key_lock = threading.Lock()
+
+def _key_from_url(url):
+    """从 https://i0.hdslb.com/bfs/wbi/<key>.png 中取出 <key>"""
+    return os.path.splitext(os.path.basename(urlparse(url).path))[0]
+
+def get_mixin_key(headers=None, refresh=False):
+    """获取 WBI 签名用的 mixin_key (带缓存，线程安全)
+
+    密钥来自 nav 接口的 wbi_img 字段，未登录时该接口同样会返回。
+    获取失败时返回 None。
+    """
+    global _mixin_key, _mixin_key_time
+    with _mixin_key_lock:
+        if not refresh and _mixin_key and time.time() - _mixin_key_time < MIXIN_KEY_TTL:
+            return _mixin_key
+        try:
+            response = bili_api_get(NAV_API, headers=headers, timeout=10)
+            wbi_img = response.json().get("data", {}).get("wbi_img", {})
+            raw_key = _key_from_url(wbi_img.get("img_url", "")) + _key_from_url(wbi_img.get("sub_url", ""))
+        except Exception as e:
+            print(f"[WBI] 获取签名密钥失败: {e}")
+            sys.stdout.flush()
+            return _mixin_key
+        if len(raw_key) < max(MIXIN_KEY_ENC_TAB) + 1:
+            print(f"[WBI] nav 接口返回的签名密钥无效: '{raw_key}'")
+            sys.stdout.flush()
+            return _mixin_key
+        _mixin_key = ''.join(raw_key[i] for i in MIXIN_KEY_ENC_TAB)[:32]
+        _mixin_key_time = time.time()
+        return _mixin_key
+
+def sign_params(params, headers=None):
+    """为请求参数添加 wts 和 w_rid 签名，返回新的参数字典
+
+    无法获取密钥时原样返回参数 (附带 wts)，由接口决定是否接受。
+    """
+    signed = dict(params)
+    signed["wts"] = int(time.time())
+    mixin_key = get_mixin_key(headers)
+    if not mixin_key:
+        return signed
+    signed = {
+        key: ''.join(ch for ch in str(value) if ch not in FILTERED_CHARS)
+        for key, value in sorted(signed.items())
+    }
+    query = urlencode(signed)
+    signed["w_rid"] = hashlib.md5((query + mixin_key).encode("utf-8")).hexdigest()
+    return signed
+
+def signed_url(base_url, params, headers=None):
+    """返回带 WBI 签名的完整请求URL"""
+    return f"{base_url}?{urlencode(sign_params(params, headers))}"
@@ -4,13 +4,17 @@ import os
 import argparse
 from .config.config_manager import load_config, set_cookie, ensure_folders_exist, get_download_path
 from .core.network import create_headers, check_login_status
-from .core.video import get_video_info, download_and_process_video
-from .core.audio import extract_audio
-from .core.subtitle import download_subtitle
+from .core.video import get_video_info, download_and_process_video, download_audio_only
+from .core.audio import produce_audio, get_audio_format
+from .core.subtitle import download_subtitle, download_subtitles
+from .core.danmaku import download_danmaku
 from .utils.helpers import show_download_menu
 
-def download_video(bv_id, download_options=None):
-    """下载视频、音频和字幕"""
+def download_video(bv_id, download_options=None, video_infos=None):
+    """下载视频、音频和字幕
+
+    video_infos 不为空时，把获取到的视频信息按BV号存入该字典，供调用方复用
+    """
     if download_options is None:
         download_options = {"video": True, "audio": False, "subtitle": False}
     
@@ -46,29 +50,45 @@ def download_video(bv_id, download_options=None):
     if not video_info:
         print(f"获取视频信息失败: {bv_id}")
         return False
+    if video_infos is not None:
+        video_infos[bv_id] = video_info
     
     # 下载视频
     video_success = False
     video_path = ""
     
-    if download_options["video"] or download_options["audio"]:
+    if download_options["video"]:
         video_success, video_path = download_and_process_video(video_info, config, download_options, headers)
     
     # 提取音频
     audio_success = False
-    
-    if download_options["audio"] and video_success:
-        audio_path = get_download_path(config, video_info, "audio")
+    audio_format = get_audio_format(config, download_options)
+    
+    if download_options["audio"] and not download_options["video"]:
+        # 只要音频时只下载音频流，不下载视频
+        print("开始下载音频...")
+        audio_success, audio_path = download_audio_only(video_info, config, download_options, headers)
+    elif download_options["audio"] and video_success:
+        # DASH下载时已保存了原始音频流，直接使用它
+        audio_m4a_path = get_download_path(config, video_info, "audio_m4a")
+        audio_source = audio_m4a_path if os.path.exists(audio_m4a_path) else video_path
         
-        print(f"开始提取音频...")
-        audio_success = extract_audio(video_path, audio_path)
+        print("开始提取音频...")
+        audio_success, audio_path = produce_audio(audio_source, video_info, config, audio_format)
     
     # 下载字幕
     subtitle_success = False
     
     if download_options["subtitle"]:
-        print(f"开始下载字幕...")
-        subtitle_success = download_subtitle(video_info, config, headers)
+        print("开始下载字幕...")
+        subtitle_success, _ = download_subtitle(video_info, config, headers)
+    
+    # 下载弹幕
+    danmaku_success = False
+    
+    if download_options.get("danmaku"):
+        print("开始下载弹幕...")
+        danmaku_success, _ = download_danmaku(video_info, config, headers)
     
     # 输出下载结果
     print("\n下载结果:")
@@ -78,14 +98,53 @@ def download_video(bv_id, download_options=None):
         print(f"音频: {'成功' if audio_success else '失败'}")
     if download_options["subtitle"]:
         print(f"字幕: {'成功' if subtitle_success else '失败'}")
+    if download_options.get("danmaku"):
+        print(f"弹幕: {'成功' if danmaku_success else '失败'}")
+    
+    return video_success or audio_success or subtitle_success or danmaku_success
+
+def download_videos(bv_ids, download_options):
+    """批量下载多个视频，字幕在最后统一交给异步浏览器并发抓取"""
+    config = load_config()
+    ensure_folders_exist(config)
+    cookie = config.get("cookie", "")
+    headers = create_headers(cookie)
     
-    return video_success or audio_success or subtitle_success
+    results = {}
+    video_infos = {}  # 下载视频时获取的视频信息，字幕阶段直接复用
+    media_options = dict(download_options, subtitle=False)
+    if media_options["video"] or media_options["audio"] or media_options.get("danmaku"):
+        for bv_id in bv_ids:
+            results[bv_id] = download_video(bv_id, media_options, video_infos)
+    
+    if download_options["subtitle"]:
+        for bv_id in bv_ids:
+            if bv_id in video_infos:
+                continue
+            video_info = get_video_info(bv_id, cookie)
+            if video_info:
+                video_infos[bv_id] = video_info
+            else:
+                print(f"获取视频信息失败: {bv_id}")
+        subtitle_video_infos = [video_infos[bv_id] for bv_id in bv_ids if bv_id in video_infos]
+        print(f"开始批量下载 {len(subtitle_video_infos)} 个视频的字幕...")
+        subtitle_results = download_subtitles(subtitle_video_infos, config, headers)
+        for bv_id, (success, error) in subtitle_results.items():
+            print(f"字幕 {bv_id}: {'成功' if success else f'失败 ({error})'}")
+            results[bv_id] = results.get(bv_id, False) or success
+    
+    print("\n批量下载结果:")
+    for bv_id in bv_ids:
+        print(f"{bv_id}: {'成功' if results.get(bv_id) else '失败'}")
+    return all(results.get(bv_id) for bv_id in bv_ids)
 
 def main():
     parser = argparse.ArgumentParser(description="BILI-EX")
-    parser.add_argument("bvid", nargs="?", help="B站视频的BV号")
+    parser.add_argument("bvid", nargs="*", help="B站视频的BV号，可以一次给出多个")
     parser.add_argument("-a", "--audio", action="store_true", help="仅下载/提取音频")
     parser.add_argument("-s", "--subtitle", action="store_true", help="仅下载字幕")
+    parser.add_argument("-d", "--danmaku", action="store_true", help="同时下载弹幕并转换为ASS字幕")
+    parser.add_argument("--mp3", action="store_true", help="音频输出为MP3 (默认直接保存原始音频流为M4A)")
     parser.add_argument("-c", "--cookie", help="设置Cookie")
     parser.add_argument("--check", action="store_true", help="检查登录状态")
     
@@ -122,7 +181,7 @@ def main():
         sys.exit(0)
     
     # 如果没有提供BV号，则提示输入
-    bv_id = args.bvid
+    bv_id = args.bvid[0] if args.bvid else None
     
     if not bv_id:
         # 显示交互式菜单让用户选择下载内容
@@ -146,11 +205,17 @@ def main():
         download_options = {
             "video": not (args.audio or args.subtitle),  # 如果指定了音频或字幕，则不下载视频
             "audio": args.audio,
-            "subtitle": args.subtitle or not args.audio  # 如果未指定音频，默认下载字幕
+            "subtitle": args.subtitle or not args.audio,  # 如果未指定音频，默认下载字幕
+            "danmaku": args.danmaku
         }
+        if args.mp3:
+            download_options["audio_format"] = "mp3"
         
         # 下载视频
-        download_video(bv_id, download_options)
+        if len(args.bvid) > 1:
+            download_videos(args.bvid, download_options)
+        else:
+            download_video(bv_id, download_options)
 
 if __name__ == "__main__":
     main()
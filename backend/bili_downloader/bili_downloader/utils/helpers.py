@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import re
 
 def sanitize_filename(filename):
@@ -15,6 +16,39 @@ def sanitize_filename(filename):
     sanitized = sanitized.strip(' ._-')
     return sanitized
 
+def available_cpu_count():
+    """返回当前进程实际可用的CPU数量
+    
+    容器中 os.cpu_count() 返回的是宿主机的核数，这里依次考虑cgroup的CPU配额
+    (v2的cpu.max 或 v1的cpu.cfs_quota_us)和进程的CPU亲和性，取其中最小值。
+    """
+    counts = []
+    try:
+        counts.append(len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        counts.append(os.cpu_count() or 1)
+    
+    quota, period = None, None
+    try:
+        # cgroup v2: "max 100000" 或 "200000 100000"
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            quota_text, period_text = f.read().split()[:2]
+        if quota_text != "max":
+            quota, period = int(quota_text), int(period_text)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: quota 为 -1 表示不限制
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
+                quota = int(f.read().strip())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
+                period = int(f.read().strip())
+        except (OSError, ValueError):
+            quota, period = None, None
+    if quota and quota > 0 and period:
+        counts.append(max(1, quota // period))
+    
+    return max(1, min(counts))
+
 def format_time(seconds):
     """将秒转换为SRT时间格式 (HH:MM:SS,mmm)"""
     hours = int(seconds / 3600)
@@ -28,7 +62,7 @@ def show_download_menu():
     """显示下载选项菜单"""
     print("\n请选择下载内容:")
     print("1. 只下载视频")
-    print("2. 只提取音频 (需要先下载视频)")
+    print("2. 只下载音频")
     print("3. 只下载字幕")
     print("4. 下载视频和提取音频")
     print("5. 下载视频和字幕")
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bili_downloader.bili_downloader.config import config_manager  # noqa: E402
+from bili_downloader.bili_downloader.core import http_client  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """每个测试使用临时目录中的配置文件，不读写 /app/backend/config"""
+    monkeypatch.setattr(config_manager, "CONFIG_FILE", str(tmp_path / "config" / "config.json"))
+    http_client.reset_session()
+    yield
+    http_client.reset_session()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+from bili_downloader.bili_downloader.config import config_manager
+from bili_downloader.bili_downloader.core.bif import BifWriter
+
+# app.py 在导入时需要完整的运行环境
+pytest.importorskip("flask_cors")
+pytest.importorskip("openai")
+import app as app_module  # noqa: E402
+
+
+def _jpeg(label):
+    return b'\xff\xd8' + label.encode() * 7 + b'\xff\xd9'
+
+
+@pytest.fixture
+def bif_server(tmp_path):
+    """在 Werkzeug 服务器上运行应用 (与 app.run 相同)，下载目录中放一个BIF文件"""
+    download_dir = tmp_path / "download"
+    config_path = config_manager.CONFIG_FILE
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump({"download_dir": {"base": str(download_dir)}}, f)
+
+    writer = BifWriter(str(download_dir / "标题" / "BV1.bif"), 4)
+    writer.add(0, _jpeg("a"))
+    writer.add(1000, _jpeg("b"))
+    writer.add_duplicate(2000)
+    writer.close()
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = requests.Session()
+    cookie = app_module.app.session_interface.get_signing_serializer(app_module.app).dumps({"authenticated": True})
+    client.cookies.set(app_module.app.config.get("SESSION_COOKIE_NAME", "session"), cookie)
+    yield f"http://127.0.0.1:{server.server_port}", client
+    server.shutdown()
+
+
+def test_bif_frame_served_by_werkzeug(bif_server):
+    base_url, client = bif_server
+    response = client.get(f"{base_url}/api/bif/frame/标题/BV1.bif", params={"t": 2500}, timeout=10)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "image/jpeg"
+    assert response.headers["X-Bif-Timestamp"] == "1000"
+    assert response.content == _jpeg("b")
+
+    # 带上 ETag 的条件请求返回304
+    cached = client.get(f"{base_url}/api/bif/frame/标题/BV1.bif", params={"t": 2500}, timeout=10,
+                        headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+
+
+def test_bif_frames_batch(bif_server):
+    base_url, client = bif_server
+    response = client.get(f"{base_url}/api/bif/frames/标题/BV1.bif", params={"t": "0,1500,2500"}, timeout=10)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["timestamps"] == {"0": 0, "1500": 1, "2500": 1}
+    assert sorted(data["frames"]) == ["0", "1"]
+
+
+def test_downloads_lists_configured_bif_variants(tmp_path):
+    download_dir = tmp_path / "download"
+    config_path = config_manager.CONFIG_FILE
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump({"download_dir": {"base": str(download_dir)}, "bif": {"variants": {"sd": 240, "fhd": 640}}}, f)
+
+    title_dir = download_dir / "标题"
+    title_dir.mkdir(parents=True)
+    for name in ("BV1.mp4", "BV1-SD.bif", "BV1-FHD.bif", "BV1-OLD.bif"):
+        (title_dir / name).write_bytes(b"x")
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["authenticated"] = True
+    files = client.get("/api/downloads").get_json()["videos"][0]["files"]
+
+    assert files["bif_sd"]["name"] == "标题/BV1-SD.bif"
+    assert files["bif_fhd"]["name"] == "标题/BV1-FHD.bif"
+    # 未配置的后缀按普通BIF处理
+    assert "bif_old" not in files
+    assert files["bif"]["name"] == "标题/BV1-OLD.bif"
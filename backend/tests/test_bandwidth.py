@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import pytest
+
+from bili_downloader.bili_downloader.core import bandwidth
+from bili_downloader.bili_downloader.core.bandwidth import _current_limits, _in_window
+
+
+def _minutes(clock):
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+@pytest.mark.parametrize("clock, expected", [
+    ("00:59", False),
+    ("01:00", True),
+    ("06:59", True),
+    ("07:00", False),
+])
+def test_window_within_one_day(clock, expected):
+    assert _in_window("01:00", "07:00", _minutes(clock)) is expected
+
+
+@pytest.mark.parametrize("clock, expected", [
+    ("22:59", False),
+    ("23:00", True),
+    ("23:59", True),
+    ("00:00", True),
+    ("05:59", True),
+    ("06:00", False),
+    ("12:00", False),
+])
+def test_window_wrapping_past_midnight(clock, expected):
+    assert _in_window("23:00", "06:00", _minutes(clock)) is expected
+
+
+class _FixedDatetime(datetime):
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+def test_current_limits_uses_wrapped_schedule(monkeypatch):
+    monkeypatch.setattr(bandwidth, "datetime", _FixedDatetime)
+    monkeypatch.setattr(_FixedDatetime, "current", datetime(2024, 1, 1, 0, 30))
+    settings = {
+        "total_limit": 1000,
+        "per_task_limit": 300,
+        "schedule": [{"start": "23:00", "end": "06:00", "total_limit": 0}]
+    }
+    # 夜间时段取消总上限，单任务上限沿用默认值
+    assert _current_limits(settings) == (0, 300)
+
+    monkeypatch.setattr(_FixedDatetime, "current", datetime(2024, 1, 1, 12, 0))
+    assert _current_limits(settings) == (1000, 300)
+
+
+def test_current_limits_skips_malformed_windows(monkeypatch):
+    monkeypatch.setattr(bandwidth, "datetime", _FixedDatetime)
+    monkeypatch.setattr(_FixedDatetime, "current", datetime(2024, 1, 1, 2, 0))
+    settings = {
+        "total_limit": 500,
+        "schedule": [{"start": "bad"}, {"start": "01:00", "end": "03:00", "total_limit": 100}]
+    }
+    assert _current_limits(settings) == (100, 0)
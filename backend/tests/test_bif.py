@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import struct
+
+import pytest
+
+from bili_downloader.bili_downloader.core.bif import (
+    BIF_MAGIC, DHASH_HEIGHT, DHASH_WIDTH, HEADER_SIZE, INDEX_ENTRY_SIZE, BifReader, BifWriter, DuplicateFilter,
+    dhash, get_bif_reader, iter_dhashes, iter_jpeg_frames
+)
+
+
+def _jpeg(label):
+    """只有SOI/EOI标记的假JPEG，内容中不含 0xFF"""
+    return b'\xff\xd8' + label.encode() * 7 + b'\xff\xd9'
+
+
+def _parse_bif(path):
+    """按BIF格式解析出 [(timestamp_ms, image_bytes)]"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == BIF_MAGIC
+    count, multiplier = struct.unpack_from('<II', data, 12)
+    assert multiplier == 1000
+    entries = [struct.unpack_from('<II', data, HEADER_SIZE + i * INDEX_ENTRY_SIZE) for i in range(count + 1)]
+    assert entries[-1][0] == 0xFFFFFFFF
+    assert entries[-1][1] == len(data)
+    images = []
+    for i in range(count):
+        start = entries[i][1]
+        end = next((offset for _, offset in entries[i + 1:] if offset != start), len(data))
+        images.append((entries[i][0], data[start:end]))
+    return images
+
+
+def _write(path, images, reserved_count):
+    writer = BifWriter(str(path), reserved_count)
+    for timestamp_ms, image in images:
+        writer.add(timestamp_ms, image)
+    writer.close()
+
+
+def test_writer_round_trip(tmp_path):
+    path = tmp_path / "video.bif"
+    images = [(i * 1000, _jpeg(f"frame{i}")) for i in range(5)]
+    _write(path, images, reserved_count=10)
+
+    assert _parse_bif(path) == images
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_writer_shifts_data_when_index_reservation_overflows(tmp_path):
+    path = tmp_path / "video.bif"
+    images = [(i * 1000, _jpeg(f"frame{i}")) for i in range(20)]
+    _write(path, images, reserved_count=3)
+
+    assert _parse_bif(path) == images
+    # 索引表紧接着图片数据，没有多余的空隙
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert struct.unpack_from('<I', data, HEADER_SIZE + 4)[0] == HEADER_SIZE + 21 * INDEX_ENTRY_SIZE
+
+
+def test_writer_set_timestamps_and_duplicates(tmp_path):
+    path = tmp_path / "video.bif"
+    writer = BifWriter(str(path), 4)
+    writer.add(0, _jpeg("a"))
+    writer.add_duplicate(1000)
+    writer.add(2000, _jpeg("b"))
+    writer.set_timestamps([0, 1500, 2500])
+    writer.close()
+
+    assert _parse_bif(path) == [(0, _jpeg("a")), (1500, _jpeg("a")), (2500, _jpeg("b"))]
+
+
+def test_writer_discard_removes_partial_file(tmp_path):
+    path = tmp_path / "video.bif"
+    writer = BifWriter(str(path), 4)
+    writer.add(0, _jpeg("a"))
+    writer.discard()
+
+    assert not os.path.exists(f"{path}.part")
+    assert not os.path.exists(path)
+
+
+def test_iter_jpeg_frames_splits_markers_across_reads():
+    frames = [_jpeg("first"), _jpeg("second"), _jpeg("third")]
+    # 帧之间夹杂无关字节，read_size 很小使标记被拆在两次读取之间
+    stream = io.BytesIO(b'junk' + frames[0] + frames[1] + b'\x00\xff' + frames[2] + b'\xff\xd8tail')
+
+    assert list(iter_jpeg_frames(stream, read_size=3)) == frames
+
+
+def test_iter_jpeg_frames_empty_stream():
+    assert list(iter_jpeg_frames(io.BytesIO(b''))) == []
+
+
+def _gradient(step):
+    """9x8 灰度帧，每行从左到右按 step 递增或递减"""
+    row = bytes(max(0, min(255, 128 + step * x)) for x in range(DHASH_WIDTH))
+    return row * DHASH_HEIGHT
+
+
+def test_dhash_compares_neighbouring_pixels():
+    assert dhash(_gradient(-10)) == (1 << 64) - 1
+    assert dhash(_gradient(10)) == 0
+    assert list(iter_dhashes(io.BytesIO(_gradient(-10) + _gradient(10) + b'\x00' * 5))) == [(1 << 64) - 1, 0]
+
+
+def test_duplicate_filter_stores_near_duplicates_once(tmp_path):
+    path = tmp_path / "video.bif"
+    writer = BifWriter(str(path), 8)
+    duplicate_filter = DuplicateFilter(writer, interval=2, threshold=1)
+    frames = [_jpeg(f"frame{i}") for i in range(4)]
+    # 缩略图和哈希来自两条管道，到达顺序任意
+    duplicate_filter.add_frame(1, frames[1])
+    duplicate_filter.add_hash(0b0000)
+    duplicate_filter.add_frame(0, frames[0])
+    duplicate_filter.add_hash(0b0001)  # 与上一张只差1位，视为重复
+    duplicate_filter.add_hash(0b1111)
+    duplicate_filter.add_frame(2, frames[2])
+    duplicate_filter.add_frame(3, frames[3])  # 没有哈希，finish 时原样写入
+    duplicate_filter.finish()
+    writer.close()
+
+    assert duplicate_filter.duplicates == 1
+    assert _parse_bif(path) == [(0, frames[0]), (2000, frames[0]), (4000, frames[2]), (6000, frames[3])]
+
+
+def test_reader_find_and_image(tmp_path):
+    path = tmp_path / "video.bif"
+    writer = BifWriter(str(path), 3)
+    writer.add(0, _jpeg("a"))
+    writer.add(1000, _jpeg("b"))
+    writer.add_duplicate(2000)
+    writer.add_duplicate(3000)
+    writer.add(4000, _jpeg("c"))
+    writer.close()
+
+    reader = BifReader(str(path))
+    assert len(reader) == 5
+    assert [reader.timestamp_ms(i) for i in range(5)] == [0, 1000, 2000, 3000, 4000]
+    assert reader.find(0) == 0
+    assert reader.find(999) == 0
+    # 重复的缩略图指向同一组的第一张
+    assert reader.find(2500) == 1
+    assert reader.find(3999) == 1
+    assert reader.find(10 ** 6) == 4
+    assert bytes(reader.image(0)) == _jpeg("a")
+    assert bytes(reader.image(1)) == _jpeg("b")
+    assert bytes(reader.image(3)) == _jpeg("b")
+    assert bytes(reader.image(4)) == _jpeg("c")
+
+
+def test_reader_rejects_non_bif_files(tmp_path):
+    path = tmp_path / "video.bif"
+    path.write_bytes(b'\x00' * 128)
+    with pytest.raises(ValueError):
+        BifReader(str(path))
+
+
+def test_get_bif_reader_reopens_changed_files(tmp_path):
+    path = tmp_path / "video.bif"
+    _write(path, [(0, _jpeg("a"))], reserved_count=1)
+    reader = get_bif_reader(str(path))
+    assert get_bif_reader(str(path)) is reader
+
+    _write(path, [(0, _jpeg("a")), (1000, _jpeg("b"))], reserved_count=2)
+    reopened = get_bif_reader(str(path))
+    assert reopened is not reader
+    assert len(reopened) == 2
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from bili_downloader.bili_downloader.core import danmaku
+from bili_downloader.bili_downloader.core.danmaku import (
+    DEFAULT_DANMAKU, PLAY_RES_X, DanmakuLayout, _ass_time, decode_danmaku_elem, download_danmaku,
+    iter_danmaku_elems
+)
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _int_field(field, value):
+    return _varint(field << 3) + _varint(value)
+
+
+def _bytes_field(field, data):
+    return _varint(field << 3 | 2) + _varint(len(data)) + data
+
+
+def _elem(progress, content, mode=1, fontsize=25, color=0xFFFFFF):
+    """按 DanmakuElem 的字段编号手工编码，夹带几个不需要的字段"""
+    return b"".join([
+        _int_field(1, 123456789012),  # id
+        _int_field(2, progress),
+        _int_field(3, mode),
+        _int_field(4, fontsize),
+        _int_field(5, color),
+        _bytes_field(6, b"d41d8cd9"),  # midHash
+        _bytes_field(7, content.encode("utf-8")),
+        _int_field(8, 1700000000),  # ctime
+        _varint(9 << 3 | 1) + b"\x00" * 8,  # fixed64
+        _varint(10 << 3 | 5) + b"\x00" * 4,  # fixed32
+    ])
+
+
+def _segment(elems):
+    """DmSegMobileReply：字段1重复的 DanmakuElem，另加一个顶层的无关字段"""
+    return _int_field(2, 1) + b"".join(_bytes_field(1, elem) for elem in elems)
+
+
+def test_decode_danmaku_elem():
+    elem = decode_danmaku_elem(_elem(61500, "前方高能", mode=5, fontsize=18, color=0xFF0000))
+    assert elem == {"progress": 61500, "mode": 5, "fontsize": 18, "color": 0xFF0000, "content": "前方高能"}
+
+
+def test_decode_danmaku_elem_defaults():
+    assert decode_danmaku_elem(_bytes_field(7, "hi".encode())) == {
+        "progress": 0, "mode": 1, "fontsize": 25, "color": 0xFFFFFF, "content": "hi"
+    }
+
+
+def test_iter_danmaku_elems_across_small_chunks():
+    data = _segment([_elem(1000, "第一条"), _elem(2000, "second"), _elem(300, "third")])
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    assert [elem["content"] for elem in iter_danmaku_elems(chunks)] == ["第一条", "second", "third"]
+
+
+def test_iter_danmaku_elems_rejects_truncated_data():
+    data = _segment([_elem(1000, "第一条")])
+    with pytest.raises(ValueError):
+        list(iter_danmaku_elems([data[:-2]]))
+
+
+def test_ass_time():
+    assert _ass_time(0) == "0:00:00.00"
+    assert _ass_time(3723.456) == "1:02:03.46"
+
+
+def _layout():
+    return DanmakuLayout(dict(DEFAULT_DANMAKU))
+
+
+def test_layout_puts_simultaneous_scroll_danmaku_on_different_lanes():
+    layout = _layout()
+    first = layout.dialogue({"progress": 1000, "mode": 1, "fontsize": 25, "color": 0xFFFFFF, "content": "aaaa"})
+    second = layout.dialogue({"progress": 1000, "mode": 1, "fontsize": 25, "color": 0xFFFFFF, "content": "bbbb"})
+    assert first.startswith("Dialogue: 2,0:00:01.00,0:00:09.00,Danmaku,")
+    assert f"\\move({PLAY_RES_X},0," in first
+    assert f"\\move({PLAY_RES_X},{layout.lane_height}," in second
+
+
+def test_layout_reuses_lane_once_it_is_free():
+    layout = _layout()
+    layout.dialogue({"progress": 0, "mode": 1, "fontsize": 25, "color": 0xFFFFFF, "content": "aaaa"})
+    later = layout.dialogue({"progress": 20000, "mode": 1, "fontsize": 25, "color": 0xFFFFFF, "content": "bbbb"})
+    assert f"\\move({PLAY_RES_X},0," in later
+
+
+def test_layout_fixed_modes_colour_and_escaping():
+    layout = _layout()
+    top = layout.dialogue({"progress": 0, "mode": 5, "fontsize": 25, "color": 0x00FF80, "content": "{top}"})
+    bottom = layout.dialogue({"progress": 0, "mode": 4, "fontsize": 36, "color": 0xFFFFFF, "content": "a\nb"})
+    assert "\\an8\\pos(960,0)" in top
+    assert "\\c&H80FF00&" in top
+    assert top.endswith("\\{top\\}\n")
+    assert "\\an2\\pos(960,1080)" in bottom
+    assert "\\fs72" in bottom
+    assert bottom.endswith("a\\Nb\n")
+
+
+def test_layout_skips_advanced_danmaku():
+    assert _layout().dialogue({"progress": 0, "mode": 7, "fontsize": 25, "color": 0, "content": "[]"}) is None
+
+
+class _SegmentResponse:
+    headers = {"content-type": "application/octet-stream"}
+
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.data), 7):
+            yield self.data[i:i + 7]
+
+    def close(self):
+        pass
+
+
+def test_download_danmaku_writes_segments_in_order(tmp_path, monkeypatch):
+    segments = {
+        1: _segment([_elem(5000, "b"), _elem(1000, "a"), _elem(2000, "高级", mode=7)]),
+        2: _segment([_elem(361000, "c")]),
+        3: _segment([_elem(725000, "d")]),
+    }
+
+    def fake_get(url, headers=None, **kwargs):
+        index = int(url.rsplit("segment_index=", 1)[1])
+        return _SegmentResponse(segments[index])
+
+    ass_path = tmp_path / "BV1.danmaku.ass"
+    monkeypatch.setattr(danmaku, "bili_api_get", fake_get)
+    monkeypatch.setattr(danmaku, "get_download_path", lambda config, video_info, media_type: str(ass_path))
+
+    video_info = {"bv_id": "BV1", "cid": 1, "title": "标题", "duration": 800}
+    assert download_danmaku(video_info, {"danmaku": {"segment_workers": 2}}, {}) == (True, None)
+
+    text = ass_path.read_text(encoding="utf-8-sig")
+    assert "Title: 标题" in text
+    contents = [line.rsplit("}", 1)[1] for line in text.splitlines() if line.startswith("Dialogue:")]
+    assert contents == ["a", "b", "c", "d"]
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bili_downloader.bili_downloader.core import downloader
+from bili_downloader.bili_downloader.core.downloader import _DownloadJournal, _plan_ranges, download_file
+
+PAYLOAD = os.urandom(512 * 1024)
+SEGMENT_SIZE = 64 * 1024
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """支持 Range/If-Range 的本地文件服务，truncate 为真时每个分段只发送一半数据就断开"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append({"range": self.headers.get("Range"), "if_range": self.headers.get("If-Range")})
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if not range_header or (if_range is not None and if_range != server.etag):
+            self._send(200, server.payload, {})
+            return
+        start, end = range_header.split("=", 1)[1].split("-")
+        start = int(start)
+        end = int(end) if end else len(server.payload) - 1
+        body = server.payload[start:end + 1]
+        headers = {"Content-Range": f"bytes {start}-{end}/{len(server.payload)}"}
+        if server.truncate and len(body) > 1:
+            self._send(206, body, headers, send=len(body) // 2)
+            return
+        self._send(206, body, headers)
+
+    def _send(self, status, body, headers, send=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.server.etag)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body if send is None else body[:send])
+        if send is not None:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def range_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    server.daemon_threads = True
+    server.payload = PAYLOAD
+    server.etag = '"v1"'
+    server.truncate = False
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/video.m4s"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _download(server, file_path):
+    # 同一地址作为两个镜像，分段失败时切换镜像而不是等待重试
+    return download_file([server.url, server.url], str(file_path), segments=4, min_segment_size=SEGMENT_SIZE)
+
+
+def test_plan_ranges_splits_largest_range_until_segment_count():
+    assert _plan_ranges([[0, 400]], 4, 100) == [[0, 100], [100, 200], [200, 300], [300, 400]]
+
+
+def test_plan_ranges_keeps_min_segment_size():
+    assert _plan_ranges([[0, 300]], 8, 100) == [[0, 150], [150, 300]]
+    assert _plan_ranges([[0, 150]], 4, 100) == [[0, 150]]
+
+
+def test_plan_ranges_only_covers_missing_ranges():
+    ranges = _plan_ranges([[0, 100], [500, 1000]], 3, 100)
+    assert ranges == [[0, 100], [500, 750], [750, 1000]]
+
+
+def test_journal_merges_ranges_and_reports_missing(tmp_path):
+    journal = _DownloadJournal(str(tmp_path / "a.part.json"), 100)
+    journal.add(10, 20)
+    journal.add(20, 30)
+    journal.add(50, 60)
+    assert journal.completed == [[10, 30], [50, 60]]
+    assert journal.missing_ranges() == [[0, 10], [30, 50], [60, 100]]
+    assert journal.completed_size() == 30
+
+
+def test_journal_load_rejects_changed_remote(tmp_path):
+    journal_path = str(tmp_path / "a.part.json")
+    _DownloadJournal(journal_path, 100, etag='"v1"', completed=[[0, 40]]).save()
+
+    loaded = _DownloadJournal.load(journal_path, {"total_size": 100, "etag": '"v1"'})
+    assert loaded.completed == [[0, 40]]
+    assert _DownloadJournal.load(journal_path, {"total_size": 100, "etag": '"v2"'}) is None
+    assert _DownloadJournal.load(journal_path, {"total_size": 101, "etag": '"v1"'}) is None
+
+
+def test_resume_after_partial_write(range_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_MAX_RETRIES", 1)
+    # 读取粒度小于被截断的长度，断线前已读到的数据才会写入文件
+    monkeypatch.setattr(downloader, "RANGE_READ_SIZE", 16 * 1024)
+    part_path = tmp_path / "video.mp4.part"
+
+    range_server.truncate = True
+    assert _download(range_server, part_path) is False
+    # 不完整的文件和日志都保留，日志中只记录已落盘的区间
+    with open(f"{part_path}.json", encoding="utf-8") as f:
+        state = json.load(f)
+    completed = state["completed"]
+    assert completed and sum(end - start for start, end in completed) < len(PAYLOAD)
+    data = part_path.read_bytes()
+    for start, end in completed:
+        assert data[start:end] == PAYLOAD[start:end]
+
+    range_server.truncate = False
+    range_server.requests.clear()
+    assert _download(range_server, part_path) is True
+    assert part_path.read_bytes() == PAYLOAD
+    assert not os.path.exists(f"{part_path}.json")
+
+    # 续传时只请求缺失的区间，并带上 If-Range 校验远程文件未变化
+    resumed = [request for request in range_server.requests if request["range"] != "bytes=0-0"]
+    starts = [int(request["range"].split("=")[1].split("-")[0]) for request in resumed]
+    assert all(not any(start <= position < end for start, end in completed) for position in starts)
+    assert all(request["if_range"] == '"v1"' for request in resumed)
+
+
+def test_changed_remote_restarts_from_scratch(range_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_MAX_RETRIES", 1)
+    part_path = tmp_path / "video.mp4.part"
+
+    range_server.truncate = True
+    assert _download(range_server, part_path) is False
+
+    # 远程文件换了版本，旧日志失效，从头下载新内容
+    range_server.payload = bytes(reversed(PAYLOAD))
+    range_server.etag = '"v2"'
+    range_server.truncate = False
+    assert _download(range_server, part_path) is True
+    assert part_path.read_bytes() == range_server.payload
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from bili_downloader.bili_downloader.core import rate_limiter
+from bili_downloader.bili_downloader.core.rate_limiter import (
+    DEFAULT_RATE_LIMIT, _AdaptiveTokenBucket, bili_api_get, family_for_url, get_limiter
+)
+
+
+class _Response:
+    def __init__(self, status_code=200, data=None):
+        self.status_code = status_code
+        self.headers = {"content-type": "application/json"}
+        self._data = data if data is not None else {"code": 0}
+
+    def json(self):
+        return self._data
+
+
+class _Session:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, headers=None, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_buckets", {})
+    # 调高速率，风控降速后的排队等待可以忽略
+    monkeypatch.setattr(rate_limiter, "_load_settings", lambda family: dict(DEFAULT_RATE_LIMIT, max_rate=1000.0, min_rate=100.0))
+    # 退避时长取0，测试不真正等待
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: 0)
+
+
+def _bucket(**overrides):
+    return _AdaptiveTokenBucket("test", dict(DEFAULT_RATE_LIMIT, **overrides))
+
+
+def test_throttle_decreases_multiplicatively_down_to_min_rate():
+    bucket = _bucket(max_rate=4.0, min_rate=0.5, decrease_factor=0.5)
+    assert bucket.on_throttle() == 2.0
+    assert bucket.on_throttle() == 1.0
+    assert bucket.on_throttle() == 0.5
+    assert bucket.on_throttle() == 0.5
+    assert bucket.stats()["throttle_events"] == 4
+
+
+def test_success_recovers_additively_up_to_max_rate():
+    bucket = _bucket(max_rate=1.0, min_rate=0.2, decrease_factor=0.5, recovery_step=0.1)
+    bucket.on_throttle()
+    for _ in range(3):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(0.8)
+    for _ in range(10):
+        bucket.on_success()
+    assert bucket.rate == 1.0
+
+
+def test_throttle_drops_burst_tokens():
+    bucket = _bucket(burst=4)
+    bucket.on_throttle()
+    assert bucket.tokens <= 0
+
+
+def test_family_for_url():
+    assert family_for_url("https://api.bilibili.com/x/player/wbi/playurl?bvid=BV1") == "playurl"
+    assert family_for_url("https://api.bilibili.com/x/player/wbi/v2?cid=1") == "player"
+    assert family_for_url("https://api.bilibili.com/x/v2/dm/web/seg.so?oid=1") == "danmaku"
+    assert family_for_url("https://api.bilibili.com/x/unknown") == "api"
+
+
+def test_bili_api_get_retries_risk_control_and_lowers_rate(monkeypatch):
+    session = _Session([_Response(data={"code": -412}), _Response(412), _Response(data={"code": 0, "data": {}})])
+    monkeypatch.setattr(rate_limiter, "get_session", lambda: session)
+
+    response = bili_api_get("https://api.bilibili.com/x/web-interface/view?bvid=BV1")
+    assert response.json()["code"] == 0
+    assert session.calls == 3
+    stats = get_limiter("view").stats()
+    assert stats["throttle_events"] == 2
+    assert stats["current_rate"] < stats["max_rate"]
+
+
+def test_bili_api_get_returns_last_response_when_retries_run_out(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_load_settings", lambda family: dict(DEFAULT_RATE_LIMIT, max_rate=1000.0, max_retries=1))
+    session = _Session([_Response(data={"code": -799}), _Response(data={"code": -799})])
+    monkeypatch.setattr(rate_limiter, "get_session", lambda: session)
+
+    response = bili_api_get("https://api.bilibili.com/x/web-interface/nav")
+    assert response.json()["code"] == -799
+    assert session.calls == 2
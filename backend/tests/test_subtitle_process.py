@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from bili_downloader.bili_downloader.core.subtitle_process import _descendants, kill_process_tree
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc"), reason="需要 /proc 读取进程树")
+
+# 父进程再启动一个孙进程，模拟 Playwright 启动的浏览器
+SPAWN_TREE = (
+    "import subprocess, sys, time\n"
+    "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+    "print(child.pid, flush=True)\n"
+    "time.sleep(60)\n"
+)
+
+
+def _alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # 已退出但尚未被回收的进程状态为 Z
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+@pytest.fixture
+def process_tree():
+    process = subprocess.Popen([sys.executable, "-c", SPAWN_TREE], stdout=subprocess.PIPE,
+                               encoding="utf-8", start_new_session=True)
+    child_pid = int(process.stdout.readline())
+    yield process, child_pid
+    if process.poll() is None:
+        kill_process_tree(process)
+    process.stdout.close()
+
+
+def test_descendants_finds_grandchildren(process_tree):
+    process, child_pid = process_tree
+    assert child_pid in _descendants(process.pid)
+    assert _descendants(child_pid) == []
+    assert process.pid in _descendants(os.getpid())
+
+
+def test_kill_process_tree_kills_every_descendant(process_tree):
+    process, child_pid = process_tree
+    kill_process_tree(process)
+
+    assert process.returncode is not None
+    deadline = time.monotonic() + 5
+    while _alive(child_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _alive(child_pid)
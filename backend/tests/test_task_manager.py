@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from bili_downloader.bili_downloader.core import task_manager
+
+
+@pytest.fixture(autouse=True)
+def tasks_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(task_manager, "TASKS_FILE", str(tmp_path / "config" / "tasks.json"))
+
+
+def test_update_task_merges_resource_status():
+    task_manager.add_task("t1", {"overall_status": "排队中", "resource_status": {"video": "排队中"}})
+    task_manager.update_task("t1", {"resource_status": {"audio": "完成"}, "overall_status": "处理中"})
+
+    task = task_manager.get_task("t1")
+    assert task["resource_status"] == {"video": "排队中", "audio": "完成"}
+    assert task["overall_status"] == "处理中"
+
+
+def test_concurrent_updates_are_not_lost():
+    task_manager.add_task("t1", {"resource_status": {}, "processing": {}})
+    resources = [f"resource{i}" for i in range(8)]
+
+    def update_resource(name):
+        for step in range(10):
+            task_manager.update_task("t1", {"resource_status": {name: step}})
+
+    def publish_bandwidth():
+        # 与下载线程按间隔写入速率状态的方式相同
+        for step in range(40):
+            task_manager.update_task("t1", {"bandwidth": {"current_rate": step}})
+
+    threads = [threading.Thread(target=update_resource, args=(name,)) for name in resources]
+    threads.append(threading.Thread(target=publish_bandwidth))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    task = task_manager.get_task("t1")
+    assert task["resource_status"] == {name: 9 for name in resources}
+    assert task["bandwidth"] == {"current_rate": 39}
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from bili_downloader.bili_downloader.core import wbi
+from bili_downloader.bili_downloader.core.wbi import get_mixin_key, sign_params
+
+# bilibili-API-collect 文档中的 WBI 签名示例
+IMG_URL = "https://i0.hdslb.com/bfs/wbi/7cd084941338484aae1ad9425b84077c.png"
+SUB_URL = "https://i0.hdslb.com/bfs/wbi/4932caff0ff746eab6f01bf08b70ac45.png"
+MIXIN_KEY = "ea1db124af3c7062474693fa704f4ff8"
+WTS = 1702204169
+
+
+class _NavResponse:
+    def __init__(self, wbi_img):
+        self.wbi_img = wbi_img
+
+    def json(self):
+        return {"code": -101, "data": {"wbi_img": self.wbi_img}}
+
+
+@pytest.fixture
+def nav(monkeypatch):
+    calls = []
+
+    def fake_get(url, headers=None, **kwargs):
+        calls.append(url)
+        return _NavResponse({"img_url": IMG_URL, "sub_url": SUB_URL})
+
+    monkeypatch.setattr(wbi, "bili_api_get", fake_get)
+    monkeypatch.setattr(wbi, "_mixin_key", None)
+    monkeypatch.setattr(wbi, "_mixin_key_time", 0.0)
+    monkeypatch.setattr(wbi.time, "time", lambda: WTS)
+    return calls
+
+
+def test_mixin_key_from_nav(nav):
+    assert get_mixin_key() == MIXIN_KEY
+    # 缓存期内不再请求 nav 接口
+    assert get_mixin_key() == MIXIN_KEY
+    assert len(nav) == 1
+
+
+def test_sign_params_known_vector(nav):
+    signed = sign_params({"foo": "114", "bar": "514", "zab": 1919810})
+    assert signed == {
+        "bar": "514",
+        "foo": "114",
+        "wts": str(WTS),
+        "zab": "1919810",
+        "w_rid": "8f6f2b5b3d485fe1886cec6a0be8c5d4"
+    }
+
+
+def test_sign_params_filters_reserved_characters(nav):
+    signed = sign_params({"keyword": "a!b'c(d)e*f"})
+    assert signed["keyword"] == "abcdef"
+
+
+def test_sign_params_without_key_only_adds_wts(monkeypatch):
+    monkeypatch.setattr(wbi, "get_mixin_key", lambda headers=None: None)
+    signed = sign_params({"bvid": "BV1xx411c7mD"})
+    assert "w_rid" not in signed
+    assert signed["bvid"] == "BV1xx411c7mD"
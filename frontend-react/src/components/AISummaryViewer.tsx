@@ -4,112 +4,15 @@ import './SubtitleViewer.css'; // 复用CSS样式
 import './AISummaryViewer.css'; // <-- 引入新的 CSS 文件 (后面创建)
 import ReactMarkdown from 'react-markdown';
 
-// --- BIF 解析器 (来自 https://gist.github.com/pkulak/61de475a74d824a9d875) ---
-interface BifImage {
-  seconds: number;
-  bytes: ArrayBuffer;
+// --- BIF 缩略图批量查询 (后端按时间戳查找，避免下载整个BIF文件) ---
+interface BifFramesResponse {
+  success: boolean;
+  timestamps: Record<string, number>; // 时间戳(毫秒) -> 图片索引
+  frames: Record<string, { timestamp: number; data: string }>; // 图片索引 -> base64 JPEG
 }
 
-const sliceToLong = (data: Uint8Array, start: number, end: number): number => {
-  let value = 0;
-  for (let i = end - 1; i >= start; i--) {
-    value = (value * 256) + data[i];
-  }
-  return value;
-};
-
-const parseBif = (buffer: ArrayBuffer): BifImage[] | false => {
-  const data = new Uint8Array(buffer);
-  const magicNumber = [0x89, 0x42, 0x49, 0x46, 0x0d, 0x0a, 0x1a, 0x0a];
-
-  for (let i = 0; i < magicNumber.length; i++) {
-    if (data[i] !== magicNumber[i]) {
-      console.error("Invalid BIF magic number");
-      return false;
-    }
-  }
-
-  const version = sliceToLong(data, 8, 12);
-  if (version !== 0) {
-    console.error("Unsupported BIF version:", version);
-    return false;
-  }
-
-  const imageCount = sliceToLong(data, 12, 16);
-  // Note: Gist uses separation at 16, but Roku spec says image count is at 12
-  // and multiplier at 16. Let's follow the spec.
-  const separation = sliceToLong(data, 16, 20); // Timestamp multiplier (ms)
-  const timestampMultiplier = separation === 0 ? 1000 : separation;
-
-  interface BifRef { timestamp: number; start: number; end?: number }
-  const refs: BifRef[] = [];
-  let lastRef: BifRef | null = null;
-  const indexStart = 64;
-
-  for (let i = indexStart; i < buffer.byteLength; i += 8) {
-    // --- 添加详细日志 ---
-    const ts = sliceToLong(data, i, i + 4);
-    const offset = sliceToLong(data, i + 4, i + 8);
-    console.log(`[parseBif] Read index at ${i}: timestamp=${ts}, offset=${offset}`);
-    // ---------------------
-
-    if (ts === 0xFFFFFFFF) {
-      if (lastRef) lastRef.end = offset;
-      break; // End of index table
-    }
-    
-    // Basic check for valid offset
-    if (offset >= buffer.byteLength) {
-        console.error(`Invalid offset ${offset} at index ${i}`);
-        // Potentially break or try to recover, for now return false
-        return false;
-    }
-
-    const ref: BifRef = { timestamp: ts, start: offset };
-    if (lastRef) {
-      lastRef.end = offset; // End of previous image is start of this one
-    }
-    refs.push(ref);
-    lastRef = ref;
-    
-    // Check if index table goes beyond data bounds, accounting for the last entry
-    if (i + 8 >= offset && ts !== 0xFFFFFFFF) { 
-       console.warn(`Index table entry at ${i} potentially overlaps with image data starting at ${offset}`);
-       // Heuristic: If the next potential index overlaps where the first image *should* be,
-       // assume the index table ended. This handles BIFs where the 0xFFFFFFFF marker isn't present.
-       if (refs.length > 0 && i + 8 >= refs[0].start) {
-           console.warn("Index table seems to overlap image data, stopping index read.");
-           if (lastRef) lastRef.end = buffer.byteLength; // Assume last image goes to EOF
-           break; 
-       }
-    }
-  }
-  
-  // If the loop finished without the FFFFFFFF marker and lastRef exists, set end
-  if (lastRef && lastRef.end === undefined) {
-       lastRef.end = buffer.byteLength; 
-       console.warn("BIF index did not end with 0xFFFFFFFF marker, assuming last image extends to EOF.");
-  }
-
-  const images: BifImage[] = [];
-  for (let i = 0; i < refs.length; i++) {
-    const ref = refs[i];
-    if (ref.end === undefined || ref.end <= ref.start) {
-        console.warn(`Skipping image ${i} due to invalid end offset: start=${ref.start}, end=${ref.end}`);
-        continue;
-    }
-    images.push({
-      seconds: (ref.timestamp * timestampMultiplier) / 1000,
-      bytes: buffer.slice(ref.start, ref.end)
-    });
-  }
-
-  if (images.length !== imageCount) {
-      console.warn(`Expected ${imageCount} images based on header, but parsed ${images.length}`);
-  }
-
-  return images;
-};
+const BIF_PREVIEW_WINDOW_MS = 10000; // 关键点前后各取10秒
+const BIF_PREVIEW_STEP_MS = 1000;
 // --------------------------
 
 interface AISummaryViewerProps {
@@ -255,42 +158,56 @@ const AISummaryViewer: React.FC<AISummaryViewerProps> = ({
     if (show && bifPath && summaryData) { // 确保 summaryData 也已加载
       cleanup(); // 先清理旧状态
       setIsBifLoading(true);
-      console.log("[AISummaryViewer] Fetching BIF:", bifPath);
+      console.log("[AISummaryViewer] Fetching BIF frames:", bifPath);
+
+      // 每个关键点前后10秒按1秒取样，由后端按时间戳查找缩略图，同一张图片只返回一次
+      const pointSamples = summaryData.key_points.map(point => {
+        const targetTimestampMs = parseTimestamp(point.timestamp);
+        const samples: number[] = [];
+        for (let t = Math.max(0, targetTimestampMs - BIF_PREVIEW_WINDOW_MS); t <= targetTimestampMs + BIF_PREVIEW_WINDOW_MS; t += BIF_PREVIEW_STEP_MS) {
+          samples.push(t);
+        }
+        return samples;
+      });
+      const allSamples = Array.from(new Set(([] as number[]).concat(...pointSamples)));
 
-      fetch(`/api/download/bif/${encodeURIComponent(bifPath)}`)
+      fetch(`/api/bif/frames/${encodeURIComponent(bifPath)}?t=${allSamples.join(',')}`)
         .then(response => {
-          if (!response.ok) throw new Error(`Failed to download BIF (${response.status})`);
-          return response.arrayBuffer();
+          if (!response.ok) throw new Error(`Failed to load BIF frames (${response.status})`);
+          return response.json() as Promise<BifFramesResponse>;
         })
-        .then(buffer => {
-          console.log("[AISummaryViewer] BIF file downloaded, parsing...");
-          const parsedImages = parseBif(buffer);
-          if (parsedImages === false) throw new Error("Failed to parse BIF file");
-          console.log(`[AISummaryViewer] Parsed ${parsedImages.length} BIF images.`);
+        .then(result => {
+          if (!result.success) throw new Error("Failed to load BIF frames");
 
-          // 创建 Object URLs 并存储数据
+          // 创建 Object URLs，每张图片只创建一次
           const newObjectUrls: string[] = [];
-          const loadedBifData = parsedImages.map(img => {
-            const blob = new Blob([img.bytes], { type: 'image/jpeg' });
-            const url = URL.createObjectURL(blob);
+          const frameUrls: Record<string, string> = {};
+          Object.entries(result.frames).forEach(([frameIndex, frame]) => {
+            const binary = atob(frame.data);
+            const bytes = new Uint8Array(binary.length);
+            for (let i = 0; i < binary.length; i++) {
+              bytes[i] = binary.charCodeAt(i);
+            }
+            const url = URL.createObjectURL(new Blob([bytes], { type: 'image/jpeg' }));
             newObjectUrls.push(url);
-            return { timestamp: img.seconds, url: url }; // 使用解析出的毫秒时间戳
+            frameUrls[frameIndex] = url;
           });
           objectUrlsRef.current = newObjectUrls; // 更新 Ref
-          // setBifData(loadedBifData); // 不再需要设置状态
+          console.log(`[AISummaryViewer] Loaded ${newObjectUrls.length} BIF frames.`);
 
           // 为每个关键点计算预览帧并启动 Interval
           const previews: Record<number, { images: string[], currentIndex: number }> = {};
           const newIntervalIds: Record<number, number | null> = {};
 
-          summaryData.key_points.forEach((point, index) => {
-            const targetTimestampMs = parseTimestamp(point.timestamp);
-            const startTimeMs = Math.max(0, targetTimestampMs - 10000);
-            const endTimeMs = targetTimestampMs + 10000;
-
-            const imagesToShow = loadedBifData
-              .filter(img => img.timestamp >= startTimeMs && img.timestamp <= endTimeMs)
-              .map(img => img.url);
+          pointSamples.forEach((samples, index) => {
+            // 相邻取样落在同一张图片上时只保留一次
+            const imagesToShow: string[] = [];
+            samples.forEach(t => {
+              const url = frameUrls[String(result.timestamps[String(t)])];
+              if (url && imagesToShow[imagesToShow.length - 1] !== url) {
+                imagesToShow.push(url);
+              }
+            });
 
             if (imagesToShow.length > 0) {
               previews[index] = { images: imagesToShow, currentIndex: 0 };
@@ -326,7 +243,7 @@ const AISummaryViewer: React.FC<AISummaryViewerProps> = ({
 
         })
         .catch(err => {
-          console.error("[AISummaryViewer] Error loading/parsing BIF:", err);
+          console.error("[AISummaryViewer] Error loading BIF frames:", err);
           cleanup(); // 出错时也清理
           // setBifData(null); // 不再需要
         })
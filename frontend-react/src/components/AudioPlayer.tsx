@@ -76,7 +76,7 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({
             style={{ display: loading ? 'none' : 'block' }}
             autoPlay
           >
-            <source src={audioSrc} type="audio/mpeg" />
+            <source src={audioSrc} type={audioSrc.endsWith('.m4a') ? 'audio/mp4' : 'audio/mpeg'} />
             您的浏览器不支持音频播放。
           </audio>
           
@@ -10,6 +10,7 @@ const DownloadPage: React.FC = () => {
     video: true,
     audio: true,
     subtitle: true,
+    danmaku: false,
     ai_summary: true
   });
   const [isLoading, setIsLoading] = useState(false);
@@ -158,7 +159,7 @@ const DownloadPage: React.FC = () => {
       return;
     }
 
-    if (!options.video && !options.audio && !options.subtitle) {
+    if (!options.video && !options.audio && !options.subtitle && !options.danmaku) {
       toast.error('请至少选择一个下载选项');
       setIsLoading(false);
       return;
@@ -248,6 +249,22 @@ const DownloadPage: React.FC = () => {
               disabled={isLoading || isValidating}
             />
           </Col>
+          <Col xs={12} sm={6} md={3}>
+            <FormCheck 
+              className="bili-option-check"
+              type="checkbox" 
+              id="option-danmaku" 
+              label={
+                <span className="d-flex align-items-center">
+                  <i className="bi bi-chat-dots me-2 option-icon"></i>
+                  弹幕
+                </span>
+              }
+              checked={options.danmaku}
+              onChange={handleOptionChange}
+              disabled={isLoading || isValidating}
+            />
+          </Col>
           <Col xs={12} sm={6} md={3}>
             <FormCheck 
               className="bili-option-check"
@@ -15,7 +15,9 @@ import type { DownloadedVideo, RunningTask } from '../services/api';
 const formatDuration = (s: number | undefined) => s ? new Date(s * 1000).toISOString().substr(14, 5) : '--:--';
 const formatCount = (c: number | undefined) => c ? (c > 10000 ? `${(c/10000).toFixed(1)}万` : c.toString()) : '-';
 const getResourceIcon = (t: string) => ({ video: 'bi-film', audio: 'bi-music-note-beamed', subtitle: 'bi-file-text', ai_summary: 'bi-robot' }[t] || 'bi-file');
-const getResourceName = (t: string) => ({ video: '视频', audio: '音频', subtitle: '字幕', ai_summary: 'AI总结' }[t] || '文件');
+const getResourceName = (t: string) => ({ video: '视频', audio: '音频', subtitle: '字幕', danmaku: '弹幕', ai_summary: 'AI总结' }[t] || '文件');
+// 音频默认直接保存原始音频流(m4a)，只有要求MP3时才会转换
+const getAudioExt = (task: RunningTask) => task.download_options?.audio_format === 'mp3' ? 'mp3' : 'm4a';
 
 // Placeholder download function
 const downloadFile = (type: string, filename: string) => {
@@ -424,7 +426,7 @@ const FilesPage: React.FC = () => {
     if (type === 'task') {
       const task = resourceData as RunningTask;
       if (task.info?.title && task.info?.bv_id) {
-        audioPath = `${task.info.title}/${task.info.bv_id}.mp3`;
+        audioPath = `${task.info.title}/${task.info.bv_id}.${getAudioExt(task)}`;
       }
     } else {
       const video = resourceData as DownloadedVideo;
@@ -604,7 +606,7 @@ const FilesPage: React.FC = () => {
 
         // 文件名构建
         const baseFilename = (task.info?.title && task.info?.bv_id) ? `${task.info.title}/${task.info.bv_id}` : null;
-        const fileExt = resourceType === 'video' ? 'mp4' : (resourceType === 'audio' ? 'mp3' : 'srt');
+        const fileExt = resourceType === 'video' ? 'mp4' : (resourceType === 'audio' ? getAudioExt(task) : 'srt');
         const fullFilename = baseFilename ? `${baseFilename}.${fileExt}` : null;
         
         // AI总结按钮特殊处理
@@ -130,6 +130,7 @@ export interface DownloadedVideo {
     video?: FileInfo;
     audio?: FileInfo;
     subtitle?: FileInfo;
+    danmaku?: FileInfo;
     poster?: FileInfo;
     bif?: FileInfo;
   };
@@ -158,6 +159,7 @@ export interface TaskInfo {
 export interface RunningTask {
   task_id: string;
   info: TaskInfo;
+  download_options?: { audio_format?: string; [key: string]: any };
   overall_status: string;
   resource_status: { [key: string]: string };
   timestamp: number;
@@ -299,7 +301,7 @@ const api = {
   setAIConfig,
 
   // Downloads & Tasks
-  createDownload: (bv_id: string, options: { video: boolean; audio: boolean; subtitle: boolean }): Promise<CreateDownloadResponse> => {
+  createDownload: (bv_id: string, options: { video: boolean; audio: boolean; subtitle: boolean; danmaku?: boolean }): Promise<CreateDownloadResponse> => {
     return fetchApi<CreateDownloadResponse>('/api/download', {
         method: 'POST',
         body: JSON.stringify({ bv_id, options }),